@@ -29,3 +29,11 @@ rm -rf lib/python3.*/site-packages/setuptools*
 rm -f lib/python3.*/site-packages/distutils-precedence.pth
 rm -f pyvenv.cfg
 find lib/python3.* -name '*.pyc' -type f | xargs rm
+
+echo "Installing Kobra components..."
+cp /build/4-apps/40-moonraker/kobra.py /build/4-apps/40-moonraker/mmu_ace.py /build/4-apps/40-moonraker/rinkhals_env.py moonraker/moonraker/components/
+
+echo "Precompiling bytecode..."
+# Hash based, so the bytecode stays valid whatever the file times once installed
+# Some packages ship files for other Python versions, failures are expected
+python -m compileall -q -j 0 --invalidation-mode checked-hash moonraker/moonraker lib > /dev/null 2>&1 || true
@@ -3,7 +3,7 @@ import re
 import os
 
 
-def readSections(path, hintPath = None):
+def readSections(path, hintPath = None, inputs = None):
 
     if os.path.isabs(path):
         pass
@@ -12,8 +12,13 @@ def readSections(path, hintPath = None):
     elif os.path.isfile(correctedPath := os.path.abspath(path)):
         path = correctedPath
 
+    # Missing files are inputs too, the output changes once they are created
+    if inputs is not None:
+        inputs.append(path if os.path.isabs(path) or not hintPath else os.path.join(hintPath, path))
+
     if not os.path.isfile(path):
-        print(f'Could not find file "{path}", skipping contnet...')
+        if inputs is None:
+            print(f'Could not find file "{path}", skipping contnet...')
         return []
 
     with open(path, 'r') as f:
@@ -26,7 +31,7 @@ def readSections(path, hintPath = None):
         sectionName = sections[i][0]
         if sectionName.startswith('include '):
             includePath = sectionName[8:].strip()
-            includeSections = readSections(includePath, os.path.dirname(path))
+            includeSections = readSections(includePath, os.path.dirname(path), inputs)
             sections = sections[:i] + includeSections + sections[i + 1:]
             i -= 1
         i += 1
@@ -37,14 +42,22 @@ def readSections(path, hintPath = None):
 def main():
     args = sys.argv
 
-    sourceConfigFiles = args[1:]
+    # With --inputs, only list the files the configuration is made of, includes resolved
+    listInputs = len(args) > 1 and args[1] == '--inputs'
+    sourceConfigFiles = args[2:] if listInputs else args[1:]
 
     # Read all sections and resolve includes
+    inputs = [] if listInputs else None
     sections = []
     for sourceConfigFile in sourceConfigFiles:
-        for section in readSections(sourceConfigFile):
+        for section in readSections(sourceConfigFile, inputs = inputs):
             sections.append(section)
 
+    if listInputs:
+        for path in inputs:
+            print(path)
+        return
+
     # Decode sections content
     sections = [ ( s[0], re.findall('(?:^|\n)([^\[\]\s:]+[^\[\]:]+):((?:.|\n)*?)(?=\n[^\[\]\s#:]|\n\[|$)', s[1]) ) for s in sections ]
 
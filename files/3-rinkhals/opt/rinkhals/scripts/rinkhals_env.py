@@ -0,0 +1,195 @@
+"""Rinkhals environment and app properties, resolved in-process
+
+Mirrors the environment exported by tools.sh and its get_app_property /
+set_app_property family without spawning sh and jq. Every file read is cached
+and reused until its mtime, size or inode changes.
+
+    env = RinkhalsEnvironment()
+    env.KOBRA_MODEL_CODE
+    env.get_app_property('40-moonraker', 'mqtt_print_auto_leveling')
+"""
+
+import os
+import re
+import json
+
+
+KOBRA_MODELS = {
+    '20021': ('Anycubic Kobra 2 Pro', 'K2P'),
+    '20024': ('Anycubic Kobra 3', 'K3'),
+    '20025': ('Anycubic Kobra S1', 'KS1'),
+    '20026': ('Anycubic Kobra 3 Max', 'K3M'),
+    '20027': ('Anycubic Kobra 3 V2', 'K3V2'),
+}
+
+MODEL_ID_REGEX = re.compile(r'"modelId"\s*:\s*"([0-9]+)"')
+
+
+def format_property(value):
+    """Formats a JSON value the way `jq -r` prints it"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value.strip()
+    return json.dumps(value)
+
+
+class RinkhalsEnvironment:
+    def __init__(self, rinkhals_base = '/useremain/rinkhals', rinkhals_home = '/useremain/home/rinkhals', rinkhals_logs = '/tmp/rinkhals',
+                 api_config_path = '/userdata/app/gk/config/api.cfg', device_path = '/useremain/dev'):
+        self.rinkhals_base = rinkhals_base
+        self.rinkhals_home = rinkhals_home
+        self.rinkhals_logs = rinkhals_logs
+        self.api_config_path = api_config_path
+        self.device_path = device_path
+
+        self.user_app_path = f'{rinkhals_home}/apps'
+        self.temporary_app_path = f'{rinkhals_logs}/apps'
+
+        self._cache = {}
+
+    def _read(self, path, parser = None):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._cache.pop(path, None)
+            return None
+
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cached = self._cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        try:
+            with open(path, 'r') as f:
+                value = f.read()
+            if parser:
+                value = parser(value)
+        except (OSError, ValueError):
+            value = None
+
+        self._cache[path] = (key, value)
+        return value
+
+    def _read_text(self, path):
+        value = self._read(path)
+        return value.strip() if value is not None else ''
+
+    # Environment
+
+    @property
+    def RINKHALS_ROOT(self):
+        return os.path.realpath(f'{self.rinkhals_base}/.current')
+    @property
+    def RINKHALS_VERSION(self):
+        return self._read_text(f'{self.RINKHALS_ROOT}/.version')
+    @property
+    def RINKHALS_HOME(self):
+        return self.rinkhals_home
+    @property
+    def RINKHALS_LOGS(self):
+        return self.rinkhals_logs
+
+    @property
+    def KOBRA_MODEL_ID(self):
+        def parse(content):
+            match = MODEL_ID_REGEX.search(content)
+            return match.group(1) if match else ''
+        return self._read(self.api_config_path, parse) or ''
+    @property
+    def KOBRA_MODEL(self):
+        model = KOBRA_MODELS.get(self.KOBRA_MODEL_ID)
+        return model[0] if model else ''
+    @property
+    def KOBRA_MODEL_CODE(self):
+        model = KOBRA_MODELS.get(self.KOBRA_MODEL_ID)
+        return model[1] if model else ''
+    @property
+    def KOBRA_VERSION(self):
+        return self._read_text(f'{self.device_path}/version')
+    @property
+    def KOBRA_DEVICE_ID(self):
+        return self._read_text(f'{self.device_path}/device_id')
+
+    def as_dict(self):
+        """Returns the variables exported by tools.sh"""
+        return {
+            'RINKHALS_ROOT': self.RINKHALS_ROOT,
+            'RINKHALS_VERSION': self.RINKHALS_VERSION,
+            'RINKHALS_HOME': self.RINKHALS_HOME,
+            'RINKHALS_LOGS': self.RINKHALS_LOGS,
+            'KOBRA_MODEL_ID': self.KOBRA_MODEL_ID,
+            'KOBRA_MODEL': self.KOBRA_MODEL,
+            'KOBRA_MODEL_CODE': self.KOBRA_MODEL_CODE,
+            'KOBRA_VERSION': self.KOBRA_VERSION,
+            'KOBRA_DEVICE_ID': self.KOBRA_DEVICE_ID,
+        }
+
+    # Apps
+
+    @property
+    def builtin_app_path(self):
+        return f'{self.RINKHALS_ROOT}/home/rinkhals/apps'
+
+    def list_apps(self):
+        apps = set()
+        for path in (self.builtin_app_path, self.user_app_path):
+            try:
+                apps.update(e.name for e in os.scandir(path) if e.is_dir())
+            except OSError:
+                pass
+        return sorted(apps)
+
+    def get_app_root(self, app):
+        user_app_root = f'{self.user_app_path}/{app}'
+        if os.path.exists(user_app_root):
+            return user_app_root
+        return f'{self.builtin_app_path}/{app}'
+
+    def is_app_enabled(self, app):
+        app_root = self.get_app_root(app)
+        enabled = os.path.isfile(f'{app_root}/.enabled') or os.path.isfile(f'{self.user_app_path}/{app}.enabled')
+        disabled = os.path.isfile(f'{app_root}/.disabled') or os.path.isfile(f'{self.user_app_path}/{app}.disabled')
+        return enabled and not disabled
+
+    # App properties
+
+    def _read_config(self, path):
+        config = self._read(path, json.loads)
+        return config if isinstance(config, dict) else {}
+
+    def get_app_property(self, app, property):
+        """Temporary config, then user config, then the app.json default"""
+        value = format_property(self._read_config(f'{self.temporary_app_path}/{app}.config').get(property))
+        if value == '':
+            value = format_property(self._read_config(f'{self.user_app_path}/{app}.config').get(property))
+        if value == '':
+            manifest = self._read_config(f'{self.get_app_root(app)}/app.json')
+            definition = manifest.get('properties', {}).get(property)
+            if isinstance(definition, dict):
+                value = format_property(definition.get('default'))
+        return value
+
+    def _update_config(self, path, update):
+        config = dict(self._read_config(path))
+        update(config)
+
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(config, f, indent = 2)
+            f.write('\n')
+        os.replace(temporary_path, path)
+
+    def set_app_property(self, app, property, value):
+        self._update_config(f'{self.user_app_path}/{app}.config', lambda config: config.__setitem__(property, str(value)))
+    def set_temporary_app_property(self, app, property, value):
+        self._update_config(f'{self.temporary_app_path}/{app}.config', lambda config: config.__setitem__(property, str(value)))
+    def remove_app_property(self, app, property):
+        if os.path.isdir(self.user_app_path):
+            self._update_config(f'{self.user_app_path}/{app}.config', lambda config: config.pop(property, None))
+    def clear_app_properties(self, app):
+        try:
+            os.remove(f'{self.user_app_path}/{app}.config')
+        except OSError:
+            pass
@@ -94,44 +94,42 @@ if USING_SIMULATOR:
 
     def are_apps_enabled(): return { a: is_app_enabled(a) for a in list_apps().split(' ') }
 else:
-    environment = shell(f'. /useremain/rinkhals/.current/tools.sh && python -c "import os, json; print(json.dumps(dict(os.environ)))"')
-    environment = json.loads(environment)
-
-    RINKHALS_ROOT = environment['RINKHALS_ROOT']
-    RINKHALS_HOME = environment['RINKHALS_HOME']
-    RINKHALS_VERSION = environment['RINKHALS_VERSION']
-    KOBRA_MODEL_ID = environment['KOBRA_MODEL_ID']
-    KOBRA_MODEL = environment['KOBRA_MODEL']
-    KOBRA_MODEL_CODE = environment['KOBRA_MODEL_CODE']
-    KOBRA_VERSION = environment['KOBRA_VERSION']
-    KOBRA_DEVICE_ID = environment['KOBRA_DEVICE_ID']
+    sys.path.append(os.path.join(os.path.dirname(SCRIPT_PATH), 'scripts'))
+    from rinkhals_env import RinkhalsEnvironment
+
+    environment = RinkhalsEnvironment()
+
+    RINKHALS_ROOT = environment.RINKHALS_ROOT
+    RINKHALS_HOME = environment.RINKHALS_HOME
+    RINKHALS_VERSION = environment.RINKHALS_VERSION
+    KOBRA_MODEL_ID = environment.KOBRA_MODEL_ID
+    KOBRA_MODEL = environment.KOBRA_MODEL
+    KOBRA_MODEL_CODE = environment.KOBRA_MODEL_CODE
+    KOBRA_VERSION = environment.KOBRA_VERSION
+    KOBRA_DEVICE_ID = environment.KOBRA_DEVICE_ID
 
     def load_tool_function(function_name):
         def tool_function(*args):
             return shell(f'. /useremain/rinkhals/.current/tools.sh && {function_name} ' + ' '.join([ str(a) for a in args ]))
         return tool_function
 
-    list_apps = load_tool_function('list_apps')
-    get_app_root = load_tool_function('get_app_root')
+    def list_apps(): return ' '.join(environment.list_apps())
+    get_app_root = environment.get_app_root
     get_app_status = load_tool_function('get_app_status')
     get_app_pids = load_tool_function('get_app_pids')
-    is_app_enabled = load_tool_function('is_app_enabled')
+    def is_app_enabled(app): return '1' if environment.is_app_enabled(app) else '0'
     enable_app = load_tool_function('enable_app')
     disable_app = load_tool_function('disable_app')
     start_app = load_tool_function('start_app')
     stop_app = load_tool_function('stop_app')
-    get_app_property = load_tool_function('get_app_property')
-    set_app_property = load_tool_function('set_app_property')
-    set_temporary_app_property = load_tool_function('set_temporary_app_property')
-    remove_app_property = load_tool_function('remove_app_property')
-    clear_app_properties = load_tool_function('clear_app_properties')
-
-    def are_apps_enabled():
-        result = shell('. /useremain/rinkhals/.current/tools.sh && for a in $(list_apps); do echo "$a $(is_app_enabled $a)"; done')
-        apps = result.splitlines()
-        apps = [ a.split(' ') for a in apps ]
-        return { a[0]: a[1] for a in apps }
-        
+    get_app_property = environment.get_app_property
+    set_app_property = environment.set_app_property
+    set_temporary_app_property = environment.set_temporary_app_property
+    remove_app_property = environment.remove_app_property
+    clear_app_properties = environment.clear_app_properties
+
+    def are_apps_enabled(): return { a: is_app_enabled(a) for a in environment.list_apps() }
+
 # Detect LAN mode
 REMOTE_MODE = 'cloud'
 if os.path.isfile('/useremain/dev/remote_ctrl_mode'):
@@ -0,0 +1,122 @@
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "opt/rinkhals/scripts/rinkhals_env.py"
+
+
+def load_rinkhals_env():
+    spec = importlib.util.spec_from_file_location("rinkhals_env_for_test", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    sys.modules["rinkhals_env_for_test"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+rinkhals_env = load_rinkhals_env()
+
+
+def build_environment(tmp_path):
+    release = tmp_path / "rinkhals" / "20250101_01"
+    (release / "home/rinkhals/apps/40-moonraker").mkdir(parents=True)
+    (release / ".version").write_text("20250101_01\n")
+    (tmp_path / "rinkhals" / ".current").symlink_to(release)
+
+    (tmp_path / "dev").mkdir()
+    (tmp_path / "dev/version").write_text("2.5.6.4\n")
+    (tmp_path / "dev/device_id").write_text("abcdef\n")
+    (tmp_path / "api.cfg").write_text('{ "cloud": { "modelId" : "20025" } }')
+
+    (release / "home/rinkhals/apps/40-moonraker/app.json").write_text(json.dumps({
+        "properties": {
+            "mqtt_print_auto_leveling": { "default": "False" },
+            "mqtt_print_flow_calibration": { "default": True },
+        }
+    }))
+
+    return rinkhals_env.RinkhalsEnvironment(
+        rinkhals_base=str(tmp_path / "rinkhals"),
+        rinkhals_home=str(tmp_path / "home"),
+        rinkhals_logs=str(tmp_path / "logs"),
+        api_config_path=str(tmp_path / "api.cfg"),
+        device_path=str(tmp_path / "dev"),
+    )
+
+
+def test_environment_matches_tools_sh(tmp_path):
+    environment = build_environment(tmp_path)
+
+    assert environment.as_dict() == {
+        "RINKHALS_ROOT": str(tmp_path / "rinkhals" / "20250101_01"),
+        "RINKHALS_VERSION": "20250101_01",
+        "RINKHALS_HOME": str(tmp_path / "home"),
+        "RINKHALS_LOGS": str(tmp_path / "logs"),
+        "KOBRA_MODEL_ID": "20025",
+        "KOBRA_MODEL": "Anycubic Kobra S1",
+        "KOBRA_MODEL_CODE": "KS1",
+        "KOBRA_VERSION": "2.5.6.4",
+        "KOBRA_DEVICE_ID": "abcdef",
+    }
+
+
+def test_app_property_precedence(tmp_path):
+    environment = build_environment(tmp_path)
+    app = "40-moonraker"
+
+    assert environment.get_app_property(app, "mqtt_print_auto_leveling") == "False"
+    assert environment.get_app_property(app, "mqtt_print_flow_calibration") == "true"
+    assert environment.get_app_property(app, "missing") == ""
+
+    environment.set_app_property(app, "mqtt_print_auto_leveling", "True")
+    assert environment.get_app_property(app, "mqtt_print_auto_leveling") == "True"
+
+    environment.set_temporary_app_property(app, "mqtt_print_auto_leveling", "False")
+    assert environment.get_app_property(app, "mqtt_print_auto_leveling") == "False"
+    os.remove(tmp_path / "logs/apps/40-moonraker.config")
+
+    environment.remove_app_property(app, "mqtt_print_auto_leveling")
+    assert json.loads((tmp_path / "home/apps/40-moonraker.config").read_text()) == {}
+
+    environment.set_app_property(app, "mqtt_print_auto_leveling", "True")
+    environment.clear_app_properties(app)
+    assert environment.get_app_property(app, "mqtt_print_auto_leveling") == "False"
+
+
+def test_reads_are_cached_until_file_changes(tmp_path, monkeypatch):
+    environment = build_environment(tmp_path)
+    reads = []
+
+    original_open = open
+    def counting_open(path, *args, **kwargs):
+        reads.append(path)
+        return original_open(path, *args, **kwargs)
+    monkeypatch.setattr(rinkhals_env, "open", counting_open, raising=False)
+
+    assert environment.KOBRA_MODEL_CODE == "KS1"
+    assert environment.KOBRA_MODEL == "Anycubic Kobra S1"
+    assert reads.count(str(tmp_path / "api.cfg")) == 1
+
+    (tmp_path / "api.cfg").write_text('{ "cloud": { "modelId": "20024" } }')
+    os.utime(tmp_path / "api.cfg", ns=(2_000_000_000, 2_000_000_000))
+
+    assert environment.KOBRA_MODEL_CODE == "K3"
+    assert reads.count(str(tmp_path / "api.cfg")) == 2
+
+
+def test_apps_listing_and_enabled_state(tmp_path):
+    environment = build_environment(tmp_path)
+    (tmp_path / "home/apps/50-custom").mkdir(parents=True)
+    (tmp_path / "home/apps/50-custom/.enabled").touch()
+    (tmp_path / "home/apps/40-moonraker.enabled").touch()
+
+    assert environment.list_apps() == ["40-moonraker", "50-custom"]
+    assert environment.get_app_root("50-custom") == str(tmp_path / "home/apps/50-custom")
+    assert environment.is_app_enabled("40-moonraker")
+    assert environment.is_app_enabled("50-custom")
+
+    (tmp_path / "home/apps/40-moonraker.disabled").touch()
+    assert not environment.is_app_enabled("40-moonraker")
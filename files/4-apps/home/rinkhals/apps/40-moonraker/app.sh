@@ -24,12 +24,8 @@ debug() {
 
     cd $APP_ROOT
     
-    python -m venv --without-pip .
-    . bin/activate
+    . ./prepare.sh
 
-    cp -rf kobra.py moonraker/moonraker/components/kobra.py
-    cp -rf mmu_ace.py moonraker/moonraker/components/mmu_ace.py
-    python /opt/rinkhals/scripts/process-cfg.py moonraker.conf > /userdata/app/gk/printer_data/config/moonraker.generated.conf
     TMPDIR=/useremain/tmp HOME=/userdata/app/gk python ./moonraker/moonraker/moonraker.py -c /userdata/app/gk/printer_data/config/moonraker.generated.conf $@
 }
 stop() {
@@ -1,17 +1,30 @@
 import os
+import asyncio
 import uuid
 import json
 import re
 import time
 import logging
-import subprocess
-import shlex
 import ast
+import random
+import collections
+import bisect
+import copy
+import inspect
+import struct
+import fcntl
+import functools
 import paho.mqtt.client as paho
 
+try:
+    from inotify_simple import INotify, flags as iFlags
+except ImportError:
+    INotify = None
+
 from ..utils import Sentinel
 from .power import PowerDevice
 from ..common import WebRequest
+from .rinkhals_env import RinkhalsEnvironment
 
 from typing import (
     TYPE_CHECKING,
@@ -28,11 +41,1095 @@ from typing import (
 FlexCallback = Callable[..., Optional[Coroutine]]
 
 
-def shell(command):
-    result = subprocess.check_output(['sh', '-c', command])
-    result = result.decode('utf-8').strip()
-    logging.info(f'Shell "{command}" => "{result}"')
-    return result
+KOBRA_GCODES_PATH = '/useremain/app/gk/gcodes/'
+KOBRA_REMOTE_MODE_PATH = '/useremain/dev/remote_ctrl_mode'
+PRINTER_MUTABLE_CONFIG_PATH = '/userdata/app/gk/printer_data/config/printer_mutable.cfg'
+PRINTER_GENERATED_CONFIG_PATH = '/userdata/app/gk/printer_data/config/printer.generated.cfg'
+
+
+def parse_printer_config(content: str) -> Dict[str, Dict[str, str]]:
+    sections = {}
+    section = None
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].rstrip()
+        if not line.strip():
+            continue
+        if line.startswith('['):
+            name = line[1:line.find(']')].strip()
+            section = sections.setdefault(name, {})
+        elif section is not None and not line[0].isspace():
+            match = re.match(r'([^:=]+)[:=](.*)', line)
+            if match:
+                section[match[1].strip()] = match[2].strip()
+    return sections
+
+
+# Config sections GoKlipper exposes as printer objects, by exact name or "<prefix> <name>"
+# Limited to the object kinds the previous static list advertised, other Klipper sections are not served by GoKlipper
+CONFIG_OBJECT_SECTIONS = ( 'extruder', 'heater_bed', 'fan', 'mcu', 'ota_filament_hub' )
+CONFIG_OBJECT_PREFIXES = ( 'extruder', 'mcu', 'fan_generic', 'gcode_macro' )
+
+def get_config_objects(config: Dict[str, Dict[str, str]]) -> List[str]:
+    objects = []
+    for section in config:
+        prefix = section.split(' ', 1)[0]
+        if section in CONFIG_OBJECT_SECTIONS or (prefix != section and prefix in CONFIG_OBJECT_PREFIXES):
+            objects.append(section)
+    return objects
+
+
+class CachedFile:
+    def __init__(self, path: str, parser: Callable[[str], Any]):
+        self.path = path
+        self.parser = parser
+        self.value = None
+        self.stat_key = None
+        self.watched = False
+        self.next_check = 0
+        self.subscribers: List[Callable[[Any], None]] = []
+
+    def read_stat_key(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def reload(self) -> bool:
+        stat_key = self.read_stat_key()
+        if stat_key == self.stat_key and self.next_check:
+            return False
+
+        value = None
+        if stat_key is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    value = self.parser(f.read())
+            except Exception:
+                logging.exception(f'[Kobra] Failed to parse {self.path}')
+
+        self.stat_key = stat_key
+        self.value = value
+        return True
+
+
+class CachedFileRegistry:
+    """Parsed printer-side files shared between components
+
+    Files are parsed once and kept in memory. Changes are picked up through
+    inotify on the parent directory when available, or through throttled mtime
+    checks otherwise, and pushed to subscribers
+    """
+
+    def __init__(self, eventloop = None, check_interval: float = 1.0):
+        self.eventloop = eventloop
+        self.check_interval = check_interval
+        self.files: Dict[str, CachedFile] = {}
+
+        self._inotify = None
+        self._watches: Dict[int, str] = {}
+        if INotify is not None and eventloop is not None:
+            try:
+                self._inotify = INotify(nonblocking=True)
+                self.eventloop.aioloop.add_reader(self._inotify.fileno(), self._handle_inotify)
+            except Exception:
+                logging.exception('[Kobra] Failed to initialize inotify, falling back to mtime checks')
+                self._inotify = None
+
+    def register(self, path: str, parser: Callable[[str], Any] = None, callback: Callable[[Any], None] = None) -> CachedFile:
+        cached_file = self.files.get(path)
+        if cached_file is None:
+            cached_file = self.files[path] = CachedFile(path, parser or (lambda content: content))
+            cached_file.watched = self._watch(os.path.dirname(path))
+        if callback is not None:
+            cached_file.subscribers.append(callback)
+        return cached_file
+
+    def subscribe(self, path: str, callback: Callable[[Any], None]):
+        self.register(path, callback=callback)
+
+    def get(self, path: str) -> Any:
+        cached_file = self.files.get(path) or self.register(path)
+        if not cached_file.next_check:
+            cached_file.reload()
+            cached_file.next_check = time.monotonic() + self.check_interval
+        elif not cached_file.watched:
+            now = time.monotonic()
+            if now >= cached_file.next_check:
+                cached_file.next_check = now + self.check_interval
+                if cached_file.reload():
+                    self._notify(cached_file)
+        return cached_file.value
+
+    def refresh(self, path: str):
+        cached_file = self.files.get(path)
+        if cached_file is not None and cached_file.reload():
+            cached_file.next_check = time.monotonic() + self.check_interval
+            self._notify(cached_file)
+
+    def _watch(self, directory: str) -> bool:
+        if self._inotify is None:
+            return False
+        if directory in self._watches.values():
+            return True
+        try:
+            mask = iFlags.CLOSE_WRITE | iFlags.MOVED_TO | iFlags.CREATE | iFlags.DELETE | iFlags.MOVED_FROM
+            wd = self._inotify.add_watch(directory, mask)
+        except OSError:
+            logging.info(f'[Kobra] Unable to watch {directory}, falling back to mtime checks')
+            return False
+        self._watches[wd] = directory
+        return True
+
+    def _handle_inotify(self):
+        try:
+            events = self._inotify.read()
+        except OSError:
+            return
+        for event in events:
+            directory = self._watches.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            self.refresh(os.path.join(directory, event.name))
+
+    def _notify(self, cached_file: CachedFile):
+        for callback in cached_file.subscribers:
+            try:
+                callback(cached_file.value)
+            except Exception:
+                logging.exception(f'[Kobra] Error while notifying {cached_file.path} change')
+
+    def close(self):
+        if self._inotify is not None:
+            self.eventloop.aioloop.remove_reader(self._inotify.fileno())
+            self._inotify.close()
+            self._inotify = None
+
+
+class PatchedStatus(dict):
+    """Status payload that already went through Kobra.patch_status"""
+    __slots__ = ()
+
+
+class GCodeRouter:
+    """Splits G-code scripts line by line, dispatching intercepted commands to their handlers
+
+    Consecutive lines without a handler are forwarded to Klippy as a single
+    script. Scripts without any intercepted command are forwarded untouched.
+    """
+
+    # A parameter is a run of bare characters, escapes and quoted strings (shlex posix semantics)
+    TOKEN_REGEX = re.compile(r'''(?:[^\s'"\\]+|\\.|"(?:[^"\\]|\\.)*"|'[^']*')+''')
+    TOKEN_PART_REGEX = re.compile(r'''\\(.)|"((?:[^"\\]|\\.)*)"|'([^']*)'|([^'"\\]+)''')
+    DOUBLE_QUOTE_ESCAPE_REGEX = re.compile(r'\\([\\"])')
+
+    def __init__(self, handlers: Dict[str, FlexCallback] = None):
+        self.handlers = handlers if handlers is not None else {}
+        self._command_regex = None
+
+    def register(self, cmd: str, callback: FlexCallback):
+        self.handlers[cmd.upper()] = callback
+        self._command_regex = None
+
+    def _compile(self):
+        if self._command_regex is None:
+            commands = '|'.join(sorted((re.escape(c) for c in self.handlers), key=len, reverse=True))
+            self._command_regex = re.compile(rf'^[ \t]*({commands})(?=\s|$)', re.IGNORECASE | re.MULTILINE) if commands else False
+        return self._command_regex
+
+    @classmethod
+    def _unquote(cls, token: str):
+        if '"' not in token and "'" not in token and '\\' not in token:
+            return token
+
+        parts = []
+        for escaped, double_quoted, single_quoted, bare in cls.TOKEN_PART_REGEX.findall(token):
+            if double_quoted:
+                parts.append(cls.DOUBLE_QUOTE_ESCAPE_REGEX.sub(r'\1', double_quoted))
+            else:
+                parts.append(escaped or single_quoted or bare)
+        return ''.join(parts)
+
+    @classmethod
+    def parse_args(cls, line: str) -> Dict[str, Optional[str]]:
+        args = {}
+        for token in cls.TOKEN_REGEX.findall(line):
+            token = cls._unquote(token)
+            if '=' in token:
+                key, value = token.split('=', 1)
+                args[key] = value
+            else:
+                args[token] = None
+        return args
+
+    def split(self, script: str):
+        """Yields (None, chunk) for passthrough runs and (command, line) for intercepted lines"""
+        command_regex = self._compile()
+        if not command_regex or not command_regex.search(script):
+            yield None, script
+            return
+
+        position = 0
+        for match in command_regex.finditer(script):
+            line_start = match.start()
+            line_end = script.find('\n', match.end())
+            if line_end < 0:
+                line_end = len(script)
+
+            chunk = script[position:line_start].strip()
+            if chunk:
+                yield None, chunk
+            yield match.group(1).upper(), script[match.end(1):line_end].rstrip()
+
+            position = line_end + 1
+
+        chunk = script[position:].strip()
+        if chunk:
+            yield None, chunk
+
+    async def route(self, script: str, delegate: Callable[[str], Coroutine]):
+        result = None
+        for command, text in self.split(script):
+            if command is None:
+                result = await delegate(text)
+                continue
+
+            args = self.parse_args(text)
+            logging.debug('[Kobra] Handling gcode %s with args %s', command, args)
+
+            line = f'{command}{text}'
+            result = await self.handlers[command](args, lambda line=line: delegate(line))
+            if inspect.isawaitable(result):
+                result = await result
+
+        return result
+
+
+class SingleFlight:
+    """Shares one execution between identical concurrent requests
+
+    Results stay available for `ttl` seconds after completion, failed
+    executions are never shared past their completion.
+    """
+
+    def __init__(self, ttl: float = 0.1):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._flights: Dict[str, list] = {}
+
+    async def run(self, key: str, factory: Callable[[], Coroutine]):
+        flight = self._flights.get(key)
+        if flight is not None and (not flight[0].done() or time.monotonic() < flight[1]):
+            self.hits += 1
+            return await asyncio.shield(flight[0])
+
+        self.misses += 1
+        self._prune()
+
+        future = asyncio.ensure_future(factory())
+        flight = self._flights[key] = [ future, float('inf') ]
+
+        def on_done(future: asyncio.Future):
+            if self._flights.get(key) is not flight:
+                return
+            if future.cancelled() or future.exception() is not None or self.ttl <= 0:
+                del self._flights[key]
+            else:
+                flight[1] = time.monotonic() + self.ttl
+
+        future.add_done_callback(on_done)
+        return await asyncio.shield(future)
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [ key for key, (future, expires) in self._flights.items() if future.done() and now >= expires ]
+        for key in expired:
+            del self._flights[key]
+
+
+class KlippyInterceptor:
+    __slots__ = ('name', 'endpoint', 'callback', 'order', 'sequence', 'calls', 'errors', 'duration')
+
+    def __init__(self, name: str, endpoint: Optional[str], callback: Callable, order: int, sequence: int):
+        self.name = name
+        self.endpoint = endpoint
+        self.callback = callback
+        self.order = order
+        self.sequence = sequence
+        self.calls = 0
+        self.errors = 0
+        self.duration = 0.0
+
+    @property
+    def key(self):
+        return (self.order, self.sequence)
+
+
+class KlippyInterceptors:
+    """Endpoint keyed interceptors around KlippyConnection methods
+
+    Each patched method is wrapped once by a dispatcher looking up the chain
+    of its endpoint. Interceptors are called as `await callback(web_request, call_next)`
+    by ascending order, the lowest being the outermost, and continue the chain
+    with `await call_next(web_request)`. An interceptor changing the endpoint
+    continues on the chain of the new endpoint. Interceptors registered without
+    endpoint apply to every request.
+    """
+
+    def __init__(self):
+        self._interceptors: Dict[str, List[KlippyInterceptor]] = {}
+        self._chains: Dict[tuple, tuple] = {}
+        self._installed = set()
+        self._sequence = 0
+
+    def register(self, cls, method: str, endpoint: Optional[str], callback: Callable, order: int = 50, name: Optional[str] = None):
+        name = name or getattr(callback, '__qualname__', None) or repr(callback)
+        self._interceptors.setdefault(method, []).append(KlippyInterceptor(name, endpoint, callback, order, self._sequence))
+        self._sequence += 1
+        self._chains.clear()
+        self.install(cls, method)
+
+    def install(self, cls, method: str):
+        if (cls, method) in self._installed:
+            return
+        self._installed.add((cls, method))
+
+        original = getattr(cls, method)
+
+        async def dispatch(me, web_request, *args, **kwargs):
+            endpoint = web_request.get_endpoint()
+            chain = self._chains.get((method, endpoint))
+            if chain is None:
+                chain = self.get_chain(method, endpoint)
+            if not chain:
+                return await original(me, web_request, *args, **kwargs)
+            return await self._call(chain, 0, endpoint, method, original, me, web_request, args, kwargs)
+
+        logging.debug(f'  Before: {original}')
+        setattr(cls, method, dispatch)
+        logging.debug(f'  After: {dispatch}')
+
+    def get_chain(self, method: str, endpoint: str) -> tuple:
+        chain = self._chains.get((method, endpoint))
+        if chain is None:
+            interceptors = [ i for i in self._interceptors.get(method, []) if i.endpoint is None or i.endpoint == endpoint ]
+            chain = self._chains[(method, endpoint)] = tuple(sorted(interceptors, key=lambda i: i.key))
+        return chain
+
+    async def _call(self, chain, index, endpoint, method, original, me, web_request, args, kwargs):
+        if index >= len(chain):
+            return await original(me, web_request, *args, **kwargs)
+
+        interceptor = chain[index]
+        inner = 0.0
+
+        async def call_next(request = web_request):
+            nonlocal inner
+            next_chain, next_index = chain, index + 1
+
+            next_endpoint = request.get_endpoint()
+            if next_endpoint != endpoint:
+                next_chain = self.get_chain(method, next_endpoint)
+                next_index = next((i for i, c in enumerate(next_chain) if c.key > interceptor.key), len(next_chain))
+
+            start = time.perf_counter()
+            try:
+                return await self._call(next_chain, next_index, next_endpoint, method, original, me, request, args, kwargs)
+            finally:
+                inner += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            return await interceptor.callback(web_request, call_next)
+        except Exception:
+            interceptor.errors += 1
+            raise
+        finally:
+            interceptor.calls += 1
+            interceptor.duration += time.perf_counter() - start - inner
+
+    def get_stats(self) -> List[dict]:
+        return [
+            { 'method': method, 'name': i.name, 'endpoint': i.endpoint, 'order': i.order, 'calls': i.calls, 'errors': i.errors, 'duration': i.duration }
+            for method, interceptors in self._interceptors.items()
+            for i in sorted(interceptors, key=lambda i: i.key)
+        ]
+
+    def render(self) -> str:
+        stats = self.get_stats()
+        lines = []
+        for metric, field, type, help in (
+            ('kobra_interceptor_calls_total', 'calls', 'counter', 'Requests handled by each Klippy interceptor'),
+            ('kobra_interceptor_errors_total', 'errors', 'counter', 'Requests failed in each Klippy interceptor'),
+            ('kobra_interceptor_duration_seconds_total', 'duration', 'counter', 'Time spent in each Klippy interceptor, excluding the rest of the chain'),
+        ):
+            lines.append(f'# HELP {metric} {help}')
+            lines.append(f'# TYPE {metric} {type}')
+            for stat in stats:
+                labels = KobraMetrics._labels([ ('method', stat['method']), ('interceptor', stat['name']) ])
+                lines.append(f'{metric}{labels} {stat[field]!r}')
+        return '\n'.join(lines) + '\n'
+
+
+class KobraTracer:
+    """Ring buffer of recent Klippy requests, with sampled payloads"""
+
+    def __init__(self, sample_rate: float = 0.0, buffer_size: int = 100):
+        self.sample_rate = sample_rate
+        self.entries = collections.deque(maxlen=buffer_size)
+
+    def is_sampled(self):
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def record(self, endpoint: str, start: float, duration: float, args: Any = None, result: Any = None, error: Any = None):
+        # Keep raw references only, formatting happens when the trace is requested
+        self.entries.append((start, endpoint, duration, args, result, error))
+        logging.debug('[Kobra] %s took %.1f ms', endpoint, duration * 1000)
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_entries(self):
+        return [
+            {
+                'time': start,
+                'endpoint': endpoint,
+                'duration': round(duration * 1000, 3),
+                'args': args,
+                'result': result,
+                'error': str(error) if error is not None else None
+            }
+            for start, endpoint, duration, args, result, error in self.entries
+        ]
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class KobraMetrics:
+    """Latency and payload histograms, rendered in Prometheus text format"""
+
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    PATCH_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+    SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    # name: (help, label, buckets)
+    HISTOGRAMS = {
+        'kobra_klippy_request_duration_seconds': ('Klippy request latency, including Kobra patching', 'endpoint', LATENCY_BUCKETS),
+        'kobra_status_patch_duration_seconds': ('Time spent patching a status payload', None, PATCH_BUCKETS),
+        'kobra_status_patcher_duration_seconds': ('Time spent in each registered status patcher', 'patcher', PATCH_BUCKETS),
+        'kobra_status_payload_fields': ('Number of fields in patched status payloads', None, SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Optional[str], Histogram]] = { name: {} for name in self.HISTOGRAMS }
+        self.status_updates = 0
+        self.status_updates_rate = 0.0
+        self.status_patch_duration = self.get_histogram('kobra_status_patch_duration_seconds')
+        self.status_payload_fields = self.get_histogram('kobra_status_payload_fields')
+        self._patcher_histograms: Dict[Callable, Histogram] = {}
+        self._rate_window_start = time.monotonic()
+        self._rate_window_count = 0
+
+    def get_histogram(self, name: str, label: Optional[str] = None) -> Histogram:
+        histograms = self.histograms[name]
+        histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = Histogram(self.HISTOGRAMS[name][2])
+        return histogram
+
+    def observe(self, name: str, value: float, label: Optional[str] = None):
+        self.get_histogram(name, label).observe(value)
+
+    def get_patcher_histogram(self, patcher: Callable) -> Histogram:
+        histogram = self._patcher_histograms.get(patcher)
+        if histogram is None:
+            name = getattr(patcher, '__qualname__', None) or repr(patcher)
+            histogram = self._patcher_histograms[patcher] = self.get_histogram('kobra_status_patcher_duration_seconds', name)
+        return histogram
+
+    def count_status_update(self):
+        self.status_updates += 1
+        self._rate_window_count += 1
+
+        now = time.monotonic()
+        elapsed = now - self._rate_window_start
+        if elapsed >= 1.0:
+            self.status_updates_rate = self._rate_window_count / elapsed
+            self._rate_window_start = now
+            self._rate_window_count = 0
+
+    LABEL_ESCAPES = str.maketrans({ '\\': '\\\\', '"': '\\"', '\n': '\\n' })
+
+    @classmethod
+    def _labels(cls, pairs):
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{str(value).translate(cls.LABEL_ESCAPES)}"' for key, value in pairs) + '}'
+
+    def render(self) -> str:
+        lines = [
+            '# HELP kobra_status_updates_total Status updates received from Klippy',
+            '# TYPE kobra_status_updates_total counter',
+            f'kobra_status_updates_total {self.status_updates}',
+            '# HELP kobra_status_updates_per_second Status updates received during the last second',
+            '# TYPE kobra_status_updates_per_second gauge',
+            f'kobra_status_updates_per_second {self.status_updates_rate:.3f}',
+        ]
+
+        for name, (help, label_name, bounds) in self.HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} histogram')
+
+            for label, histogram in sorted(self.histograms[name].items(), key=lambda item: item[0] or ''):
+                base = [ (label_name, label) ] if label_name else []
+                cumulative = 0
+                for bound, count in zip(bounds + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{self._labels(base + [ ("le", le) ])} {cumulative}')
+                lines.append(f'{name}_sum{self._labels(base)} {histogram.sum!r}')
+                lines.append(f'{name}_count{self._labels(base)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class GoKlipperWatcher:
+    """Tracks the GoKlipper process liveness without forking shells
+
+    The gklib PID is resolved once from /proc, then followed through a pidfd
+    registered on the event loop (or /proc/<pid>/stat polling on kernels without
+    pidfd support). State changes are published as kobra:goklipper_state_changed
+    """
+
+    PROCESS_NAME = b'gklib'
+
+    def __init__(self, server, proc_root: str = '/proc', search_interval: float = 2.0, poll_interval: float = 1.0):
+        self.server = server
+        self.eventloop = server.get_event_loop()
+        self.proc_root = proc_root
+        self.search_interval = search_interval
+        self.poll_interval = poll_interval
+
+        self.pid = None
+        self._pidfd = None
+        self._start_time = None
+        self._search_timer = self.eventloop.register_timer(self._search)
+        self._poll_timer = self.eventloop.register_timer(self._poll)
+
+    @property
+    def running(self):
+        return self.pid is not None
+
+    def start(self):
+        pid = self.find_pid()
+        if pid:
+            self._track(pid)
+        else:
+            self._search_timer.start(self.search_interval)
+
+    def find_pid(self) -> Optional[int]:
+        own_pid = os.getpid()
+        try:
+            entries = os.listdir(self.proc_root)
+        except OSError:
+            return None
+
+        for entry in entries:
+            if not entry.isdigit() or int(entry) == own_pid:
+                continue
+            try:
+                with open(os.path.join(self.proc_root, entry, 'cmdline'), 'rb') as f:
+                    cmdline = f.read()
+            except OSError:
+                continue
+            if self.PROCESS_NAME in cmdline:
+                return int(entry)
+
+        return None
+
+    def read_start_time(self, pid: int) -> Optional[str]:
+        # Field 22 of /proc/<pid>/stat, used to detect PID reuse
+        try:
+            with open(os.path.join(self.proc_root, str(pid), 'stat'), 'r') as f:
+                stat = f.read()
+        except OSError:
+            return None
+        fields = stat[stat.rfind(')') + 2:].split()
+        return fields[19] if len(fields) > 19 else None
+
+    def is_alive(self, pid: int) -> bool:
+        start_time = self.read_start_time(pid)
+        return start_time is not None and start_time == self._start_time
+
+    def _track(self, pid: int):
+        self.pid = pid
+        self._start_time = self.read_start_time(pid)
+        logging.info(f'[Kobra] Found GoKlipper process (PID: {pid})')
+
+        try:
+            self._pidfd = os.pidfd_open(pid)
+            self.eventloop.aioloop.add_reader(self._pidfd, self._on_exit)
+        except (AttributeError, OSError):
+            self._pidfd = None
+            self._poll_timer.start(self.poll_interval)
+
+        self.server.send_event('kobra:goklipper_state_changed', { 'running': True, 'pid': pid })
+
+    def _on_exit(self):
+        logging.info(f'[Kobra] GoKlipper (PID: {self.pid}) died')
+
+        if self._pidfd is not None:
+            self.eventloop.aioloop.remove_reader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+        self._poll_timer.stop()
+
+        self.pid = None
+        self._start_time = None
+        self.server.send_event('kobra:goklipper_state_changed', { 'running': False, 'pid': None })
+
+        self._search_timer.start(self.search_interval)
+
+    def _poll(self, eventtime):
+        if self.pid is not None and not self.is_alive(self.pid):
+            self._on_exit()
+        return eventtime + self.poll_interval
+
+    def _search(self, eventtime):
+        pid = self.find_pid()
+        if pid:
+            self._search_timer.stop()
+            self._track(pid)
+        return eventtime + self.search_interval
+
+    def close(self):
+        self._search_timer.stop()
+        self._poll_timer.stop()
+        if self._pidfd is not None:
+            self.eventloop.aioloop.remove_reader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+
+
+class GoKlipperError(Exception):
+    pass
+
+
+class GoKlipperClient:
+    """JSON-RPC client for GoKlipper's UNIX socket
+
+    Messages are JSON objects terminated by \\x03. A single connection is opened
+    lazily and shared by concurrent calls, responses being matched by id.
+    """
+
+    SEPARATOR = b'\x03'
+
+    def __init__(self, path: str = '/tmp/unix_uds1', timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+
+        self._next_id = 1
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self.connected:
+                return
+            reader, self._writer = await asyncio.open_unix_connection(self.path, limit=2 ** 20)
+            self._read_task = asyncio.ensure_future(self._read_loop(reader, self._writer))
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        error = ConnectionError(f'Connection to {self.path} closed')
+        try:
+            while True:
+                data = await reader.readuntil(self.SEPARATOR)
+                try:
+                    message = json.loads(data[:-1])
+                except ValueError:
+                    logging.warning(f'[Kobra] Invalid message from GoKlipper: {data[:100]}')
+                    continue
+
+                # Notifications and responses to unknown ids are ignored
+                future = self._pending.pop(message.get('id'), None) if isinstance(message, dict) else None
+                if future is None or future.done():
+                    continue
+                if 'error' in message:
+                    future.set_exception(GoKlipperError(message['error']))
+                else:
+                    future.set_result(message.get('result'))
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError) as e:
+            error = ConnectionError(f'Connection to {self.path} lost: {e}')
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._disconnect(error)
+
+    def _disconnect(self, error: Exception):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _send(self, method: str, params: dict, request_id: int):
+        message = json.dumps({ 'method': method, 'params': params or {}, 'id': request_id })
+        self._writer.write(message.encode('utf-8') + self.SEPARATOR)
+        await self._writer.drain()
+
+    async def call(self, method: str, params: dict = None, timeout: float = None):
+        if not self.connected:
+            await self._connect()
+
+        request_id = self._next_id
+        self._next_id += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send(method, params, request_id)
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: dict = None):
+        """Sends a request without waiting for its response, for methods GoKlipper does not reliably answer"""
+        if not self.connected:
+            await self._connect()
+
+        request_id = self._next_id
+        self._next_id += 1
+
+        # Nothing waits on this id, so a late response is ignored by the read loop
+        await self._send(method, params, request_id)
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._disconnect(ConnectionError('Client closed'))
+
+
+@functools.lru_cache(maxsize=8)
+def get_mesh_weights(probe_count: int, pps: int, algo: str, tension: float, axis_min: float, axis_max: float):
+    """Interpolation weights of one mesh axis, as sparse (probe index, weight) lists per mesh index
+
+    Klipper's lagrange and bicubic (cardinal spline) samplers are linear in the
+    probed values, so each mesh row is a weighted sum of probed rows and the
+    whole mesh is Wy . Z . Wx^T with weights depending on the geometry only.
+    """
+    mult = pps + 1
+    mesh_count = (probe_count - 1) * pps + probe_count
+    distance = (axis_max - axis_min) / (mesh_count - 1) if mesh_count > 1 else 0.
+    coordinates = [ axis_min + distance * i * mult for i in range(probe_count) ]
+
+    weights = []
+    for index in range(mesh_count):
+        segment, offset = divmod(index, mult)
+        if offset == 0 or algo == 'direct':
+            weights.append(((segment, 1.),))
+        elif algo == 'lagrange':
+            c = axis_min + distance * index
+            row = []
+            for i in range(probe_count):
+                n = d = 1.
+                for j in range(probe_count):
+                    if j != i:
+                        n *= c - coordinates[j]
+                        d *= coordinates[i] - coordinates[j]
+                row.append((i, n / d))
+            weights.append(tuple(row))
+        else:
+            t = offset / float(mult)
+            t2 = t * t
+            t3 = t2 * t
+            row = collections.defaultdict(float)
+            p0, p1, p2, p3 = max(segment - 1, 0), segment, segment + 1, min(segment + 2, probe_count - 1)
+            row[p1] += 2 * t3 - 3 * t2 + 1
+            row[p2] += -2 * t3 + 3 * t2
+            row[p2] += tension * (t3 - 2 * t2 + t)
+            row[p0] -= tension * (t3 - 2 * t2 + t)
+            row[p3] += tension * (t3 - t2)
+            row[p1] -= tension * (t3 - t2)
+            weights.append(tuple(row.items()))
+    return tuple(weights)
+
+def build_mesh_matrix(points: List[List[float]], params: dict) -> List[List[float]]:
+    """Interpolated mesh matching Klipper's ZMesh.get_mesh_matrix()"""
+    x_count, y_count = len(points[0]), len(points)
+    x_pps, y_pps = params['mesh_x_pps'], params['mesh_y_pps']
+
+    algo = params['algo']
+    if x_pps == 0 and y_pps == 0:
+        algo = 'direct'
+    elif algo == 'bicubic' and min(x_count, y_count) < 4:
+        algo = 'lagrange'
+
+    x_weights = get_mesh_weights(x_count, x_pps, algo, params['tension'], params['min_x'], params['max_x'])
+    y_weights = get_mesh_weights(y_count, y_pps, algo, params['tension'], params['min_y'], params['max_y'])
+
+    rows = [ [ sum(row[i] * w for i, w in weights) for weights in x_weights ] for row in points ]
+    return [
+        [ round(sum(rows[j][x] * w for j, w in weights), 6) for x in range(len(x_weights)) ]
+        for weights in y_weights
+    ]
+
+def get_mesh_statistics(points: List[List[float]]) -> dict:
+    values = [ z for row in points for z in row ]
+    mean = sum(values) / len(values)
+    variance = sum((z - mean) ** 2 for z in values) / len(values)
+    return {
+        'min': min(values),
+        'max': max(values),
+        'range': round(max(values) - min(values), 6),
+        'mean': round(mean, 6),
+        'variance': round(variance, 6),
+        'stddev': round(variance ** 0.5, 6)
+    }
+
+
+class BedMeshService:
+    """GoKlipper default bed mesh, exposed as Klipper bed_mesh status objects
+
+    The mesh is read from printer_mutable.cfg through the shared file cache and
+    converted once per file change. Changes are pushed to status subscribers.
+    """
+
+    OBJECT_NAMES = ('bed_mesh', 'bed_mesh default', 'bed_mesh "default"')
+
+    def __init__(self, files: CachedFileRegistry, path: str = PRINTER_MUTABLE_CONFIG_PATH, on_change: Callable[[dict], None] = None):
+        self.files = files
+        self.path = path
+        self.on_change = on_change
+
+        self._config = None
+        self._status = self._build_status(None)
+        self._mesh_map = None
+
+        self.files.subscribe(path, self._on_config_changed)
+
+    @staticmethod
+    def _build_status(mesh: Optional[dict]) -> Dict[str, dict]:
+        status = { name: {} for name in BedMeshService.OBJECT_NAMES }
+        if mesh is None:
+            return status
+
+        points = json.loads("[[" + mesh.get('points').replace("\n", "], [") + "]]")
+        mesh_params = {
+            "min_x": float(mesh["min_x"]),
+            "max_x": float(mesh["max_x"]),
+            "min_y": float(mesh["min_y"]),
+            "max_y": float(mesh["max_y"]),
+            "x_count": int(mesh["x_count"]),
+            "y_count": int(mesh["y_count"]),
+            "mesh_x_pps": int(mesh["mesh_x_pps"]),
+            "mesh_y_pps": int(mesh["mesh_y_pps"]),
+            "tension": float(mesh["tension"]),
+            "algo": mesh["algo"]
+        }
+
+        status['bed_mesh'] = {
+            "profile_name": "default",
+            "mesh_min": (mesh_params["min_x"], mesh_params["min_y"]),
+            "mesh_max": (mesh_params["max_x"], mesh_params["max_y"]),
+            "probed_matrix": points,
+            "mesh_matrix": build_mesh_matrix(points, mesh_params),
+            "mesh_stats": get_mesh_statistics(points)
+        }
+        status['bed_mesh default'] = {
+            "points": points,
+            "mesh_params": mesh_params
+        }
+        return status
+
+    def _refresh(self, config) -> bool:
+        if config is self._config:
+            return False
+        self._config = config
+
+        mesh = config.get('bed_mesh default') if isinstance(config, dict) else None
+        try:
+            self._status = self._build_status(mesh)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            logging.exception('[Kobra] Failed to parse bed mesh')
+            self._status = self._build_status(None)
+        self._mesh_map = None
+        return True
+
+    def _on_config_changed(self, config):
+        if self._refresh(config) and self.on_change:
+            self.on_change(self._status)
+
+    def get_status(self) -> Dict[str, dict]:
+        self._refresh(self.files.get(self.path))
+        return self._status
+
+    def get_mesh_map(self) -> Optional[str]:
+        status = self.get_status()['bed_mesh']
+        if not status:
+            return None
+        if self._mesh_map is None:
+            self._mesh_map = "mesh_map_output " + json.dumps({
+                "mesh_min": status["mesh_min"],
+                "mesh_max": status["mesh_max"],
+                "z_positions": status["probed_matrix"]
+            })
+        return self._mesh_map
+
+
+class KobraMqttSession:
+    """Long-lived connection to the local gkapi MQTT broker
+
+    Paho runs its network loop in a background thread, print requests are
+    correlated with their print/report replies through asyncio futures
+    """
+
+    def __init__(self, aioloop, model_id, device_id, username, password, host = '127.0.0.1', port = 2883, client_factory = None):
+        self.aioloop = aioloop
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.client_factory = client_factory or (lambda: paho.Client(protocol = paho.MQTTv5))
+
+        self.print_topic = f'anycubic/anycubicCloud/v1/slicer/printer/{model_id}/{device_id}/print'
+        self.report_topic = f'anycubic/anycubicCloud/v1/printer/public/{model_id}/{device_id}/print/report'
+
+        self.client = None
+        self.connected = False
+        self.connect_count = 0
+        self.last_connected = None
+        self.last_disconnected = None
+        self.last_report = None
+        self._connected_event = asyncio.Event()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def start(self):
+        if self.client is not None:
+            return
+
+        self.client = self.client_factory()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.username_pw_set(self.username, self.password)
+        self.client.reconnect_delay_set(min_delay = 1, max_delay = 30)
+        self.client.connect_async(self.host, self.port)
+        self.client.loop_start()
+
+    def stop(self):
+        if self.client is None:
+            return
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.client = None
+        self._set_connected(False)
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    async def request_print(self, print_request: dict, timeout: float = 30) -> dict:
+        self.start()
+
+        deadline = self.aioloop.time() + timeout
+        await asyncio.wait_for(self._connected_event.wait(), timeout)
+
+        msgid = print_request['msgid']
+        future = self.aioloop.create_future()
+        self._pending[msgid] = future
+        try:
+            self.client.publish(self.print_topic, payload = json.dumps(print_request), qos = 1)
+            return await asyncio.wait_for(future, max(deadline - self.aioloop.time(), 0))
+        finally:
+            # Timed out or cancelled requests must not take later reports
+            if self._pending.get(msgid) is future:
+                del self._pending[msgid]
+
+    def get_health(self):
+        return {
+            'connected': self.connected,
+            'connect_count': self.connect_count,
+            'last_connected': self.last_connected,
+            'last_disconnected': self.last_disconnected,
+            'last_report': self.last_report,
+            'pending_requests': len(self._pending)
+        }
+
+    # Paho callbacks, called from the network thread
+    def _on_connect(self, client, userdata, flags, reason_code, properties = None):
+        if getattr(reason_code, 'is_failure', reason_code != 0):
+            logging.warning(f'[Kobra] MQTT connection refused: {reason_code}')
+            return
+        client.subscribe(self.report_topic)
+        self.aioloop.call_soon_threadsafe(self._set_connected, True)
+
+    def _on_disconnect(self, client, userdata, *args):
+        self.aioloop.call_soon_threadsafe(self._set_connected, False)
+
+    def _on_message(self, client, userdata, msg):
+        logging.debug('[Kobra] Received MQTT print report: %s', msg.payload)
+        try:
+            report = json.loads(msg.payload)
+        except ValueError:
+            logging.warning(f'[Kobra] Invalid MQTT print report: {msg.payload}')
+            return
+        self.aioloop.call_soon_threadsafe(self._resolve_report, report)
+
+    # Event loop side
+    def _set_connected(self, connected: bool):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected:
+            self.connect_count += 1
+            self.last_connected = time.time()
+            self._connected_event.set()
+            logging.info('[Kobra] Connected to MQTT broker')
+        else:
+            self.last_disconnected = time.time()
+            self._connected_event.clear()
+            logging.info('[Kobra] Disconnected from MQTT broker')
+
+    def _resolve_report(self, report: dict):
+        self.last_report = time.time()
+
+        # Match the originating request when the report echoes its msgid, otherwise the oldest one still waiting
+        future = self._pending.pop(report.get('msgid'), None)
+        if future is None:
+            for msgid in list(self._pending):
+                future = self._pending.pop(msgid)
+                if not future.done():
+                    break
+            else:
+                return
+
+        if not future.done():
+            future.set_result(report)
 
 
 class Kobra:
@@ -43,20 +1140,85 @@ class Kobra:
     MQTT_USERNAME = None
     MQTT_PASSWORD = None
 
-    # MQTT states
-    mqtt_print_report = False
-    mqtt_print_error = None
+    environment: RinkhalsEnvironment = None
+
+    # MQTT session
+    mqtt: KobraMqttSession = None
 
     # Cache
-    _goklipper_next_check = 0
-    _goklipper_pid = None
-    _remote_mode_next_check = 0
+    goklipper: GoKlipperWatcher = None
+    files: CachedFileRegistry = None
     _remote_mode = None
     _total_layer = 0
-    _states_cache = []
+    _states_cache: Dict[str, str] = {}
+
+    # Kobra print states as seen by Moonraker
+    KOBRA_STATES = {
+        'heating': 'printing',
+        'leveling': 'printing',
+        'resonance': 'printing',
+        'onpause': 'paused'
+    }
+
+    # Objects always reported by GoKlipper, config derived ones are appended
+    OBJECTS_LIST_BASE = [
+        "motion_report",
+        "gcode_macro t0",
+        "gcode_macro t1",
+        "gcode_macro t2",
+        "gcode_macro t3",
+        "configfile",
+        "heaters",
+        "respond",
+        "display_status",
+        "gcode_move",
+        "pause_resume",
+        "pause_resume/cancel",
+        "print_stats",
+        "toolhead",
+        "verify_heater extrude",
+        "verify_heater heater_bed",
+        "virtual_sdcard",
+        "webhooks",
+        "bed_mesh",
+        "bed_mesh default",
+        "bed_mesh \"default\"",
+        "idle_timeout"
+    ]
+    OBJECTS_LIST_FALLBACK = [ "extruder", "fan", "heater_bed", "mcu", "mcu nozzle_mcu", "ota_filament_hub" ]
+    OBJECTS_LIST_FALLBACK_KS1 = [ "fan_generic air_filter_fan", "fan_generic box_fan" ]
+    _objects_list: asyncio.Future = None
+    bed_mesh: BedMeshService = None
+
+    metrics: KobraMetrics
+    status_metrics: bool = False
+    queries: SingleFlight
+    interceptors: KlippyInterceptors
+
+    # Request interceptor orders, the lowest being the outermost
+    ORDER_OBJECTS_QUERY = 10
+    ORDER_OBJECTS_LIST = 20
+    ORDER_MAINSAIL = 20
+    ORDER_BED_MESH = 30
+    ORDER_GCODE = 40
+    ORDER_STATUS = 90
+
+    # Power devices for the printer lights, per model
+    LIGHTS = {
+        'K3': {
+            'camera_light': { 'method': 'Led/SetCameraLed', 'param': 'enable', 'v4l2_device': '/dev/video10' },
+            'head_light': { 'method': 'led/set_led', 'param': 'S' }
+        },
+        'KS1': {
+            'chamber_light': { 'method': 'led/set_led', 'param': 'S' }
+        }
+    }
+    uds: GoKlipperClient = None
 
     # GCode handlers
     gcode_handlers: dict[str, FlexCallback] = {}
+    gcode_router: GCodeRouter = GCodeRouter(gcode_handlers)
+    object_patchers: Dict[str, List[Callable[[dict, dict], None]]] = {}
     status_patchers: List[Callable[[dict], dict]] = []
     print_data_patchers: List[Callable[[dict], dict]] = []
 
@@ -64,23 +1226,34 @@ class Kobra:
         self.server = config.get_server()
         self.power = self.server.load_component(self.server.config, 'power')
 
-        # Extract environment values from the printer
-        try:
-            environment = shell(f'. /useremain/rinkhals/.current/tools.sh && python -c "import os, json; print(json.dumps(dict(os.environ)))"')
-            environment = json.loads(environment)
+        self.tracer = KobraTracer(
+            sample_rate = config.getfloat('trace_sample_rate', 0.0, minval=0.0, maxval=1.0),
+            buffer_size = config.getint('trace_buffer_size', 100, minval=1)
+        )
+        self.server.register_endpoint('/server/kobra/trace', ['GET', 'POST'], self._handle_trace_request)
+        self.server.register_endpoint('/server/kobra/mqtt', ['GET'], self._handle_mqtt_request)
+
+        self.metrics = KobraMetrics()
+        self.status_metrics = config.getboolean('status_metrics', False)
+        self.interceptors = KlippyInterceptors()
+        self.queries = SingleFlight(ttl = config.getfloat('query_cache_ttl', 0.1, minval=0.0))
+        self.server.register_endpoint('/server/kobra/metrics', ['GET'], self._handle_metrics_request, transports=['http'], wrap_result=False, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+        self.files = CachedFileRegistry(self.server.get_event_loop())
+        self.files.register(KOBRA_REMOTE_MODE_PATH, lambda content: content.strip(), self._on_remote_mode_changed)
+        self.files.register(PRINTER_MUTABLE_CONFIG_PATH, json.loads)
+        self.files.register(PRINTER_GENERATED_CONFIG_PATH, parse_printer_config)
+
+        self.server.register_notification('kobra:goklipper_state_changed')
+        self.goklipper = GoKlipperWatcher(self.server)
+        self.goklipper.start()
+        self.uds = GoKlipperClient()
 
-            self.KOBRA_MODEL_ID = environment['KOBRA_MODEL_ID']
-            self.KOBRA_MODEL_CODE = environment['KOBRA_MODEL_CODE']
-            self.KOBRA_DEVICE_ID = environment['KOBRA_DEVICE_ID']
-            
-            def load_tool_function(function_name):
-                def tool_function(*args):
-                    return shell(f'. /useremain/rinkhals/.current/tools.sh && {function_name} ' + ' '.join([ str(a) for a in args ]))
-                return tool_function
-            
-            self.get_app_property = load_tool_function('get_app_property')
-        except:
-            pass
+        # Extract environment values from the printer
+        self.environment = RinkhalsEnvironment()
+        self.KOBRA_MODEL_ID = self.environment.KOBRA_MODEL_ID or None
+        self.KOBRA_MODEL_CODE = self.environment.KOBRA_MODEL_CODE or None
+        self.KOBRA_DEVICE_ID = self.environment.KOBRA_DEVICE_ID or None
 
         if os.path.isfile('/userdata/app/gk/config/device_account.json'):
             with open('/userdata/app/gk/config/device_account.json', 'r') as f:
@@ -88,6 +1261,9 @@ class Kobra:
                 data = json.loads(json_data)
                 self.MQTT_USERNAME = data['username']
                 self.MQTT_PASSWORD = data['password']
+
+        if self.KOBRA_MODEL_ID and self.KOBRA_DEVICE_ID and self.MQTT_USERNAME and self.MQTT_PASSWORD:
+            self.mqtt = KobraMqttSession(self.server.get_event_loop().aioloop, self.KOBRA_MODEL_ID, self.KOBRA_DEVICE_ID, self.MQTT_USERNAME, self.MQTT_PASSWORD)
         
         # Monkey patch Moonraker for Kobra
         logging.info('Starting Kobra patching...')
@@ -102,99 +1278,87 @@ class Kobra:
         self.patch_objects_list()
         self.patch_mainsail()
         self.patch_k2p_bug()
+        self.patch_objects_query()
 
         logging.info('Completed Kobra patching! Yay!')
 
         # Trigger LAN mode warning if needed
         self.get_remote_mode()
 
-    async def component_init(self):
-
-        if self.KOBRA_MODEL_CODE == 'K3':
-            # Add camera and head lights power devices
-            config = self.server.config.read_supplemental_dict({
-                'power camera_light': {
-                    'type': 'shell',
-                    'power_on_command': "v4l2-ctl -d /dev/video10 -c gain=1 2>/dev/null || printf '{\"method\":\"Led/SetCameraLed\",\"params\":{\"enable\":1},\"id\":37}\x03' | socat -t0 -,ignoreeof UNIX-CONNECT:/tmp/unix_uds1,escape=0x03",
-                    'power_off_command': "v4l2-ctl -d /dev/video10 -c gain=0 2>/dev/null || printf '{\"method\":\"Led/SetCameraLed\",\"params\":{\"enable\":0},\"id\":37}\x03' | socat -t0 -,ignoreeof UNIX-CONNECT:/tmp/unix_uds1,escape=0x03",
-                    'get_state_command': "v4l2-ctl -d /dev/video10 -C gain | awk '{print $2}'",
-                    'default_state': 'on'
-                },
-                'power head_light': {
-                    'type': 'shell',
-                    'power_on_command': "printf '{\"method\":\"led/set_led\",\"params\":{\"S\":1},\"id\":37}\x03' | socat -t0 -,ignoreeof UNIX-CONNECT:/tmp/unix_uds1,escape=0x03",
-                    'power_off_command': "printf '{\"method\":\"led/set_led\",\"params\":{\"S\":0},\"id\":37}\x03' | socat -t0 -,ignoreeof UNIX-CONNECT:/tmp/unix_uds1,escape=0x03",
-                    'default_state': 'on'
-                }
-            })
-
-            await self.power.add_device('camera_light', ShellPowerDevice(config.getsection('power camera_light')))
-            await self.power.add_device('head_light', ShellPowerDevice(config.getsection('power head_light')))
-
-        elif self.KOBRA_MODEL_CODE == 'KS1':
-            # Add camera and head lights power devices
-            config = self.server.config.read_supplemental_dict({
-                'power chamber_light': {
-                    'type': 'shell',
-                    'power_on_command': "printf '{\"method\":\"led/set_led\",\"params\":{\"S\":1},\"id\":37}\x03' | socat -t0 -,ignoreeof UNIX-CONNECT:/tmp/unix_uds1,escape=0x03",
-                    'power_off_command': "printf '{\"method\":\"led/set_led\",\"params\":{\"S\":0},\"id\":37}\x03' | socat -t0 -,ignoreeof UNIX-CONNECT:/tmp/unix_uds1,escape=0x03",
-                    'default_state': 'on'
-                }
-            })
+    async def _handle_trace_request(self, web_request):
+        # GET only reads the trace, changes require a POST
+        update = web_request.get_action() == 'POST'
+        if update:
+            sample_rate = web_request.get_float('sample_rate', None)
+            if sample_rate is not None:
+                self.tracer.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+        entries = self.tracer.get_entries()
+        if update and web_request.get_boolean('clear', False):
+            self.tracer.clear()
+
+        return {
+            'sample_rate': self.tracer.sample_rate,
+            'buffer_size': self.tracer.entries.maxlen,
+            'entries': entries
+        }
 
-            await self.power.add_device('chamber_light', ShellPowerDevice(config.getsection('power chamber_light')))
+    async def _handle_metrics_request(self, web_request):
+        return self.metrics.render() + self.interceptors.render()
 
+    async def _handle_mqtt_request(self, web_request):
+        if not self.mqtt:
+            return { 'enabled': False }
+        return { 'enabled': True, **self.mqtt.get_health() }
 
-    def is_goklipper_running(self):
-        if time.time() < self._goklipper_next_check:
-            return self._goklipper_pid != None
+    async def close(self):
+        if self.mqtt:
+            self.mqtt.stop()
+        await self.uds.close()
+        self.goklipper.close()
+        self.files.close()
 
-        if self._goklipper_pid != None:
-            try:
-                os.kill(self._goklipper_pid, 0)
-            except:
-                logging.info(f'[Kobra] GoKlipper (PID: {self._goklipper_pid}) died')
-                self._goklipper_pid = None
+    async def component_init(self):
+        if self.is_using_mqtt():
+            self.mqtt.start()
 
-        if not self._goklipper_pid:
-            self._goklipper_pid = subprocess.check_output(['sh', '-c', "ps | grep gklib | grep -v grep | head -n 1 | awk '{print $1}'"])
-            self._goklipper_pid = self._goklipper_pid.decode('utf-8').strip()
-            self._goklipper_pid = int(self._goklipper_pid) if self._goklipper_pid else None
-            if self._goklipper_pid:
-                logging.info(f'[Kobra] Found GoKlipper process (PID: {self._goklipper_pid})')
+        lights = self.LIGHTS.get(self.KOBRA_MODEL_CODE, {})
+        if lights:
+            config = self.server.config.read_supplemental_dict({ f'power {name}': { 'type': 'goklipper', 'default_state': 'on', **options } for name, options in lights.items() })
+            for name in lights:
+                await self.power.add_device(name, GoKlipperPowerDevice(config.getsection(f'power {name}'), self.uds))
 
-        self._goklipper_next_check = time.time() + 5
-        return self._goklipper_pid != None
+    def is_goklipper_running(self):
+        return self.goklipper.running
 
     def get_remote_mode(self):
-        if time.time() < self._remote_mode_next_check:
-            return self._remote_mode
-
-        if os.path.isfile('/useremain/dev/remote_ctrl_mode'):
-            with open('/useremain/dev/remote_ctrl_mode', 'r') as f:
-                remote_mode = f.read().strip()
-            if remote_mode != self._remote_mode:
-                logging.info(f'[Kobra] Remote control mode is: {self._remote_mode}')
-                if remote_mode != 'lan':
-                    self.server.add_warning(f'Your Kobra printer is not in LAN mode, prints won\'t be shown on the printer screen', warn_id='kobra_lan_mode')
-                else:
-                    self.server.remove_warning('kobra_lan_mode')
-            self._remote_mode = remote_mode
+        remote_mode = self.files.get(KOBRA_REMOTE_MODE_PATH)
+        if remote_mode != self._remote_mode:
+            self._on_remote_mode_changed(remote_mode)
+        return remote_mode
 
-        self._remote_mode_next_check = time.time() + 5
-        return self._remote_mode
+    def _on_remote_mode_changed(self, remote_mode):
+        if remote_mode is None or remote_mode == self._remote_mode:
+            return
+
+        logging.info(f'[Kobra] Remote control mode is: {remote_mode}')
+        if remote_mode != 'lan':
+            self.server.add_warning(f'Your Kobra printer is not in LAN mode, prints won\'t be shown on the printer screen', warn_id='kobra_lan_mode')
+        else:
+            self.server.remove_warning('kobra_lan_mode')
+        self._remote_mode = remote_mode
 
     def is_using_mqtt(self):
-        if not self.KOBRA_MODEL_ID or not self.KOBRA_DEVICE_ID or not self.MQTT_USERNAME or not self.MQTT_PASSWORD:
+        if not self.mqtt:
             return False
         return self.get_remote_mode() == 'lan'
 
-    def mqtt_print_file(self, file):
+    async def mqtt_print_file(self, file):
         logging.info(f'Trying to print {file} using MQTT...')
 
-        auto_leveling = self.get_app_property('40-moonraker', 'mqtt_print_auto_leveling').lower() == 'true'
-        vibration_compensation = self.get_app_property('40-moonraker', 'mqtt_print_vibration_compensation').lower() == 'true'
-        flow_calibration = self.get_app_property('40-moonraker', 'mqtt_print_flow_calibration').lower() == 'true'
+        auto_leveling = self.environment.get_app_property('40-moonraker', 'mqtt_print_auto_leveling').lower() == 'true'
+        vibration_compensation = self.environment.get_app_property('40-moonraker', 'mqtt_print_vibration_compensation').lower() == 'true'
+        flow_calibration = self.environment.get_app_property('40-moonraker', 'mqtt_print_flow_calibration').lower() == 'true'
 
         print_request = {
             'type': 'print',
@@ -222,132 +1386,114 @@ class Kobra:
 
         logging.info(f'[Kobra] print data : {json.dumps(print_data)}')
 
-        payload = json.dumps(print_request)
-        
-        # payload = f"""{{
-        #     "type": "print",
-        #     "action": "start",
-        #     "msgid": "{uuid.uuid4()}",
-        #     "timestamp": {round(time.time() * 1000)},
-        #     "data": {{
-        #         "taskid": "-1",
-        #         "filename": "{file}",
-        #         "filetype": 1,
-        #         "task_settings": {{
-        #             "auto_leveling": {'1' if auto_leveling else '0'},
-        #             "vibration_compensation": {'1' if vibration_compensation else '0'},
-        #             "flow_calibration": {'1' if flow_calibration else '0'}
-        #         }}
-        #     }}
-        # }}"""
-
-        self.mqtt_print_report = False
-        self.mqtt_print_error = None
-
-        def mqtt_on_connect(client, userdata, flags, reason_code, properties):
-            client.subscribe(f'anycubic/anycubicCloud/v1/printer/public/{self.KOBRA_MODEL_ID}/{self.KOBRA_DEVICE_ID}/print/report')
-            client.publish(f'anycubic/anycubicCloud/v1/slicer/printer/{self.KOBRA_MODEL_ID}/{self.KOBRA_DEVICE_ID}/print', payload=payload, qos=1)
-
-        def mqtt_on_message(client, userdata, msg):
-            logging.debug(f'Received MQTT print report: {str(msg.payload)}')
-
-            payload = json.loads(msg.payload)
-            state = str(payload['state'])
+        error = None
+        try:
+            report = await self.mqtt.request_print(print_request, timeout = 30)
+
+            state = str(report.get('state'))
             logging.info(f'Received MQTT print state: {state}')
 
             if state == 'failed' or state == 'stoped': # not 'heating', not 'printing', not 'leveling'
-                code = payload.get('code')
+                code = report.get('code')
                 if code and code == 10107:
-                    message = 'Filament broken. Please load new filament. (code 10107)'
+                    error = 'Filament broken. Please load new filament. (code 10107)'
                 else:
-                    message = str(payload['msg']) + (f' (code {code})' if code else '')
-                self.mqtt_print_error = message
-
-            self.mqtt_print_report = True
+                    error = str(report.get('msg')) + (f' (code {code})' if code else '')
+        except asyncio.TimeoutError:
+            error = f'Timeout while trying to print {file}'
 
-        client = paho.Client(protocol = paho.MQTTv5)
-        client.on_connect = mqtt_on_connect
-        client.on_message = mqtt_on_message
-
-        client.username_pw_set(self.MQTT_USERNAME, self.MQTT_PASSWORD)
-        client.connect('127.0.0.1', 2883)
-
-        timeout = time.time() + 30
-        while not self.mqtt_print_report:
-            if time.time() > timeout:
-                self.mqtt_print_error = f'Timeout while trying to print {file}'
-                break
-            client.loop(timeout = 0.25)
-
-        client.disconnect()
-
-        if self.mqtt_print_error:
-            message = f'Error while trying to print: {str(self.mqtt_print_error)}'
+        if error:
+            message = f'Error while trying to print: {error}'
             logging.error(message)
             raise self.server.error(message)
 
-
     def patch_status(self, status):
-        if self.is_goklipper_running():
+        # Payloads travel through several hooked methods, only patch them once
+        if type(status) is PatchedStatus:
+            return status
+        status = PatchedStatus(status)
 
-            if 'print_stats' in status:
-                if 'state' in status['print_stats']: 
-                    # Convert Kobra state
-                    state = status['print_stats']['state']
-                    logging.info(f'[Kobra] Converted Kobra state {state}')
-
-                    if state.lower() == 'heating':
-                        state = 'printing'
-                    if state.lower() == 'leveling':
-                        state = 'printing'
-                    if state.lower() == 'resonance':
-                        state = 'printing'
-                    if state.lower() == 'onpause':
-                        state = 'paused'
-
-                    # Ensures same string memory location for Moonraker job_state check (https://github.com/jbatonnet/Rinkhals/issues/118#issuecomment-2980916709)
-                    if state not in self._states_cache:
-                        self._states_cache.append(state)
-                    state = [ s for s in self._states_cache if s == state ][0]
-
-                    status['print_stats']['state'] = state
-
-                    # Inject in 'idle_timeout' for Fluidd
-                    if 'idle_timeout' not in status:
-                        status['idle_timeout'] = {}
-
-                    status['idle_timeout']['state'] = state
-
-                if 'filename' in status['print_stats']:
-                    # Remove path prefix from filename
-                    status['print_stats']['filename'] = status['print_stats']['filename'].replace('/useremain/app/gk/gcodes/', '')
-
-            if 'virtual_sdcard' in status:
-                if 'total_layer' in status['virtual_sdcard']:
-                    # Save layer count for later
-                    self._total_layer = status['virtual_sdcard']['total_layer']
-                
-                if 'current_layer' in status['virtual_sdcard']:
-                    current_layer = status['virtual_sdcard']['current_layer']
+        # Status patching timings are opt-in, keep the default path free of them
+        if not self.status_metrics:
+            self._patch_objects(status)
+            for patcher in self.status_patchers:
+                status = patcher(status)
+            return status
 
-                    # Inject current and total layer count in 'info' for Mainsail / Fluidd
-                    if 'print_stats' not in status:
-                        status['print_stats'] = {}
-                    if 'info' not in status['print_stats']:
-                        status['print_stats']['info'] = {}
+        metrics = self.metrics
+        start = time.perf_counter()
 
-                    status['print_stats']['info']['current_layer'] = current_layer
-                    status['print_stats']['info']['total_layer'] = self._total_layer
-                
-                if 'file_path' in status['virtual_sdcard']:
-                    # Remove path prefix from file path
-                    status['virtual_sdcard']['file_path'] = status['virtual_sdcard']['file_path'].replace('/useremain/app/gk/gcodes/', '')
+        self._patch_objects(status)
 
         for patcher in self.status_patchers:
+            patcher_start = time.perf_counter()
             status = patcher(status)
+            metrics.get_patcher_histogram(patcher).observe(time.perf_counter() - patcher_start)
+
+        metrics.status_patch_duration.observe(time.perf_counter() - start)
+        try:
+            metrics.status_payload_fields.observe(sum(map(len, status.values())))
+        except TypeError:
+            pass
 
         return status
 
+    def _patch_objects(self, status):
+        if self.is_goklipper_running():
+            for name, patchers in self.object_patchers.items():
+                value = status.get(name)
+                if value is not None:
+                    for patcher in patchers:
+                        patcher(status, value)
+
+    def _patch_print_stats(self, status, print_stats):
+        state = print_stats.get('state')
+        if state is not None:
+            # Convert Kobra state
+            state = self.KOBRA_STATES.get(state.lower(), state)
+
+            # Ensures same string memory location for Moonraker job_state check (https://github.com/jbatonnet/Rinkhals/issues/118#issuecomment-2980916709)
+            state = self._states_cache.setdefault(state, state)
+
+            print_stats['state'] = state
+
+            # Inject in 'idle_timeout' for Fluidd
+            idle_timeout = status.get('idle_timeout')
+            if idle_timeout is None:
+                idle_timeout = status['idle_timeout'] = {}
+
+            idle_timeout['state'] = state
+
+        filename = print_stats.get('filename')
+        if filename:
+            # Remove path prefix from filename
+            print_stats['filename'] = filename.replace(KOBRA_GCODES_PATH, '')
+
+    def _patch_virtual_sdcard(self, status, virtual_sdcard):
+        if 'total_layer' in virtual_sdcard:
+            # Save layer count for later
+            self._total_layer = virtual_sdcard['total_layer']
+
+        if 'current_layer' in virtual_sdcard:
+            # Inject current and total layer count in 'info' for Mainsail / Fluidd
+            print_stats = status.get('print_stats')
+            if print_stats is None:
+                print_stats = status['print_stats'] = {}
+            info = print_stats.get('info')
+            if info is None:
+                info = print_stats['info'] = {}
+
+            info['current_layer'] = virtual_sdcard['current_layer']
+            info['total_layer'] = self._total_layer
+
+        file_path = virtual_sdcard.get('file_path')
+        if file_path:
+            # Remove path prefix from file path
+            virtual_sdcard['file_path'] = file_path.replace(KOBRA_GCODES_PATH, '')
+
+    def register_object_patcher(self, name: str, patcher: Callable[[dict, dict], None]):
+        self.object_patchers.setdefault(name, []).append(patcher)
+
     def register_status_patcher(self, patcher: Callable[[dict], dict]):
         self.status_patchers.append(patcher)
 
@@ -360,6 +1506,11 @@ class Kobra:
 
         logging.info('> Hooking status change...')
 
+        self.object_patchers = {
+            'print_stats': [ self._patch_print_stats ],
+            'virtual_sdcard': [ self._patch_virtual_sdcard ]
+        }
+
         def wrap__send_klippy_request(original__send_klippy_request):
             async def _send_klippy_request(me, method, params, default = Sentinel.MISSING, transport = None):
                 result = await original__send_klippy_request(me, method, params, default, transport)
@@ -384,6 +1535,7 @@ class Kobra:
 
         def wrap__process_status_update(original__process_status_update):
             def _process_status_update(me, eventtime, status):
+                self.metrics.count_status_update()
                 status = self.patch_status(status)
                 return original__process_status_update(me, eventtime, status)
             return _process_status_update
@@ -407,23 +1559,33 @@ class Kobra:
         setattr(KlippyRequest, 'set_result', wrap_set_result(KlippyRequest.set_result))
         logging.debug(f'  After: {KlippyRequest.set_result}')
         
-        def wrap_request(original_request):
-            async def request(me, web_request: WebRequest) -> Any:
-                rpc_method = web_request.get_endpoint()
-                logging.warning(f'Wrap request method: {rpc_method}')
-                result = await original_request(me, web_request)
-                logging.warning(f'Wrap request method {rpc_method} result type: {type(result)}')
-                if result and isinstance(result, dict):
-                    logging.warning(f'Wrap request method {rpc_method} result: {json.dumps(result)}')
+        async def intercept_request(web_request: WebRequest, call_next) -> Any:
+            sampled = self.tracer.is_sampled()
+            # Interceptors may rewrite the arguments in place, keep them as received
+            args = copy.deepcopy(web_request.get_args()) if sampled else None
+            result = error = None
+            start = time.time()
+            try:
+                result = await call_next(web_request)
                 if result and isinstance(result, dict) and 'status' in result:
                     result['status'] = self.patch_status(result['status'])
-                    logging.warning(f'Wrap request method {rpc_method} result status: {json.dumps(result)}')
                 return result
-            return request
-
-        logging.debug(f'  Before: {KlippyConnection.request}')
-        setattr(KlippyConnection, 'request', wrap_request(KlippyConnection.request))
-        logging.debug(f'  After: {KlippyConnection.request}')
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                duration = time.time() - start
+                self.metrics.observe('kobra_klippy_request_duration_seconds', duration, web_request.get_endpoint())
+                self.tracer.record(
+                    web_request.get_endpoint(),
+                    start,
+                    duration,
+                    args,
+                    result if sampled else None,
+                    error
+                )
+
+        self.register_request_interceptor(None, intercept_request, order=self.ORDER_STATUS, name='status')
 
     def patch_network_interfaces(self):
         from .machine import Machine
@@ -473,82 +1635,46 @@ class Kobra:
         setattr(Server, 'get_klippy_info', wrap_get_klippy_info(Server.get_klippy_info))
         logging.debug(f'  After: {Server.get_klippy_info}')
 
+    def register_request_interceptor(self, endpoint: Optional[str], callback: Callable, order: int = 50, name: Optional[str] = None, method: str = 'request'):
+        from .klippy_connection import KlippyConnection
+
+        logging.info(f'> Registering {method} interceptor {name or callback.__qualname__} for {endpoint or "all endpoints"}...')
+        self.interceptors.register(KlippyConnection, method, endpoint, callback, order, name)
+
     def register_gcode_handler(self, cmd, callback: FlexCallback):
         logging.info(f'> Registering gcode handler for {cmd}...')
-        self.gcode_handlers[cmd.upper()] = callback
+        self.gcode_router.register(cmd, callback)
 
     def patch_gcode_handler(self):
         from .klippy_apis import KlippyAPI
-        from .klippy_connection import KlippyConnection
-
-        async def handle_gcode(me, script, delegate_run_gcode: Callable[[], Coroutine]):
-            parts = [s.strip() for s in shlex.split(script.strip()) if s.strip()]
-            logging.warning(f"hook on gcode received: {json.dumps(parts)}")
-            cmd = parts[0]
-            
-            logging.warning(f"hook on gcode cmd: {cmd}")
-            handlers = self.gcode_handlers.keys()
-            # join handlers
-            handlers = ', '.join(handlers)
-            logging.warning(f"hook on gcode handlers: {handlers}")
-            
-            if cmd in self.gcode_handlers:
-                logging.warning(f"hook on gcode cmd found: {cmd}")
-                args = {}
-                for part in parts[1:]:
-                    if '=' in part:
-                        key, value = part.split('=', 1)
-                        args[key] = value
-                    else:
-                        args[part] = None
-
-                logging.warning(f"hook on gcode args: {json.dumps(args)}")
-                result = await self.gcode_handlers[cmd](args, delegate_run_gcode)
-                result_str = "None" if result is None else "Any"
-                logging.warning(f"hook on gcode result: {result_str}")
-
-                if result is None:
-                    return None
-
-                return await result
-            else:
-                logging.warning(f"hook on gcode cmd not found: {cmd}")
-                return await delegate_run_gcode()
 
-        def wrap_request(original_request: KlippyConnection.request):
-            async def request(me: KlippyConnection, web_request: WebRequest):
-                logging.warning(f"hook on request")
+        async def intercept_gcode_script(web_request: WebRequest, call_next):
+            script = web_request.get_str('script', "")
+            if script:
+                async def delegate_run_gcode(chunk: str):
+                    if chunk is script:
+                        return await call_next(web_request)
 
-                rpc_method = web_request.get_endpoint()
-                if rpc_method == "gcode/script":
+                    chunk_request = copy.copy(web_request)
+                    chunk_request.args = { **web_request.get_args(), 'script': chunk }
+                    return await call_next(chunk_request)
 
-                    script = web_request.get_str('script', "")
-                    if script:
-                        async def delegate_run_gcode():
-                            return await original_request(me, web_request)
+                return await self.gcode_router.route(script, delegate_run_gcode)
 
-                        return await handle_gcode(me, script, delegate_run_gcode)
-
-                return await original_request(me, web_request)
-
-            return request
+            return await call_next(web_request)
 
         def wrap_run_gcode(original_run_gcode: KlippyAPI.run_gcode):
             async def run_gcode(me: KlippyAPI, script: str, default: Any = Sentinel.MISSING):
-                logging.warning(f"hook on run gcode: {script}")
-
-                async def delegate_run_gcode():
-                    return await original_run_gcode(me, script, default)
+                async def delegate_run_gcode(chunk: str):
+                    return await original_run_gcode(me, chunk, default)
 
-                return await handle_gcode(me, script, delegate_run_gcode)
+                return await self.gcode_router.route(script, delegate_run_gcode)
 
             return run_gcode
 
         logging.info('> Adding gcode handler...')
 
-        logging.debug(f'  Before: {KlippyConnection.request}')
-        setattr(KlippyConnection, 'request', wrap_request(KlippyConnection.request))
-        logging.debug(f'  After: {KlippyConnection.request}')
+        self.register_request_interceptor('gcode/script', intercept_gcode_script, order=self.ORDER_GCODE, name='gcode_handler')
 
         logging.debug(f'  Before: {KlippyAPI.run_gcode}')
         setattr(KlippyAPI, 'run_gcode', wrap_run_gcode(KlippyAPI.run_gcode))
@@ -564,7 +1690,7 @@ class Kobra:
                 
                 if filename and self.is_using_mqtt():
                     logging.info(f'[Kobra] MQTT print file: {filename}')
-                    self.mqtt_print_file(filename)
+                    await self.mqtt_print_file(filename)
                     return None
             
             logging.info(f'[Kobra] Not MQTT print file: {filename}')
@@ -574,241 +1700,201 @@ class Kobra:
         self.register_gcode_handler('SDCARD_PRINT_FILE', handle_gcode_print_file)
 
     def patch_bed_mesh(self):
-        from .klippy_connection import KlippyConnection
+        async def intercept_gcode_script(web_request, call_next):
+            if not self.is_goklipper_running():
+                return await call_next(web_request)
 
-        def wrap_request(original_request):
-            async def request(me, web_request):
-                rpc_method = web_request.get_endpoint()
-                if self.is_goklipper_running() and rpc_method == "gcode/script":
-                    script = web_request.get_str('script', "")
-
-                    if script.lower() == "bed_mesh_map" and os.path.isfile("/userdata/app/gk/printer_data/config/printer_mutable.cfg"):
-                        logging.info('[Kobra] Injected bed mesh')
-                        with open("/userdata/app/gk/printer_data/config/printer_mutable.cfg", "r") as f:
-                            config = json.load(f)
-                            mesh = config.get("bed_mesh default")
-                            if not mesh is None:
-                                points = json.loads("[[" + mesh.get('points').replace("\n", "], [") + "]]")
-                                return "mesh_map_output " + json.dumps({
-                                    "mesh_min": (float(mesh.get('min_x')), float(mesh.get('min_y'))),
-                                    "mesh_max": (float(mesh.get('max_x')), float(mesh.get('max_y'))),
-                                    "z_positions": points
-                                })
-                            else:
-                                raise self.server.error("Failed to open mesh")
-                    elif script.lower().startswith("bed_mesh_calibrate"):
-                        logging.info('[Kobra] Injected bed mesh calibration script')
-
-                        bed_temp = 60
-                        extru_temp = 170
-                        extru_end_temp = 140
-
-                        if os.path.isfile('/userdata/app/gk/printer_data/config/printer.generated.cfg'):
-                            with open('/userdata/app/gk/printer_data/config/printer.generated.cfg', 'r') as f:
-                                printer_config = f.read()
-
-                            leviQ3_match = re.search(r'(?:^|\n)\[leviQ3\]((?:.|\n)*?)(?=\n\[|$)', printer_config)
-                            if leviQ3_match:
-                                leviQ3_config = leviQ3_match[0]
-
-                                bed_temp_match = re.search(r'bed_temp\s*:\s*(\d+(?:\.\d+)?)', leviQ3_config)
-                                if bed_temp_match:
-                                    bed_temp = int(bed_temp_match[1])
-                                    logging.info(f'[Kobra] Using leviQ3 bed_temp: {bed_temp}')
-                                extru_temp_match = re.search(r'extru_temp\s*:\s*(\d+(?:\.\d+)?)', leviQ3_config)
-                                if extru_temp_match:
-                                    extru_temp = int(extru_temp_match[1])
-                                    logging.info(f'[Kobra] Using leviQ3 extru_temp: {extru_temp}')
-                                extru_end_temp_match = re.search(r'extru_end_temp\s*:\s*(\d+(?:\.\d+)?)', leviQ3_config)
-                                if extru_end_temp_match:
-                                    extru_end_temp = int(extru_end_temp_match[1])
-                                    logging.info(f'[Kobra] Using leviQ3 extru_end_temp: {extru_end_temp}')
-
-                        calibrate_script = [
-                            'MOVE_HEAT_POS',
-                            f'M140 S{bed_temp}', # Set bed to 60
-                            f'M109 S{extru_temp}', # Wait hotend to 170
-                            f'M190 S{bed_temp}', # Wait bed to 60
-                            'WIPE_ENTER', # Move to wiping position
-                            'WIPE_NOZZLE', # Wipe nozzle
-                            'WIPE_EXIT', # Exit wiping position
-                            f'M109 S{extru_end_temp}', # Wait hotend to 140
-                            'BED_MESH_CALIBRATE',
-                            'TURN_OFF_HEATERS',
-                            'M106 S0', # Set fan speed to 0
-                            'SAVE_CONFIG'
-                        ]
-
-                        if self.KOBRA_MODEL_CODE != 'KS1':
-                            calibrate_script.remove('WIPE_ENTER')
-                            calibrate_script.remove('WIPE_EXIT')
-
-                        web_request.get_args()["script"] = '\n'.join(calibrate_script)
-                    elif script.lower().startswith('bed_mesh_profile'):
-                        name = re.search('save=(\"(?:[^\"]+)\"|(?:[^\s]+))', script.lower())
-                        if name and name[1] != 'default':
-                            message = 'GoKlipper only support one default bed mesh'
-                            logging.error(message)
-                            raise self.server.error(message)
-                
-                    if script.lower() == 'help':
-                        web_request.endpoint = 'gcode/help'
-                        result = await original_request(me, web_request)
-                        result = '\n'.join([ f'// {g}: {result[g]}' for g in result ])
-                        self.server.send_event("server:gcode_response", result)
-                        return None
-
-                return await original_request(me, web_request)
-            return request
-
-        def wrap__request_standard(original__request_standard):
-            async def _request_standard(me, web_request, timeout = None):
-                args = web_request.get_args()
-
-                # Do not send bed_mesh to goklipper, it does not support it
-                want_bed_mesh = False
-                if self.is_goklipper_running():
-                    if 'objects' in args and ('bed_mesh' in args['objects'] or 'bed_mesh default' in args['objects'] or 'bed_mesh \"default\"' in args['objects']):
-                        want_bed_mesh = True
-                        if 'bed_mesh' in args['objects']:
-                            del args['objects']['bed_mesh']
-                        if 'bed_mesh default' in args['objects']:
-                            del args['objects']['bed_mesh default']
-                        if 'bed_mesh \"default\"' in args['objects']:
-                            del args['objects']['bed_mesh \"default\"']
-
-                result = await original__request_standard(me, web_request, timeout)
-
-                # Add bed_mesh, so mainsail will recognize it
-                if want_bed_mesh:
-                    if 'status' not in result:
-                        result['status'] = {}
-
-                    result['status']['bed_mesh'] = {}
-                    result['status']['bed_mesh default'] = {}
-                    result['status']['bed_mesh \"default\"'] = {}
-
-                    if os.path.isfile("/userdata/app/gk/printer_data/config/printer_mutable.cfg"):
-                        with open('/userdata/app/gk/printer_data/config/printer_mutable.cfg', 'r') as f:
-                            config = json.load(f)
-                            mesh = config.get('bed_mesh default')
-                            if not mesh is None:
-                                points = json.loads("[[" + mesh.get('points').replace("\n", "], [") + "]]")
-
-                                result['status']['bed_mesh'] = {
-                                    "profile_name": "default",
-                                    "mesh_min": (float(mesh.get("min_x")), float(mesh.get("min_y"))),
-                                    "mesh_max": (float(mesh.get("max_x")), float(mesh.get("max_y"))),
-                                    "probed_matrix": points,
-                                    "mesh_matrix": points
-                                }
-                                result['status']['bed_mesh default'] = {
-                                    "points": points,
-                                    "mesh_params": {
-                                        "min_x": float(mesh["min_x"]),
-                                        "max_x": float(mesh["max_x"]),
-                                        "min_y": float(mesh["min_y"]),
-                                        "max_y": float(mesh["max_y"]),
-                                        "x_count": int(mesh["x_count"]),
-                                        "y_count": int(mesh["y_count"]),
-                                        "mesh_x_pps": int(mesh["mesh_x_pps"]),
-                                        "mesh_y_pps": int(mesh["mesh_y_pps"]),
-                                        "tension": float(mesh["tension"]),
-                                        "algo": mesh["algo"]
-                                    }
-                                }
-                                #result['status']['bed_mesh \"default\"'] = result['status']['bed_mesh default']
-                return result
-            return _request_standard
+            script = web_request.get_str('script', "")
+
+            if script.lower() == "bed_mesh_map" and self.files.get(PRINTER_MUTABLE_CONFIG_PATH) is not None:
+                logging.info('[Kobra] Injected bed mesh')
+                mesh_map = self.bed_mesh.get_mesh_map()
+                if mesh_map is not None:
+                    return mesh_map
+                else:
+                    raise self.server.error("Failed to open mesh")
+            elif script.lower().startswith("bed_mesh_calibrate"):
+                logging.info('[Kobra] Injected bed mesh calibration script')
+
+                bed_temp = 60
+                extru_temp = 170
+                extru_end_temp = 140
+
+                printer_config = self.files.get(PRINTER_GENERATED_CONFIG_PATH) or {}
+                leviQ3_config = printer_config.get('leviQ3')
+                if leviQ3_config:
+                    if 'bed_temp' in leviQ3_config:
+                        bed_temp = int(float(leviQ3_config['bed_temp']))
+                        logging.info(f'[Kobra] Using leviQ3 bed_temp: {bed_temp}')
+                    if 'extru_temp' in leviQ3_config:
+                        extru_temp = int(float(leviQ3_config['extru_temp']))
+                        logging.info(f'[Kobra] Using leviQ3 extru_temp: {extru_temp}')
+                    if 'extru_end_temp' in leviQ3_config:
+                        extru_end_temp = int(float(leviQ3_config['extru_end_temp']))
+                        logging.info(f'[Kobra] Using leviQ3 extru_end_temp: {extru_end_temp}')
+
+                calibrate_script = [
+                    'MOVE_HEAT_POS',
+                    f'M140 S{bed_temp}', # Set bed to 60
+                    f'M109 S{extru_temp}', # Wait hotend to 170
+                    f'M190 S{bed_temp}', # Wait bed to 60
+                    'WIPE_ENTER', # Move to wiping position
+                    'WIPE_NOZZLE', # Wipe nozzle
+                    'WIPE_EXIT', # Exit wiping position
+                    f'M109 S{extru_end_temp}', # Wait hotend to 140
+                    'BED_MESH_CALIBRATE',
+                    'TURN_OFF_HEATERS',
+                    'M106 S0', # Set fan speed to 0
+                    'SAVE_CONFIG'
+                ]
+
+                if self.KOBRA_MODEL_CODE != 'KS1':
+                    calibrate_script.remove('WIPE_ENTER')
+                    calibrate_script.remove('WIPE_EXIT')
+
+                web_request.get_args()["script"] = '\n'.join(calibrate_script)
+            elif script.lower().startswith('bed_mesh_profile'):
+                name = re.search(r'save=("(?:[^"]+)"|(?:[^\s]+))', script.lower())
+                if name and name[1] != 'default':
+                    message = 'GoKlipper only support one default bed mesh'
+                    logging.error(message)
+                    raise self.server.error(message)
+        
+            if script.lower() == 'help':
+                web_request.endpoint = 'gcode/help'
+                result = await call_next(web_request)
+                result = '\n'.join([ f'// {g}: {result[g]}' for g in result ])
+                self.server.send_event("server:gcode_response", result)
+                return None
+
+            return await call_next(web_request)
+
+        async def intercept_request_standard(web_request, call_next):
+            args = web_request.get_args()
+
+            # Do not send bed_mesh to goklipper, it does not support it
+            want_bed_mesh = False
+            if self.is_goklipper_running():
+                objects = args.get('objects')
+                if objects:
+                    for name in BedMeshService.OBJECT_NAMES:
+                        if name in objects:
+                            want_bed_mesh = True
+                            del objects[name]
+
+            result = await call_next(web_request)
+
+            # Add bed_mesh, so mainsail will recognize it
+            if want_bed_mesh:
+                if 'status' not in result:
+                    result['status'] = {}
+                result['status'].update(self.bed_mesh.get_status())
+            return result
+
+        def push_bed_mesh(status):
+            if not self.is_goklipper_running():
+                return
+            logging.info('[Kobra] Bed mesh changed, pushing update')
+            klippy_connection = self.server.lookup_component('klippy_connection')
+            klippy_connection._process_status_update(self.server.get_event_loop().get_loop_time(), dict(status))
+
+        self.bed_mesh = BedMeshService(self.files, on_change=push_bed_mesh)
 
         logging.info('> Adding Kobra bed mesh support...')
 
-        logging.debug(f'  Before: {KlippyConnection.request}')
-        setattr(KlippyConnection, 'request', wrap_request(KlippyConnection.request))
-        logging.debug(f'  After: {KlippyConnection.request}')
+        self.register_request_interceptor('gcode/script', intercept_gcode_script, order=self.ORDER_BED_MESH, name='bed_mesh')
+        self.register_request_interceptor(None, intercept_request_standard, order=self.ORDER_BED_MESH, name='bed_mesh', method='_request_standard')
+
+    def _build_objects_list(self, macros: List[str]) -> List[str]:
+        objects = list(self.OBJECTS_LIST_BASE)
 
-        logging.debug(f'  Before: {KlippyConnection._request_standard}')
-        setattr(KlippyConnection, '_request_standard', wrap__request_standard(KlippyConnection._request_standard))
-        logging.debug(f'  After: {KlippyConnection._request_standard}')
+        config = self.files.get(PRINTER_GENERATED_CONFIG_PATH)
+        if config:
+            config_objects = get_config_objects(config)
+        else:
+            config_objects = list(self.OBJECTS_LIST_FALLBACK)
+            if self.KOBRA_MODEL_CODE == 'KS1':
+                config_objects += self.OBJECTS_LIST_FALLBACK_KS1
+
+        for name in config_objects:
+            if name not in objects:
+                objects.append(name)
+
+        for gcode in macros:
+            name = f'gcode_macro {gcode}'
+            if name not in objects:
+                objects.append(name)
+
+        return objects
+
+    def invalidate_objects_list(self, *args):
+        self._objects_list = None
 
     def patch_objects_list(self):
-        from .klippy_connection import KlippyConnection
+        async def build_objects_list(web_request, call_next):
+            help_request = copy.copy(web_request)
+            help_request.endpoint = 'gcode/help'
+            macros = await call_next(help_request)
+            logging.info('[Kobra] Built objects list')
+            return self._build_objects_list(macros)
+
+        async def intercept_objects_list(web_request, call_next):
+            if not self.is_goklipper_running():
+                return await call_next(web_request)
+
+            # Concurrent clients share the same gcode/help round-trip
+            objects_list = self._objects_list
+            if objects_list is None:
+                objects_list = self._objects_list = asyncio.ensure_future(build_objects_list(web_request, call_next))
+
+            try:
+                objects = await asyncio.shield(objects_list)
+            except Exception:
+                if self._objects_list is objects_list:
+                    self._objects_list = None
+                raise
 
-        def wrap_request(original_request):
-            async def request(me, web_request):
-                rpc_method = web_request.get_endpoint()
-                if self.is_goklipper_running() and rpc_method == "objects/list":
-                    logging.info('[Kobra] Injected objects list')
-                    
-                    objects = [
-                        "motion_report",
-                        "gcode_macro t0",
-                        "gcode_macro t1",
-                        "gcode_macro t2",
-                        "gcode_macro t3",
-                        "configfile",
-                        "heaters",
-                        "respond",
-                        "display_status",
-                        "extruder",
-                        "fan",
-                        "gcode_move",
-                        "heater_bed",
-                        "mcu",
-                        "mcu nozzle_mcu",
-                        "ota_filament_hub",
-                        "pause_resume",
-                        "pause_resume/cancel",
-                        "print_stats",
-                        "toolhead",
-                        "verify_heater extrude",
-                        "verify_heater heater_bed",
-                        "virtual_sdcard",
-                        "webhooks",
-                        "bed_mesh",
-                        "bed_mesh default",
-                        "bed_mesh \"default\"",
-                        "idle_timeout"
-                    ]
-                    
-                    web_request.endpoint = 'gcode/help'
-                    result = await original_request(me, web_request)
-                    for gcode in result:
-                        objects.append(f"gcode_macro {gcode}")
-                    
-                    if self.KOBRA_MODEL_CODE == 'KS1':
-                        objects.append("fan_generic air_filter_fan")
-                        objects.append("fan_generic box_fan")
-
-                    return { "objects": objects }
-                return await original_request(me, web_request)
-            return request
+            return { "objects": list(objects) }
 
         logging.info('> Patching objects/list call...')
 
-        logging.debug(f'  Before: {KlippyConnection.request}')
-        setattr(KlippyConnection, 'request', wrap_request(KlippyConnection.request))
-        logging.debug(f'  After: {KlippyConnection.request}')
+        # Cached for the lifetime of a Klippy connection and a printer config
+        self.server.register_event_handler('server:klippy_disconnect', self.invalidate_objects_list)
+        self.server.register_event_handler('kobra:goklipper_state_changed', self.invalidate_objects_list)
+        self.files.subscribe(PRINTER_GENERATED_CONFIG_PATH, self.invalidate_objects_list)
 
-    def patch_mainsail(self):
-        from .klippy_connection import KlippyConnection
+        self.register_request_interceptor('objects/list', intercept_objects_list, order=self.ORDER_OBJECTS_LIST, name='objects_list')
 
-        def wrap__request_standard(original__request_standard):
-            async def _request_standard(me, web_request, timeout = None):
-                result = await original__request_standard(me, web_request, timeout)
-                if self.is_goklipper_running() and 'status' in result and 'configfile' in result['status'] and 'config' in result['status']['configfile']:
-                    logging.info('[Kobra] Injected Mainsail macros')
-                    result['status']['configfile']['config']['gcode_macro pause'] = {}
-                    result['status']['configfile']['config']['gcode_macro resume'] = {}
-                    result['status']['configfile']['config']['gcode_macro cancel_print'] = {}
-                return result
-            return _request_standard
+    def patch_mainsail(self):
+        async def intercept_request_standard(web_request, call_next):
+            result = await call_next(web_request)
+            if self.is_goklipper_running() and 'status' in result and 'configfile' in result['status'] and 'config' in result['status']['configfile']:
+                logging.info('[Kobra] Injected Mainsail macros')
+                result['status']['configfile']['config']['gcode_macro pause'] = {}
+                result['status']['configfile']['config']['gcode_macro resume'] = {}
+                result['status']['configfile']['config']['gcode_macro cancel_print'] = {}
+            return result
 
         logging.info('> Patching Mainsail macros...')
 
-        logging.debug(f'  Before: {KlippyConnection._request_standard}')
-        setattr(KlippyConnection, '_request_standard', wrap__request_standard(KlippyConnection._request_standard))
-        logging.debug(f'  After: {KlippyConnection._request_standard}')
+        self.register_request_interceptor(None, intercept_request_standard, order=self.ORDER_MAINSAIL, name='mainsail', method='_request_standard')
+
+    def patch_objects_query(self):
+        async def intercept_objects_query(web_request, call_next):
+            # The key is computed first, inner interceptors may alter the arguments
+            key = json.dumps(web_request.get_args(), sort_keys=True, default=str)
+            result = await self.queries.run(key, lambda: call_next(web_request))
+
+            # Each caller gets its own copy of every object, patchers and callers change them in place
+            if isinstance(result, dict) and isinstance(result.get('status'), dict):
+                status = result['status']
+                objects = { name: dict(value) if isinstance(value, dict) else value for name, value in status.items() }
+                result = { **result, 'status': PatchedStatus(objects) if type(status) is PatchedStatus else objects }
+            return result
+
+        logging.info('> Coalescing identical objects/query requests...')
+
+        self.register_request_interceptor('objects/query', intercept_objects_query, order=self.ORDER_OBJECTS_QUERY, name='objects_query')
 
     def patch_k2p_bug(self):
         from .klippy_apis import KlippyAPI
@@ -830,60 +1916,69 @@ class Kobra:
         logging.debug(f'  After: {KlippyAPI.get_klippy_info}')
 
 
-class ShellPowerDevice(PowerDevice):
-    def __init__(self, config):
+# V4L2 control ioctls, struct v4l2_control { __u32 id; __s32 value; }
+V4L2_CID_GAIN = 0x00980913
+VIDIOC_G_CTRL = 0xC008561B
+VIDIOC_S_CTRL = 0xC008561C
+
+def v4l2_control(device: str, control: int, value: Optional[int] = None) -> Optional[int]:
+    """Reads or writes a V4L2 control, returns None if the device or control is unavailable"""
+    try:
+        fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buffer = bytearray(struct.pack('Ii', control, value or 0))
+        fcntl.ioctl(fd, VIDIOC_G_CTRL if value is None else VIDIOC_S_CTRL, buffer)
+        return struct.unpack('Ii', buffer)[1]
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+class GoKlipperPowerDevice(PowerDevice):
+    """Light toggled through a GoKlipper RPC method, optionally backed by a V4L2 gain control"""
+
+    def __init__(self, config, client: GoKlipperClient):
         super().__init__(config)
-        self.power_on_command = config.get('power_on_command', None)
-        if not self.power_on_command:
-            raise config.error(f"Option 'power_on_command' in section [{config.get_name()}] must be set")
-        self.power_off_command = config.get('power_off_command', None)
-        if not self.power_off_command:
-            raise config.error(f"Option 'power_off_command' in section [{config.get_name()}] must be set")
-        self.get_state_command = config.get('get_state_command', None)
+        self.client = client
+        self.method = config.get('method')
+        self.param = config.get('param', 'S')
+        self.v4l2_device = config.get('v4l2_device', None)
         self.state = config.get('default_state', None)
 
     async def init_state(self):
         await self.refresh_status()
 
     async def refresh_status(self):
-        if not self.get_state_command:
+        if not self.v4l2_device:
             return
 
-        try:
-            command = self.get_state_command
-            result = subprocess.check_output(['sh', '-c', command])
-            result = result.decode('utf-8').strip()
-            logging.debug(f'ShellPowerDevice "{command}" => "{result}"')
-
-            previous_state = self.state
+        gain = v4l2_control(self.v4l2_device, V4L2_CID_GAIN)
+        if gain is None:
+            return
 
-            if result and (result == '1' or str(result).lower() == 'true' or str(result).lower() == 'on'):
-                self.state = 'on'
-            else:
-                self.state = 'off'
+        previous_state = self.state
+        self.state = 'on' if gain else 'off'
 
-            if previous_state != self.state:
-                logging.info(f'ShellPowerDevice {self.name} is now {self.state}')
-                self.notify_power_changed()
-        except:
-            logging.exception(f"ShellPowerDevice error: {self.name}")
+        if previous_state != self.state:
+            logging.info(f'GoKlipperPowerDevice {self.name} is now {self.state}')
+            self.notify_power_changed()
 
     async def set_power(self, state):
-        if not self.get_state_command:
-            self.state = state
+        value = int(state == "on")
 
-        state = int(state == "on")
+        if self.v4l2_device and v4l2_control(self.v4l2_device, V4L2_CID_GAIN, value) is not None:
+            await self.refresh_status()
+            return
 
+        # Like the previous socat command, the request is sent without waiting for a response
         try:
-            command = self.power_on_command if state else self.power_off_command
-            result = subprocess.check_output(['sh', '-c', command])
-            result = result.decode('utf-8').strip()
-            logging.debug(f'ShellPowerDevice "{command}" => "{result}"')
-        except:
-            logging.exception(f"ShellPowerDevice error: {self.name}")
-
-        await self.refresh_status()
-
+            await self.client.notify(self.method, { self.param: value })
+            self.state = state
+        except Exception:
+            logging.exception(f"GoKlipperPowerDevice error: {self.name}")
 
 
 def load_component(config):
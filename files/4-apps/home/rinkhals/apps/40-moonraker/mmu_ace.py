@@ -4,20 +4,24 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import argparse
-import filecmp
+import bisect
+import functools
+import hashlib
 import json
 import ast
 import logging
+import mmap
 import os
 import re
 import asyncio
+import contextlib
 import shutil
 import sys
+import tempfile
 import time
 import traceback
-import tempfile
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from enum import Enum
 from types import NoneType
 
@@ -107,6 +111,14 @@ class MmuMachineStatus:
     num_units: int
     unit_0: MmuUnitStatus
     unit_1: MmuUnitStatus
+    # Units past the second one, reported as unit_2, unit_3... like Happy Hare does
+    extra_units: List[MmuUnitStatus] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        status = asdict(self)
+        for index, unit in enumerate(status.pop("extra_units"), 2):
+            status[f"unit_{index}"] = unit
+        return status
 
 @dataclass
 class MmuToolStatus:
@@ -170,6 +182,9 @@ class MmuAceStatus:
     mmu: MmuStatus
     mmu_machine: MmuMachineStatus
 
+    def to_dict(self) -> dict:
+        return { "mmu": asdict(self.mmu), "mmu_machine": self.mmu_machine.to_dict() }
+
 GATE_UNKNOWN = -1
 GATE_EMPTY = 0
 GATE_AVAILABLE = 1 # Available to load from either buffer or spool
@@ -212,6 +227,11 @@ class MmuAceUnit:
     def get_gates(self):
         return  self.gates
 
+UNIT_UNKNOWN = -1
+
+TOOL_GATE_UNKNOWN = -1
+TOOL_GATE_BYPASS = -2
+
 class MmuAceTool:
     material: str = "Unknown"
     temp: int = -1
@@ -226,11 +246,6 @@ class MmuAcePrintState(Enum):
     PAUSE_LOCKED = 'pause_locked'
     PAUSED = 'paused'
 
-UNIT_UNKNOWN = -1
-
-TOOL_GATE_UNKNOWN = -1
-TOOL_GATE_BYPASS = -2
-
 FILAMENT_POS_UNKNOWN = -1
 FILAMENT_POS_UNLOADED = 0 # Parked in gate
 FILAMENT_POS_HOMED_GATE = 1 # Homed at either gate or gear sensor (currently assumed mutually exclusive sensors)
@@ -425,15 +440,111 @@ def hex_to_rgba(hex: str) -> List[int]:
         return [int(hex[i:i+2], 16) for i in (0, 2, 4, 6)]
     raise ValueError(f"Unsupported color format: {hex}")
 
+# Fields of the MMU status that GoKlipper does not report
+MMU_STATUS_DEFAULTS = {
+    "encoder": None,
+    "toolchange_purge_volume": 0,
+    "last_toolchange": None,
+    "has_bypass": False,
+    "sync_drive": False,
+    "sync_feedback_enabled": False,
+    "clog_detection_enabled": False,
+    "endless_spool_enabled": False,
+    "reason_for_pause": None,
+    "extruder_filament_remaining": -1,
+    "spoolman_support": False,
+    "espooler_active": None,
+    "servo": None,
+    "grip": None,
+}
+
+def build_unit_status(name: str, num_gates: int, first_gate: int) -> MmuUnitStatus:
+    return MmuUnitStatus(
+        name = name,
+        vendor = "Anycubic",
+        version = "1.0",
+        num_gates = num_gates,
+        first_gate = first_gate,
+        selector_type = "VirtualSelector",
+        variable_rotation_distances = False,
+        variable_bowden_lengths = False,
+        require_bowden_move = False,
+        filament_always_gripped = False,
+        has_bypass = False,
+        multi_gear = False,
+    )
+
+@functools.lru_cache(maxsize=32)
+def get_unit_status_snapshot(name: str, num_gates: int, first_gate: int) -> dict:
+    """Unit status as a dict, shared between snapshots and never mutated"""
+    return asdict(build_unit_status(name, num_gates, first_gate))
+
+class MmuAceIndex:
+    """Lookups over the units, gates and tools of an MmuAce model
+
+    gates_by_position follows the unit order, gates_by_index uses the physical
+    gate index reported by the ACE. Tools are listed by TTG map first, then by
+    their own gate index. Gates of an endless spool group are gate positions.
+    """
+
+    def __init__(self, ace: MmuAce):
+        self.units_by_id: Dict[int, MmuAceUnit] = {}
+        self.first_gates: List[int] = []
+        self.gates_by_position: List[tuple[MmuAceUnit, MmuAceGate]] = []
+        self.gates_by_index: Dict[int, tuple[MmuAceUnit, MmuAceGate]] = {}
+        self.tools_by_gate: Dict[int, List[int]] = {}
+        self.gates_by_group: Dict[int, List[int]] = {}
+
+        for unit in ace.units:
+            self.units_by_id.setdefault(unit.id, unit)
+            self.first_gates.append(len(self.gates_by_position))
+            for gate in unit.gates:
+                self.gates_by_position.append((unit, gate))
+                self.gates_by_index.setdefault(getattr(gate, "index", None), (unit, gate))
+
+        for tool_index, gate_index in enumerate(ace.ttg_map):
+            self.tools_by_gate.setdefault(gate_index, []).append(tool_index)
+        for tool_index, tool in enumerate(ace.tools):
+            tools = self.tools_by_gate.setdefault(tool.gate_index, [])
+            if tool_index not in tools:
+                tools.append(tool_index)
+
+        for gate_position, group in enumerate(ace.endless_spool_groups):
+            self.gates_by_group.setdefault(group, []).append(gate_position)
+
 class MmuAceController:
     ace: MmuAce
     server: Any
 
     printer: PrinterController
 
-    def __init__(self, server: Server, host: str | None):
-        self.server = server
-        self.eventloop = self.server.get_event_loop()
+    # Status snapshot, rebuilt when the version moved since it was built
+    status_version: int = 0
+    _snapshot: dict | None = None
+    _snapshot_version: int = -1
+
+    # Last filament_hubs payload, to only reconcile the slots that changed
+    _filament_hubs: List[Dict[str, Any]] | None = None
+
+    # Model lookups, rebuilt with the status version like the snapshot
+    _index: MmuAceIndex | None = None
+    _index_key: tuple | None = None
+
+    # Status updates within this window are sent as one event, 0 coalesces them within an event loop tick
+    status_update_window: float = 0.0
+    _status_update_handle: asyncio.Handle | None = None
+    _status_update_loop: asyncio.AbstractEventLoop | None = None
+    _status_update_batch: int = 0
+    _published_version: int = -1
+
+    # Status updates carry the fields changed since the previous one, numbered by status_seq
+    status_seq: int = 0
+    _published_snapshot: dict | None = None
+
+    def __init__(self, server: Server, host: str | None, status_update_window: float = 0.0):
+        self.server = server
+        self.eventloop = self.server.get_event_loop()
+        self.status_update_window = status_update_window
 
         if host is None:
             self.printer = KlippyPrinterController(self.server)
@@ -472,34 +583,58 @@ class MmuAceController:
         gate.source = slot.get("source", gate.source)
         return gate
 
-    def _iter_gates(self):
-        for unit in self.ace.units:
-            for gate in unit.gates:
-                yield unit, gate
+    def _invalidate_status(self):
+        """Drops the cached snapshot and lookups, called as soon as the model is changed"""
+        self.status_version += 1
+
+    @property
+    def index(self) -> MmuAceIndex:
+        """Lookups over the current model, valid until it is changed"""
+        key = (self.status_version, id(self.ace))
+        if self._index is None or self._index_key != key:
+            self._index = MmuAceIndex(self.ace)
+            self._index_key = key
+        return self._index
 
     def _find_gate_by_index(self, gate_index: int) -> tuple[MmuAceUnit | None, MmuAceGate | None]:
-        for unit, gate in self._iter_gates():
-            if gate.index == gate_index:
-                return unit, gate
-        return None, None
+        return self.index.gates_by_index.get(gate_index, (None, None))
 
     def _find_gate_by_position(self, position: int) -> tuple[MmuAceUnit | None, MmuAceGate | None]:
-        current = position
-        for unit in self.ace.units:
-            if current < len(unit.gates):
-                return unit, unit.gates[current]
-            current -= len(unit.gates)
+        gates = self.index.gates_by_position
+        if 0 <= position < len(gates):
+            return gates[position]
         return None, None
 
+    def _find_unit(self, unit_id: int) -> MmuAceUnit | None:
+        return self.index.units_by_id.get(unit_id)
+
+    def _find_tool_by_gate(self, gate_index: int) -> int | None:
+        tools = self.index.tools_by_gate.get(gate_index)
+        return tools[0] if tools else None
+
+    def _find_endless_spool_gates(self, gate_position: int) -> List[int]:
+        """Gate positions sharing the endless spool group of a gate, itself included"""
+        groups = self.ace.endless_spool_groups
+        if not 0 <= gate_position < len(groups):
+            return [gate_position]
+        return self.index.gates_by_group.get(groups[gate_position], [gate_position])
+
     def _resolve_gate(self, gate_index: int) -> tuple[MmuAceUnit | None, MmuAceGate | None]:
         unit, gate = self._find_gate_by_index(gate_index)
         if gate is not None:
             return unit, gate
         return self._find_gate_by_position(gate_index)
 
-    def _update_active_filament(self, filament_hub: Dict[str, Any]):
+    def _assign(self, target: Any, name: str, value: Any) -> bool:
+        if getattr(target, name) == value:
+            return False
+        setattr(target, name, value)
+        return True
+
+    def _update_active_filament(self, filament_hub: Dict[str, Any]) -> bool:
         current = filament_hub.get("current_filament")
         active = ActiveFilamentStatus()
+        changed = False
         if isinstance(current, dict):
             active.unit = current.get("id", UNIT_UNKNOWN)
             active.gate = current.get("index", TOOL_GATE_UNKNOWN)
@@ -510,29 +645,31 @@ class MmuAceController:
             active.empty = "0"
             position = current.get("position")
             if position is not None:
-                self.ace.filament.position = position
+                changed |= self._assign(self.ace.filament, "position", position)
             filament_pos = current.get("pos")
             if filament_pos is not None:
-                self.ace.filament.pos = filament_pos
+                changed |= self._assign(self.ace.filament, "pos", filament_pos)
             direction = current.get("direction")
             if direction is not None:
-                self.ace.filament.direction = direction
+                changed |= self._assign(self.ace.filament, "direction", direction)
         elif isinstance(current, str) and current:
             active.name = current
             active.empty = "0"
         else:
             active.empty = "1"
 
-        self.ace.active_filament = active
+        changed |= self._assign(self.ace, "active_filament", active)
 
         if active.name:
-            self.ace.filament.name = active.name
+            changed |= self._assign(self.ace.filament, "name", active.name)
         if active.unit != UNIT_UNKNOWN:
-            self.ace.unit = active.unit
+            changed |= self._assign(self.ace, "unit", active.unit)
         if active.gate != TOOL_GATE_UNKNOWN:
-            self.ace.gate = active.gate
+            changed |= self._assign(self.ace, "gate", active.gate)
         if active.tool != TOOL_GATE_UNKNOWN:
-            self.ace.tool = active.tool
+            changed |= self._assign(self.ace, "tool", active.tool)
+
+        return changed
 
     def _update_tool_usage(self):
         active_gate = self.ace.gate
@@ -546,11 +683,81 @@ class MmuAceController:
             return True
         return False
 
-    def _handle_status_update(self):
-        self.server.send_event("mmu_ace:status_update", asdict(self.get_status()))
+    def _handle_status_update(self, immediate: bool = False):
+        self._invalidate_status()
+
+        if immediate:
+            self._flush_status_update()
+            return
+        if self._status_update_batch:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush_status_update()
+            return
+
+        if self._status_update_handle is not None and self._status_update_loop is loop:
+            return
+        if self.status_update_window > 0:
+            self._status_update_handle = loop.call_later(self.status_update_window, self._flush_status_update)
+        else:
+            self._status_update_handle = loop.call_soon(self._flush_status_update)
+        self._status_update_loop = loop
+
+    def _flush_status_update(self):
+        if self._status_update_handle is not None:
+            self._status_update_handle.cancel()
+            self._status_update_handle = None
+            self._status_update_loop = None
+
+        if self._published_version == self.status_version:
+            return
+        self._published_version = self.status_version
+
+        snapshot = self.get_status_snapshot()
+        delta = self._get_status_delta(self._published_snapshot, snapshot)
+        self._published_snapshot = snapshot
+        if not delta:
+            return
+
+        self.status_seq += 1
+        self.server.send_event("mmu_ace:status_update", { "seq": self.status_seq, **delta })
+
+    def _get_status_delta(self, previous: dict | None, snapshot: dict) -> dict:
+        """Fields of each status section that differ from the previous snapshot, removed fields are set to None"""
+        if previous is None:
+            return snapshot
+
+        delta = {}
+        for section, fields in snapshot.items():
+            previous_fields = previous.get(section) or {}
+            changed = { key: value for key, value in fields.items() if key not in previous_fields or previous_fields[key] != value }
+            changed.update({ key: None for key in previous_fields if key not in fields })
+            if changed:
+                delta[section] = changed
+        return delta
+
+    def get_published_status(self) -> tuple[int, dict]:
+        """Sends pending changes, then returns the full status with the sequence number of its last update"""
+        self._flush_status_update()
+        return self.status_seq, self._published_snapshot or self.get_status_snapshot()
+
+    @contextlib.contextmanager
+    def batch_status_updates(self):
+        """Holds status updates until the outermost batch exits, then sends a single one"""
+        self._status_update_batch += 1
+        try:
+            yield
+        finally:
+            self._status_update_batch -= 1
+            if not self._status_update_batch:
+                self._flush_status_update()
 
     def set_ace(self, ace: MmuAce):
         self.ace = ace
+        self._filament_hubs = None
         self._handle_status_update()
 
         self.eventloop.create_task(self._plan_load_ace())
@@ -598,63 +805,93 @@ class MmuAceController:
     async def _handle_mmu_ace_status_update(self, status: Dict[str, Any], _: float):
         if "filament_hub" in status:
             filament_hub = status["filament_hub"]
-            logging.warning(f"mmu ace status update: {json.dumps(filament_hub)}")
+            logging.debug("mmu ace status update: %s", filament_hub)
 
             self._set_ace_status(filament_hub)
 
     def _set_ace_status(self, filament_hub: Dict[str, Any]):
         ace = self.ace
+        changed = False
+
+        print_state_before = ace.print_state
+        is_paused_before = ace.is_paused
 
         enabled = filament_hub.get("enabled")
         if enabled is not None:
-            ace.enabled = bool(enabled)
+            changed |= self._assign(ace, "enabled", bool(enabled))
 
-        ace.action = filament_hub.get("action", ace.action or ACTION_IDLE)
-        ace.operation = filament_hub.get("operation", ace.operation)
+        changed |= self._assign(ace, "action", filament_hub.get("action", ace.action or ACTION_IDLE))
+        changed |= self._assign(ace, "operation", filament_hub.get("operation", ace.operation))
 
         print_state = filament_hub.get("print_state")
         if isinstance(print_state, str):
             try:
-                ace.print_state = MmuAcePrintState(print_state)
+                changed |= self._assign(ace, "print_state", MmuAcePrintState(print_state))
             except ValueError:
                 logging.debug(f"Unknown print_state reported by ACE: {print_state}")
 
         is_paused = filament_hub.get("is_paused")
         if is_paused is not None:
-            ace.is_paused = bool(is_paused)
+            changed |= self._assign(ace, "is_paused", bool(is_paused))
 
         is_homed = filament_hub.get("is_homed")
         if is_homed is not None:
-            ace.is_homed = bool(is_homed)
+            changed |= self._assign(ace, "is_homed", bool(is_homed))
 
         unit_value = filament_hub.get("unit")
         if unit_value is not None:
-            ace.unit = unit_value
+            changed |= self._assign(ace, "unit", unit_value)
 
         gate_value = filament_hub.get("gate")
         if gate_value is not None:
-            ace.gate = gate_value
+            changed |= self._assign(ace, "gate", gate_value)
 
         tool_value = filament_hub.get("tool")
         if tool_value is not None:
-            ace.tool = tool_value
+            changed |= self._assign(ace, "tool", tool_value)
 
         endless_spool_groups = filament_hub.get("endless_spool_groups")
-        if isinstance(endless_spool_groups, list):
-            ace.endless_spool_groups = endless_spool_groups
+        if isinstance(endless_spool_groups, list) and self._assign(ace, "endless_spool_groups", endless_spool_groups):
+            self._invalidate_status()
+            changed = True
+
+        changed |= self._assign(ace, "num_toolchanges", filament_hub.get("num_toolchanges", ace.num_toolchanges))
+        changed |= self._assign(ace, "last_tool", filament_hub.get("last_tool", ace.last_tool))
+        changed |= self._assign(ace, "next_tool", filament_hub.get("next_tool", ace.next_tool))
+
+        active = (ace.unit, ace.gate, ace.tool)
+        changed |= self._update_active_filament(filament_hub)
+
+        # Tool changes and pauses are shown as soon as they happen
+        immediate = (ace.unit, ace.gate, ace.tool) != active or ace.print_state != print_state_before or ace.is_paused != is_paused_before
+
+        # Unit temperatures and dryer telemetry are not part of the status
+        hubs = filament_hub.get("filament_hubs")
+        if isinstance(hubs, list) and hubs != self._filament_hubs:
+            if self._has_same_hub_layout(hubs):
+                changed |= self._update_ace_hubs(hubs)
+            else:
+                self._build_ace_hubs(hubs)
+                changed = True
+            self._filament_hubs = hubs
+
+        in_use = [tool.in_use for tool in ace.tools]
+        self._update_tool_usage()
+        changed |= in_use != [tool.in_use for tool in ace.tools]
 
-        ace.num_toolchanges = filament_hub.get("num_toolchanges", ace.num_toolchanges)
-        ace.last_tool = filament_hub.get("last_tool", ace.last_tool)
-        ace.next_tool = filament_hub.get("next_tool", ace.next_tool)
+        if changed:
+            self._handle_status_update(immediate)
 
-        self._update_active_filament(filament_hub)
+    def _build_ace_hubs(self, hubs: List[Dict[str, Any]]):
+        self._invalidate_status()
+        ace = self.ace
 
         ace.units = []
         ace.tools = []
         ace.ttg_map = []
 
         slot_counter = 0
-        for hub in filament_hub.get("filament_hubs", []):
+        for hub in hubs:
             hub_id = hub.get("id", len(ace.units))
             unit = MmuAceUnit(hub_id, f"ACE {hub_id + 1}")
 
@@ -668,11 +905,7 @@ class MmuAceController:
                 unit.gates.append(gate)
 
                 tool = MmuAceTool()
-                tool_index = len(ace.tools)
-                tool.name = slot.get("name") or gate.filament_name or f"T{tool_index + 1}"
-                tool.material = gate.material
-                tool.temp = gate.temperature
-                tool.gate_index = gate.index if gate.index is not None else slot_counter
+                self._update_tool_from_slot(tool, len(ace.tools), slot, gate, slot_counter)
                 ace.tools.append(tool)
                 ace.ttg_map.append(tool.gate_index)
 
@@ -683,9 +916,53 @@ class MmuAceController:
         if not ace.ttg_map:
             ace.ttg_map = [i for i in range(len(ace.tools))]
 
-        self._update_tool_usage()
-        self._handle_status_update()
-
+    def _has_same_hub_layout(self, hubs: List[Dict[str, Any]]) -> bool:
+        """Whether units and slots are the same as in the previous payload, so the model can be updated in place"""
+        ace = self.ace
+        previous_hubs = self._filament_hubs
+
+        if previous_hubs is None or len(hubs) != len(previous_hubs) or len(hubs) != len(ace.units):
+            return False
+        for hub, previous_hub, unit in zip(hubs, previous_hubs, ace.units):
+            if hub.get("id", unit.id) != unit.id:
+                return False
+            slot_count = len(hub.get("slots", []))
+            if slot_count != len(previous_hub.get("slots", [])) or slot_count != len(unit.gates):
+                return False
+        return len(ace.tools) >= sum(len(unit.gates) for unit in ace.units)
+
+    def _update_ace_hubs(self, hubs: List[Dict[str, Any]]) -> bool:
+        """Rebuilds only the gates whose slot changed since the previous payload, returns whether any did"""
+        ace = self.ace
+        changed = False
+
+        slot_counter = 0
+        for hub, previous_hub, unit in zip(hubs, self._filament_hubs, ace.units):
+            unit.status = hub.get("status")
+            unit.temp = hub.get("temp")
+            unit.dryer = hub.get("dryer_status", {}) or {}
+
+            previous_slots = previous_hub.get("slots", [])
+            for position, slot in enumerate(hub.get("slots", [])):
+                if slot != previous_slots[position]:
+                    if not changed:
+                        self._invalidate_status()
+                    changed = True
+                    gate = unit.gates[position] = self._build_gate_from_slot(slot, slot_counter)
+                    tool = ace.tools[slot_counter]
+                    self._update_tool_from_slot(tool, slot_counter, slot, gate, slot_counter)
+                    if slot_counter < len(ace.ttg_map):
+                        ace.ttg_map[slot_counter] = tool.gate_index
+                slot_counter += 1
+
+        return changed
+
+    def _update_tool_from_slot(self, tool: MmuAceTool, tool_index: int, slot: Dict[str, Any], gate: MmuAceGate, slot_counter: int):
+        tool.name = slot.get("name") or gate.filament_name or f"T{tool_index + 1}"
+        tool.material = gate.material
+        tool.temp = gate.temperature
+        tool.gate_index = gate.index if gate.index is not None else slot_counter
+
     def get_status(self) -> MmuAceStatus:
 
         gates = [gate for gates in [unit.gates for unit in self.ace.units] for gate in gates]
@@ -747,28 +1024,72 @@ class MmuAceController:
             mmu_machine = self.get_machine_status()
         )
 
+    def get_status_snapshot(self) -> dict:
+        """Same content as get_status().to_dict(), built only once per state change
+
+        The snapshot is shared by every consumer until the next change and must not be mutated.
+        """
+        if self._snapshot is not None and self._snapshot_version == self.status_version:
+            return self._snapshot
+
+        ace = self.ace
+        gates = [gate for unit in ace.units for gate in unit.gates]
+        units = ace.units
+
+        mmu = {
+            **MMU_STATUS_DEFAULTS,
+            "enabled": ace.enabled,
+            "num_gates": len(gates),
+            "print_state": ace.print_state.value,
+            "is_paused": ace.is_paused,
+            "is_homed": ace.is_homed,
+            "unit": ace.unit,
+            "gate": ace.gate,
+            "tool": ace.tool,
+            "active_filament": asdict(ace.active_filament),
+            "num_toolchanges": ace.num_toolchanges,
+            "last_tool": ace.last_tool,
+            "next_tool": ace.next_tool,
+            "operation": ace.operation,
+            "filament": ace.filament.name,
+            "filament_position": ace.filament.position,
+            "filament_pos": ace.filament.pos,
+            "filament_direction": ace.filament.direction,
+            "ttg_map": list(ace.ttg_map),
+            "endless_spool_groups": list(ace.endless_spool_groups),
+            "gate_status": [gate.status for gate in gates],
+            "gate_filament_name": [gate.filament_name for gate in gates],
+            "gate_material": [gate.material for gate in gates],
+            "gate_color": [rgba_to_hex(gate.color) if gate.color is not None else None for gate in gates],
+            "gate_temperature": [gate.temperature for gate in gates],
+            "gate_spool_id": [gate.spool_id for gate in gates],
+            "gate_speed_override": [gate.speed_override for gate in gates],
+            "slicer_tool_map": {
+                "tools": [{ "material": tool.material, "temp": tool.temp, "name": tool.name, "in_use": tool.in_use } for tool in ace.tools]
+            },
+            "action": ace.action,
+            "sensors": {},
+        }
+
+        mmu_machine = { "num_units": len(units), "unit_0": None, "unit_1": None }
+        for index, (unit, first_gate) in enumerate(zip(units, self.index.first_gates)):
+            mmu_machine[f"unit_{index}"] = get_unit_status_snapshot(unit.name, len(unit.gates), first_gate)
+
+        self._snapshot = { "mmu": mmu, "mmu_machine": mmu_machine }
+        self._snapshot_version = self.status_version
+        return self._snapshot
+
     def get_machine_status(self):
+        units = [self.get_unit_status(unit, first_gate) for unit, first_gate in zip(self.ace.units, self.index.first_gates)]
         return MmuMachineStatus(
-            num_units = len(self.ace.units),
-            unit_0 = self.get_unit_status(self.ace.units[0], 0) if len(self.ace.units) >= 1 else None,
-            unit_1 = self.get_unit_status(self.ace.units[1], 1) if len(self.ace.units) >= 2 else None,
+            num_units = len(units),
+            unit_0 = units[0] if len(units) >= 1 else None,
+            unit_1 = units[1] if len(units) >= 2 else None,
+            extra_units = units[2:],
         )
 
-    def get_unit_status(self, unit: MmuAceUnit, index: int):
-        return  MmuUnitStatus(
-            name = unit.name,
-            vendor = "Anycubic",
-            version = "1.0",
-            num_gates = len(unit.gates),
-            first_gate = 0,
-            selector_type = "VirtualSelector",
-            variable_rotation_distances = False,
-            variable_bowden_lengths = False,
-            require_bowden_move = False,
-            filament_always_gripped = False,
-            has_bypass = False,
-            multi_gear = False,
-        )
+    def get_unit_status(self, unit: MmuAceUnit, first_gate: int):
+        return build_unit_status(unit.name, len(unit.gates), first_gate)
 
     def get_tools_status(self):
         return MmuSlicerToolMapStatus([self.get_tool_status(tool) for tool in self.ace.tools])
@@ -782,6 +1103,7 @@ class MmuAceController:
         )
 
     def update_ttg_map(self, ttg_map: List[int]):
+        self._invalidate_status()
         self.ace.ttg_map = ttg_map
         for index, gate_index in enumerate(ttg_map):
             if index < len(self.ace.tools):
@@ -794,6 +1116,7 @@ class MmuAceController:
             return
 
         max_tool_index = max(entry["tool"] for entry in entries)
+        self._invalidate_status()
 
         while len(self.ace.tools) <= max_tool_index:
             self.ace.tools.append(MmuAceTool())
@@ -868,7 +1191,7 @@ class MmuAceController:
         self.ace.active_filament.status = ACTION_SELECTING
 
         self._update_tool_usage()
-        self._handle_status_update()
+        self._handle_status_update(immediate=True)
 
     async def update_endless_spool_groups(self, groups: List[int]):
         params = {"groups": groups}
@@ -992,7 +1315,7 @@ class MmuAceController:
             logging.warning(f"start dryer for unit {unit_id} failed: {result} {error}")
             return
 
-        unit = next((u for u in self.ace.units if u.id == unit_id), None)
+        unit = self._find_unit(unit_id)
         if unit is not None:
             unit.dryer = unit.dryer or {}
             unit.dryer.update({
@@ -1021,7 +1344,7 @@ class MmuAceController:
             logging.warning(f"stop dryer for unit {unit_id} failed: {result} {error}")
             return
 
-        unit = next((u for u in self.ace.units if u.id == unit_id), None)
+        unit = self._find_unit(unit_id)
         if unit is not None:
             unit.dryer = unit.dryer or {}
             unit.dryer.update({
@@ -1031,6 +1354,126 @@ class MmuAceController:
 
         self._handle_status_update()
 
+class MetadataWorkerError(Exception):
+    pass
+
+class MetadataWorker:
+    """Long-lived process running this module with --worker, reused for each file"""
+
+    def __init__(self, command: List[str]):
+        self.command = command
+        self.process: asyncio.subprocess.Process | None = None
+
+    async def run(self, argv: List[str], timeout: float) -> tuple[int, bytes]:
+        if self.process is None or self.process.returncode is not None:
+            self.process = await asyncio.create_subprocess_exec(*self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, limit=METADATA_WORKER_LIMIT)
+
+        try:
+            self.process.stdin.write((json.dumps({ "argv": argv }) + "\n").encode())
+            await self.process.stdin.drain()
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise
+        except (ConnectionError, OSError, ValueError) as e:
+            # ValueError is raised when the response outgrows the stream limit
+            await self.stop()
+            raise MetadataWorkerError(str(e)) from e
+
+        if not line:
+            await self.stop()
+            raise MetadataWorkerError("worker exited")
+
+        response = json.loads(line)
+        return response["code"], response["output"].encode()
+
+    async def stop(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+
+class MetadataWorkerPool:
+    """Runs metadata extraction on a bounded number of workers, one file at a time with a pause while printing"""
+
+    def __init__(self, command: List[str], size: int, print_delay: float):
+        self.workers = [ MetadataWorker(command) for _ in range(size) ]
+        self.print_delay = print_delay
+        self.printing = False
+
+        self._idle: asyncio.Queue[MetadataWorker] = asyncio.Queue()
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+        self._print_lock = asyncio.Lock()
+
+    async def run(self, argv: List[str], timeout: float) -> tuple[int, bytes]:
+        """Runs the metadata script with argv, the timeout includes the time spent waiting for a worker"""
+        deadline = asyncio.get_running_loop().time() + timeout
+
+        if self.printing:
+            await asyncio.wait_for(self._print_lock.acquire(), self._remaining(deadline))
+            try:
+                await asyncio.sleep(min(self.print_delay, self._remaining(deadline)))
+                return await self._run(argv, deadline)
+            finally:
+                self._print_lock.release()
+
+        return await self._run(argv, deadline)
+
+    async def _run(self, argv: List[str], deadline: float) -> tuple[int, bytes]:
+        worker = await asyncio.wait_for(self._idle.get(), self._remaining(deadline))
+        try:
+            return await worker.run(argv, self._remaining(deadline))
+        finally:
+            self._idle.put_nowait(worker)
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return remaining
+
+    async def close(self):
+        for worker in self.workers:
+            await worker.stop()
+
+async def extract_metadata(pool: MetadataWorkerPool, storage: Any, filename: str, ufp_path: str | None, fallback: Callable[[], Coroutine]) -> None:
+    """Does what Moonraker's MetadataStorage._run_extract_metadata does, on a warm worker
+
+    UFP files and metadata processors are left to Moonraker, so are files the worker fails on.
+    """
+    if ufp_path is not None or getattr(storage, "processors", None):
+        return await fallback()
+
+    timeout = storage.default_metadata_parser_timeout
+    argv = [ "-p", storage.gc_path, "-f", filename ]
+    if storage.enable_object_proc:
+        timeout = max(timeout, 300.)
+        argv.append("--check-objects")
+
+    try:
+        code, output = await pool.run(argv, timeout)
+    except asyncio.TimeoutError:
+        logging.info(f"Metadata worker timed out after {timeout}s on {filename}")
+        raise storage.server.error("Extract Metadata returned with error")
+    except MetadataWorkerError as e:
+        logging.warning(f"Metadata worker failed ({e}), running the metadata script instead")
+        return await fallback()
+
+    if code != 0:
+        raise storage.server.error("Extract Metadata returned with error")
+
+    response = json.loads(output.strip())
+    path: str = response["file"]
+    metadata: Dict[str, Any] = response["metadata"]
+    if not metadata:
+        raise storage.server.error("Unable to extract metadata")
+    metadata.update({ "print_start_time": None, "job_id": None })
+    storage.metadata[path] = metadata
+    storage.mddb[path] = metadata
+
 class MmuAcePatcher:
 
     ace: MmuAce
@@ -1043,12 +1486,27 @@ class MmuAcePatcher:
         self.kobra = self.server.load_component(self.server.config, 'kobra')
 
         host = config.get("host", None)
-        self.ace_controller = MmuAceController(self.server, host)
+        status_update_window = config.getfloat("status_update_window", 0.0, minval=0.0)
+        self.ace_controller = MmuAceController(self.server, host, status_update_window)
+
+        # Inherited by the metadata script, whether it runs on workers or not
+        # The cache lives in the data path, out of the file roots Moonraker lists
+        cache_path = os.path.join(self.server.get_app_args()["data_path"], MMU_ACE_CACHE_DIR)
+        os.environ[MMU_ACE_CACHE_ENV] = cache_path if config.getboolean("metadata_cache", True) else ""
+        os.environ[MMU_ACE_CACHE_FAST_HASH_ENV] = "1" if config.getboolean("metadata_cache_fast_hash", False) else "0"
+
+        metadata_workers = config.getint("metadata_workers", 1, minval=0)
+        metadata_print_delay = config.getfloat("metadata_print_delay", 5.0, minval=0.0)
+        self.metadata_pool = None
+        if metadata_workers > 0:
+            self.metadata_pool = MetadataWorkerPool([ sys.executable, os.path.abspath(__file__), METADATA_WORKER_ARG ], metadata_workers, metadata_print_delay)
 
         self.reinit()
 
         # mmu test enpoints
         self.server.register_endpoint("/server/mmu-ace", ['GET'], self._handle_mmu_request)
+        self.server.register_endpoint("/server/mmu-ace/gcode-progress", ['GET'], self._handle_gcode_progress_request)
+        self.server.register_event_handler("file_manager:filelist_changed", self._on_filelist_changed)
 
         # mmu status update notification
         self.server.register_notification("mmu_ace:status_update")
@@ -1067,6 +1525,7 @@ class MmuAcePatcher:
 
         # Add AnycubicSlicerNext to supported slicers
         self.setup_anycubic_slicer()
+        self.setup_metadata_worker()
 
     def register_gcode_handler(self, cmd, callback: FlexCallback):
         self.kobra.register_gcode_handler(cmd, callback)
@@ -1333,34 +1792,36 @@ class MmuAcePatcher:
         gate_map = ast.literal_eval(gate_map_str)
         logging.warning(f"handle mmu_gate_map gate_map: {json.dumps(gate_map)}")
 
-        for key, value in gate_map.items():
-            gate_index = int(key)
-
-            logging.warning(f"try update gate {key}: {json.dumps(value)}")
-
-            gate_status = value.get("status")
-            if isinstance(gate_status, str):
-                try:
-                    gate_status = int(gate_status)
-                except ValueError:
-                    gate_status = GATE_UNKNOWN
-
-            color_hex = value.get("color")
-            color_rgba = hex_to_rgba(color_hex) if color_hex else None
-
-            await self.ace_controller.update_gate(
-                gate_index = gate_index,
-                status = gate_status,
-                filament_name = value["name"],
-                material = value["material"],
-                color = color_rgba,
-                temperature = value["temp"],
-                spool_id = value["spool_id"],
-                speed_override = value["speed_override"],
-                sku = value.get("sku"),
-                brand = value.get("brand"),
-                source = value.get("source")
-            )
+        # Gates are updated one by one, clients get a single status update
+        with self.ace_controller.batch_status_updates():
+            for key, value in gate_map.items():
+                gate_index = int(key)
+
+                logging.warning(f"try update gate {key}: {json.dumps(value)}")
+
+                gate_status = value.get("status")
+                if isinstance(gate_status, str):
+                    try:
+                        gate_status = int(gate_status)
+                    except ValueError:
+                        gate_status = GATE_UNKNOWN
+
+                color_hex = value.get("color")
+                color_rgba = hex_to_rgba(color_hex) if color_hex else None
+
+                await self.ace_controller.update_gate(
+                    gate_index = gate_index,
+                    status = gate_status,
+                    filament_name = value["name"],
+                    material = value["material"],
+                    color = color_rgba,
+                    temperature = value["temp"],
+                    spool_id = value["spool_id"],
+                    speed_override = value["speed_override"],
+                    sku = value.get("sku"),
+                    brand = value.get("brand"),
+                    source = value.get("source")
+                )
 
     def reinit(self):
 
@@ -1389,7 +1850,7 @@ class MmuAcePatcher:
         # self.selector.reinit()
 
     def get_status(self) -> dict:
-        return asdict(self.ace_controller.get_status())
+        return self.ace_controller.get_status_snapshot()
 
     def patch_status(self, status: dict):
 
@@ -1410,7 +1871,7 @@ class MmuAcePatcher:
 
             for tool_index, tool in enumerate(self.ace.tools):
                 gate_index = self.ace.ttg_map[tool_index] if tool_index < len(self.ace.ttg_map) else TOOL_GATE_UNKNOWN
-                _, gate = self._resolve_gate(gate_index)
+                _, gate = self.ace_controller._resolve_gate(gate_index)
                 if gate is None:
                     logging.warning(f"mmu_ace: unable to resolve gate for tool {tool_index} (gate_index={gate_index})")
                     continue
@@ -1450,10 +1911,43 @@ class MmuAcePatcher:
         return destination
 
     async def _handle_mmu_request(self, web_request):
+        seq, status = self.ace_controller.get_published_status()
         return {
-            "status": self.get_status()
+            "seq": seq,
+            "status": status
         }
 
+    def _get_gcode_path(self, filename: str) -> str:
+        file_manager = self.server.lookup_component("file_manager")
+        return os.path.join(file_manager.get_directory("gcodes"), filename)
+
+    async def _handle_gcode_progress_request(self, web_request):
+        filename = web_request.get_str("filename")
+        position = web_request.get_int("position", 0)
+
+        index = load_gcode_index(self._get_gcode_path(filename))
+        if index is None:
+            raise self.server.error(f"No index for {filename}", 404)
+
+        return index.get_progress(position)
+
+    def _on_filelist_changed(self, event: dict):
+        # Keep gcode indexes next to their file
+        action = event.get("action")
+        item = event.get("item", {})
+        if item.get("root") != "gcodes" or action not in ("delete_file", "move_file"):
+            return
+
+        try:
+            if action == "delete_file":
+                os.remove(get_gcode_index_path(self._get_gcode_path(item["path"])))
+            else:
+                source_item = event.get("source_item", {})
+                source_path = get_gcode_index_path(self._get_gcode_path(source_item["path"]))
+                os.replace(source_path, get_gcode_index_path(self._get_gcode_path(item["path"])))
+        except (OSError, KeyError):
+            pass
+
     # Add support for anycubic slicer
     def setup_anycubic_slicer(self):
         logging.warning("setup_anycubic_slicer")
@@ -1461,6 +1955,34 @@ class MmuAcePatcher:
         file_manager.METADATA_SCRIPT = os.path.abspath(__file__)
         logging.warning(f"setup_anycubic_slicer METADATA_SCRIPT: {file_manager.METADATA_SCRIPT}")
 
+    # Run the metadata script on warm workers instead of a new process per file
+    def setup_metadata_worker(self):
+        if self.metadata_pool is None:
+            return
+
+        # Only the gcode metadata storage is patched, other shell commands are left alone
+        storage = self.server.lookup_component("file_manager").get_metadata_storage()
+        run_extract_metadata = storage._run_extract_metadata
+
+        async def _run_extract_metadata(filename: str, ufp_path: str | None) -> None:
+            await extract_metadata(self.metadata_pool, storage, filename, ufp_path, lambda: run_extract_metadata(filename, ufp_path))
+
+        storage._run_extract_metadata = _run_extract_metadata
+
+        def set_printing(printing):
+            def handler(*args):
+                self.metadata_pool.printing = printing
+            return handler
+
+        for state in ("started", "resumed", "paused"):
+            self.server.register_event_handler(f"job_state:{state}", set_printing(True))
+        for state in ("complete", "cancelled", "error", "standby"):
+            self.server.register_event_handler(f"job_state:{state}", set_printing(False))
+
+    async def close(self):
+        if self.metadata_pool is not None:
+            await self.metadata_pool.close()
+
 
 def load_component(config):
     return MmuAcePatcher(config)
@@ -1474,61 +1996,454 @@ AUTHORZIED_SLICERS = ['PrusaSlicer', 'SuperSlicer', 'OrcaSlicer', 'BambuStudio',
 
 MMU_ACE_FINGERPRINT = "; processed by MmuAcePatcher"
 MMU_REGEX = r"^" + MMU_ACE_FINGERPRINT
+
+# Processed files end with the referenced tools and the fingerprint, this is enough of the tail to find it
+MMU_ACE_STAMP_TAIL_SIZE = 1024
 SLICER_REGEX = r"^;.*generated by ([a-z]*) .*$|^; (BambuStudio) .*$"
 
-TOOL_DISCOVERY_REGEX = r"((^MMU_CHANGE_TOOL(_STANDALONE)? .*?TOOL=)|(^T))(?P<tool>\d{1,2})"
+# Searched through the whole file at once, lines are anchored on their leading newline so the search can skip ahead to it
+TOOL_DISCOVERY_REGEX = r"\n(?:MMU_CHANGE_TOOL(?:_STANDALONE)? [^\n]*?TOOL=|T)(?P<tool>\d{1,2})"
 
 def gcode_processed_already(file_path):
-    """Expects first line of gcode to be the HAPPY_HARE_FINGERPRINT '; processed by HappyHare'"""
+    """Expects the last line of gcode to be the MMU_ACE_FINGERPRINT, or the first one for files stamped by previous versions"""
 
-    mmu_regex = re.compile(MMU_REGEX, re.IGNORECASE)
+    mmu_regex = re.compile(MMU_REGEX.encode(), re.IGNORECASE | re.MULTILINE)
 
-    with open(file_path, 'r') as in_file:
-        line = in_file.readline()
-        return mmu_regex.match(line)
+    with open(file_path, 'rb') as in_file:
+        if mmu_regex.match(in_file.readline()):
+            return True
+
+        size = os.fstat(in_file.fileno()).st_size
+        in_file.seek(max(size - MMU_ACE_STAMP_TAIL_SIZE, 0))
+        return mmu_regex.search(in_file.read()) is not None
     
+SLICER_PATTERN = re.compile(SLICER_REGEX.encode(), re.IGNORECASE)
+SLICER_SEARCH_PATTERN = re.compile(rb"\n;[^\n]*generated by ([a-z]*) |\n; (BambuStudio) ", re.IGNORECASE)
+TOOL_PATTERN = re.compile(TOOL_DISCOVERY_REGEX.encode(), re.IGNORECASE)
+
+def scan_gcode_header(data) -> tuple[str | None, int]:
+    """Looks for the slicer in the leading comment block, returns it with the offset where scanning can resume.
+    Files starting with commands (like a M73 progress prologue) are searched as a whole instead"""
+    position = 0
+    size = len(data)
+
+    while position < size:
+        end = data.find(b"\n", position)
+        if end < 0:
+            end = size
+        line = data[position:end]
+
+        if line.startswith(b";"):
+            match = SLICER_PATTERN.match(line)
+            slicer = match and (match.group(1) or match.group(2))
+            if slicer:
+                return slicer.decode(), end + 1
+        elif line.strip():
+            # First command, slicers identify themselves before this point
+            break
+
+        position = end + 1
+    else:
+        return None, position
+
+    match = SLICER_SEARCH_PATTERN.search(data, position)
+    if match:
+        return (match.group(1) or match.group(2)).decode(), 0
+    return None, size
+
 def parse_gcode_file(file_path):
-    slicer_regex = re.compile(SLICER_REGEX, re.IGNORECASE)
     slicer = None
 
     tools_used = set()
     total_toolchanges = 0
-    
-    with open(file_path, 'r') as in_file:
-        for line in in_file:
-            # Discover slicer
-            if not slicer and line.startswith(";"):
-                match = slicer_regex.match(line)
-                if match:
-                    slicer = match.group(1) or match.group(2)
-    if slicer in AUTHORZIED_SLICERS:
-        if isinstance(TOOL_DISCOVERY_REGEX, dict):
-            tools_regex = re.compile(TOOL_DISCOVERY_REGEX[slicer], re.IGNORECASE)
-        else:
-            tools_regex = re.compile(TOOL_DISCOVERY_REGEX, re.IGNORECASE)
 
-        with open(file_path, 'r') as in_file:
-            for line in in_file:
-                match = tools_regex.match(line)
-                if match:
-                    tool = match.group("tool")
-                    tools_used.add(int(tool))
-                    total_toolchanges += 1
-    
+    with open(file_path, 'rb') as in_file:
+        if os.fstat(in_file.fileno()).st_size > 0:
+            with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                slicer, body_start = scan_gcode_header(data)
+
+                # Tool changes are only looked for in files from known slicers, past their header
+                if slicer in AUTHORZIED_SLICERS:
+                    for match in TOOL_PATTERN.finditer(data, max(body_start - 1, 0)):
+                        tools_used.add(int(match.group("tool")))
+                        total_toolchanges += 1
+
     return {
         "slicer": slicer,
         "tools_used": sorted(tools_used),
         "total_toolchanges": total_toolchanges,
     }
 
-def process_file(input_filename, output_filename, tools_used, total_toolchanges):
-    with open(input_filename, 'r') as infile, open(output_filename, 'w') as outfile:
-        outfile.write(f'{MMU_ACE_FINGERPRINT}\n')
-        for line in infile:
-            outfile.write(line)
-        # Finally append "; referenced_tools =" as new metadata (why won't Prusa pick up my PR?)
-        outfile.write("; referenced_tools = %s\n" % ",".join(map(str, tools_used)))
+def process_file(file_path, tools_used, total_toolchanges):
+    """Stamps the file in place, only appending to it"""
+    with open(file_path, 'rb+') as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                file.write(b"\n")
+
+        # Append "; referenced_tools =" as new metadata (why won't Prusa pick up my PR?)
+        # The fingerprint comes last, so it is only there once the metadata is complete
+        stamp = "; referenced_tools = %s\n%s\n" % (",".join(map(str, tools_used)), MMU_ACE_FINGERPRINT)
+        file.write(stamp.encode())
+
+# Sidecar index of layer and tool changes, stored hidden next to the gcode so Moonraker does not list it
+MMU_ACE_INDEX_VERSION = 1
+MMU_ACE_INDEX_SUFFIX = ".mmu_index.json"
+
+INDEX_EVENT_PATTERN = re.compile(rb"\n(?:;\s?(?P<layer>LAYER_CHANGE|CHANGE_LAYER)|(?:MMU_CHANGE_TOOL(?:_STANDALONE)? [^\n]*?TOOL=|T)(?P<tool>\d{1,2})|(?P<mode>M8[23])|G92 [^\n]*?E(?P<reset>-?[\d.]+))", re.IGNORECASE)
+EXTRUSION_PATTERN = re.compile(rb"\nG[0-3] [^\n]*?E(-?[\d.]+)", re.IGNORECASE)
+
+def get_gcode_index_path(file_path):
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}{MMU_ACE_INDEX_SUFFIX}")
+
+def build_gcode_index(data) -> dict:
+    """Lists the byte offset of each layer and tool change, along with the filament extruded before it"""
+    layers = []
+    toolchanges = []
+    tools = {}
+
+    relative = False
+    position_e = 0.0
+    extruded = 0.0
+    tool = None
+    segment_start = 0
+
+    def extrude_until(end):
+        nonlocal position_e, extruded
+        values = EXTRUSION_PATTERN.findall(data, segment_start, end)
+        if not values:
+            return
+        if relative:
+            amount = sum(map(float, values))
+        else:
+            amount = float(values[-1]) - position_e
+            position_e = float(values[-1])
+        extruded += amount
+        if tool is not None:
+            tools[tool] = tools.get(tool, 0.0) + amount
+
+    for match in INDEX_EVENT_PATTERN.finditer(data):
+        offset = match.start() + 1
+        extrude_until(offset)
+        segment_start = match.start()
+
+        if match.group("layer"):
+            layers.append([ offset, round(extruded, 3) ])
+        elif match.group("tool"):
+            tool = int(match.group("tool"))
+            toolchanges.append([ offset, tool, round(extruded, 3) ])
+        elif match.group("mode"):
+            relative = match.group("mode").upper() == b"M83"
+        else:
+            position_e = float(match.group("reset"))
+
+    extrude_until(len(data))
+
+    return {
+        "layers": layers,
+        "toolchanges": toolchanges,
+        "extruded": round(extruded, 3),
+        "tools": { str(tool): round(amount, 3) for tool, amount in sorted(tools.items()) }
+    }
+
+def write_gcode_index(file_path, index: dict | None = None):
+    """Writes the index of a gcode, scanning the file unless the index is given"""
+    with open(file_path, 'rb') as in_file:
+        stat = os.fstat(in_file.fileno())
+        if index is not None:
+            index = dict(index)
+        elif stat.st_size == 0:
+            return
+        else:
+            with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                index = build_gcode_index(data)
+
+    index.update({ "version": MMU_ACE_INDEX_VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns })
+
+    index_path = get_gcode_index_path(file_path)
+    with open(index_path + ".tmp", 'w') as out_file:
+        json.dump(index, out_file, separators=(',', ':'))
+    os.replace(index_path + ".tmp", index_path)
+
+@dataclass
+class GcodeIndex:
+    layers: List[List[float]]
+    toolchanges: List[List[float]]
+    extruded: float
+    tools: Dict[int, float]
+
+    def __post_init__(self):
+        self._layer_offsets = [ layer[0] for layer in self.layers ]
+        self._toolchange_offsets = [ toolchange[0] for toolchange in self.toolchanges ]
+
+        # Filament used by each tool before each tool change
+        self._tools_used = []
+        used = {}
+        for i, (offset, tool, extruded) in enumerate(self.toolchanges):
+            self._tools_used.append(dict(used))
+            end = self.toolchanges[i + 1][2] if i + 1 < len(self.toolchanges) else self.extruded
+            used[tool] = used.get(tool, 0.0) + end - extruded
+
+    def get_layer(self, position: int) -> int:
+        """Layer number being printed at a byte position, 0 before the first layer"""
+        return bisect.bisect_right(self._layer_offsets, position)
+
+    def get_layer_offset(self, layer: int) -> int | None:
+        if 0 < layer <= len(self.layers):
+            return self.layers[layer - 1][0]
+        return None
+
+    def _get_toolchange(self, position: int) -> int:
+        return bisect.bisect_right(self._toolchange_offsets, position) - 1
+
+    def get_tool(self, position: int) -> int | None:
+        i = self._get_toolchange(position)
+        return self.toolchanges[i][1] if i >= 0 else None
+
+    def get_next_toolchange(self, position: int) -> List[float] | None:
+        i = self._get_toolchange(position) + 1
+        return self.toolchanges[i] if i < len(self.toolchanges) else None
+
+    def get_extruded(self, position: int) -> float:
+        """Filament extruded at the last layer or tool change before a byte position"""
+        offset, extruded = -1, 0.0
+        i = self.get_layer(position) - 1
+        if i >= 0:
+            offset, extruded = self.layers[i]
+        i = self._get_toolchange(position)
+        if i >= 0 and self.toolchanges[i][0] > offset:
+            extruded = self.toolchanges[i][2]
+        return extruded
+
+    def get_tools_remaining(self, position: int) -> Dict[int, float]:
+        i = self._get_toolchange(position)
+        if i < 0:
+            return dict(self.tools)
+
+        used = dict(self._tools_used[i])
+        tool, extruded = self.toolchanges[i][1], self.toolchanges[i][2]
+        used[tool] = used.get(tool, 0.0) + self.get_extruded(position) - extruded
+
+        return { tool: round(total - used.get(tool, 0.0), 3) for tool, total in self.tools.items() }
+
+    def get_progress(self, position: int) -> dict:
+        next_toolchange = self.get_next_toolchange(position)
+        return {
+            "layer": self.get_layer(position),
+            "layer_count": len(self.layers),
+            "tool": self.get_tool(position),
+            "next_toolchange": None if next_toolchange is None else {
+                "position": next_toolchange[0],
+                "tool": next_toolchange[1],
+                "extrusion": round(next_toolchange[2] - self.get_extruded(position), 3)
+            },
+            "tools_remaining": self.get_tools_remaining(position)
+        }
+
+@functools.lru_cache(maxsize=4)
+def _read_gcode_index(index_path: str, index_mtime: int, size: int, mtime: int) -> GcodeIndex | None:
+    try:
+        with open(index_path, 'r') as in_file:
+            index = json.load(in_file)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != MMU_ACE_INDEX_VERSION or index.get("size") != size or index.get("mtime") != mtime:
+        return None
+
+    return GcodeIndex(
+        layers=index["layers"],
+        toolchanges=index["toolchanges"],
+        extruded=index["extruded"],
+        tools={ int(tool): amount for tool, amount in index["tools"].items() }
+    )
+
+def read_gcode_index(file_path) -> dict | None:
+    """Returns the stored index of a gcode, without the fields tying it to this version of the file"""
+    if load_gcode_index(file_path) is None:
+        return None
+    with open(get_gcode_index_path(file_path), 'r') as in_file:
+        index = json.load(in_file)
+    for key in ("version", "size", "mtime"):
+        index.pop(key, None)
+    return index
+
+def load_gcode_index(file_path) -> GcodeIndex | None:
+    """Returns the index of a gcode, or None if it is missing or was built for another version of the file"""
+    index_path = get_gcode_index_path(file_path)
+    try:
+        stat = os.stat(file_path)
+        index_stat = os.stat(index_path)
+    except OSError:
+        return None
+    return _read_gcode_index(index_path, index_stat.st_mtime_ns, stat.st_size, stat.st_mtime_ns)
     
+# Metadata results are cached by content in Moonraker's data path, so rescans and duplicate uploads skip extraction
+MMU_ACE_CACHE_DIR = ".mmu_ace_cache"
+MMU_ACE_CACHE_VERSION = 2
+MMU_ACE_CACHE_SIZE = 256
+MMU_ACE_CACHE_SAMPLE_SIZE = 64 * 1024
+# Directory of the cache, the cache is disabled when unset or empty
+MMU_ACE_CACHE_ENV = "MMU_ACE_METADATA_CACHE"
+MMU_ACE_CACHE_FAST_HASH_ENV = "MMU_ACE_METADATA_FAST_HASH"
+
+def capture_stdout(function, *args) -> bytes:
+    with tempfile.TemporaryFile() as output:
+        sys.stdout.flush()
+        stdout = os.dup(1)
+        os.dup2(output.fileno(), 1)
+        try:
+            function(*args)
+        finally:
+            sys.stdout.flush()
+            os.dup2(stdout, 1)
+            os.close(stdout)
+
+        output.seek(0)
+        return output.read()
+
+def write_stdout(data: bytes):
+    fd = sys.stdout.fileno()
+    while data:
+        data = data[os.write(fd, data):]
+
+class MetadataCache:
+    """Metadata output, thumbnails and MMU processing of gcode files, keyed by size and a hash of their content
+
+    With fast_hash, only the head and tail of large files are hashed. Files differing
+    only in between then share their entry.
+    """
+
+    def __init__(self, path: str, fast_hash: bool = False):
+        self.path = path
+        self.fast_hash = fast_hash
+
+    def get_key(self, file_path: str, check_objects: bool = False) -> str:
+        size = os.path.getsize(file_path)
+        hasher = hashlib.sha256()
+
+        with open(file_path, 'rb') as in_file:
+            if not self.fast_hash or size <= 2 * MMU_ACE_CACHE_SAMPLE_SIZE:
+                for chunk in iter(lambda: in_file.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            else:
+                hasher.update(in_file.read(MMU_ACE_CACHE_SAMPLE_SIZE))
+                in_file.seek(-MMU_ACE_CACHE_SAMPLE_SIZE, os.SEEK_END)
+                hasher.update(in_file.read(MMU_ACE_CACHE_SAMPLE_SIZE))
+
+        # Files processed for exclude object are rewritten, their results are not interchangeable
+        flags = ("p" if self.fast_hash else "f") + ("o" if check_objects else "")
+        return f"{size:x}-{flags}-{hasher.hexdigest()[:32]}"
+
+    def restore(self, key: str, file_path: str, filename: str) -> bool:
+        """Applies a cached result to the file and writes its metadata to stdout, returns False if there is none"""
+        entry_path = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(entry_path, "entry.json"), 'r') as in_file:
+                entry = json.load(in_file)
+        except (OSError, ValueError):
+            return False
+        if entry.get("version") != MMU_ACE_CACHE_VERSION:
+            return False
+
+        if entry["tools_used"] and not gcode_processed_already(file_path):
+            process_file(file_path, entry["tools_used"], entry["total_toolchanges"])
+        if entry["index"] is not None and load_gcode_index(file_path) is None:
+            write_gcode_index(file_path, entry["index"])
+
+        metadata = entry["metadata"]
+        stat = os.stat(file_path)
+        metadata["size"] = stat.st_size
+        metadata["modified"] = stat.st_mtime
+
+        # Thumbnails are named after the file, which may have been renamed or uploaded again under another name
+        directory = os.path.dirname(file_path)
+        base = os.path.splitext(os.path.basename(file_path))[0]
+        for thumbnail, name in zip(metadata.get("thumbnails") or [], entry["thumbnails"]):
+            if name is None:
+                continue
+            thumbnail_directory, thumbnail_name = os.path.split(thumbnail["relative_path"])
+            if thumbnail_name.startswith(entry["base"]):
+                thumbnail_name = base + thumbnail_name[len(entry["base"]):]
+            thumbnail["relative_path"] = os.path.join(thumbnail_directory, thumbnail_name)
+
+            thumbnail_path = os.path.join(directory, thumbnail["relative_path"])
+            if not os.path.isfile(thumbnail_path):
+                os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                shutil.copyfile(os.path.join(entry_path, name), thumbnail_path)
+
+        # Recently used entries are evicted last
+        os.utime(entry_path)
+
+        write_stdout(json.dumps({ "file": filename, "metadata": metadata }).encode())
+        return True
+
+    def store(self, keys: List[str], file_path: str, output: bytes, tools_used: List[int], total_toolchanges: int):
+        result = json.loads(output)
+        metadata = result["metadata"]
+
+        entry_path = os.path.join(self.path, keys[0])
+        temp_path = entry_path + ".tmp"
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+
+        thumbnails = []
+        for i, thumbnail in enumerate(metadata.get("thumbnails") or []):
+            thumbnail_path = os.path.join(os.path.dirname(file_path), thumbnail.get("relative_path", ""))
+            if not os.path.isfile(thumbnail_path):
+                thumbnails.append(None)
+                continue
+            name = f"thumbnail-{i}{os.path.splitext(thumbnail_path)[1]}"
+            shutil.copyfile(thumbnail_path, os.path.join(temp_path, name))
+            thumbnails.append(name)
+
+        entry = {
+            "version": MMU_ACE_CACHE_VERSION,
+            "base": os.path.splitext(os.path.basename(file_path))[0],
+            "metadata": metadata,
+            "thumbnails": thumbnails,
+            "tools_used": tools_used,
+            "total_toolchanges": total_toolchanges,
+            "index": read_gcode_index(file_path)
+        }
+        with open(os.path.join(temp_path, "entry.json"), 'w') as out_file:
+            json.dump(entry, out_file, separators=(',', ':'))
+
+        for key in keys:
+            key_path = os.path.join(self.path, key)
+            shutil.rmtree(key_path, ignore_errors=True)
+            if key_path == entry_path:
+                os.rename(temp_path, key_path)
+            else:
+                shutil.copytree(entry_path, key_path)
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            with contextlib.suppress(OSError):
+                entries.append((os.stat(os.path.join(self.path, name)).st_mtime, name))
+
+        entries.sort()
+        for _, name in entries[:max(len(entries) - MMU_ACE_CACHE_SIZE, 0)]:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+def index_gcode_file(file_path, metadata) -> None:
+    """Indexes the file as Moonraker left it, exclude object processing rewrites it in place"""
+    if not file_path.endswith(".gcode") or load_gcode_index(file_path) is not None:
+        return
+
+    try:
+        start = time.time()
+        write_gcode_index(file_path)
+        metadata.logger.info("Indexing layers and tool changes took %.2fs" % (time.time() - start))
+    except Exception:
+        metadata.logger.info(traceback.format_exc())
+
 def main(config: Dict[str, Any], metadata) -> None:
 
     logging.warning("main setup_anycubic_slicer")
@@ -1541,33 +2456,39 @@ def main(config: Dict[str, Any], metadata) -> None:
         metadata.logger.info(f"File Not Found: {file_path}")
         sys.exit(-1)
 
+    fname = os.path.basename(file_path)
+    check_objects = bool(config.get("check_objects"))
+
+    cache = None
+    cache_path = os.environ.get(MMU_ACE_CACHE_ENV)
+    if cache_path and fname.endswith(".gcode") and not config.get("ufp_path"):
+        cache = MetadataCache(cache_path, os.environ.get(MMU_ACE_CACHE_FAST_HASH_ENV) == "1")
+        try:
+            content_key = cache.get_key(file_path, check_objects)
+            if cache.restore(content_key, file_path, filename):
+                metadata.logger.info(f"mmu_server: Using cached metadata for {file_path}")
+                return
+        except Exception:
+            metadata.logger.info(traceback.format_exc())
+            cache = None
+
+    tools_used = []
+    total_toolchanges = 0
+
     try:
         metadata.logger.info(f"mmu_server: Pre-processing file: {file_path}")
-        fname = os.path.basename(file_path)
         if fname.endswith(".gcode") and not gcode_processed_already(file_path):
-            with tempfile.TemporaryDirectory() as tmp_dir_name:
-                tmp_file = os.path.join(tmp_dir_name, fname)
-
-                start = time.time()
-                parse_result = parse_gcode_file(file_path)
-                slicer = parse_result["slicer"]
-                tools_used = parse_result["tools_used"]
-                total_toolchanges = parse_result["total_toolchanges"]
-                metadata.logger.info("Reading placeholders took %.2fs. Detected gcode by slicer: %s" % (time.time() - start, slicer))
-                metadata.logger.info("Detected tools: %s" % tools_used)
-                
-                if tools_used is not None and len(tools_used) > 0:
-                    process_file(file_path, tmp_file, tools_used, total_toolchanges)
-                    
-                    # Move temporary file back in place
-                    if os.path.islink(file_path):
-                        file_path = os.path.realpath(file_path)
-                    if not filecmp.cmp(tmp_file, file_path):
-                        shutil.move(tmp_file, file_path)
-                    else:
-                        metadata.logger.info(f"Files are the same, skipping replacement of: {file_path} by {tmp_file}")
-                    
-                
+            start = time.time()
+            parse_result = parse_gcode_file(file_path)
+            slicer = parse_result["slicer"]
+            tools_used = parse_result["tools_used"]
+            total_toolchanges = parse_result["total_toolchanges"]
+            metadata.logger.info("Reading placeholders took %.2fs. Detected gcode by slicer: %s" % (time.time() - start, slicer))
+            metadata.logger.info("Detected tools: %s" % tools_used)
+
+            if tools_used is not None and len(tools_used) > 0:
+                process_file(file_path, tools_used, total_toolchanges)
+
     except Exception:
         metadata.logger.info(traceback.format_exc())
         sys.exit(-1)
@@ -1592,19 +2513,40 @@ def main(config: Dict[str, Any], metadata) -> None:
     # log supported slicers
     logging.warning("Adding AnycubicSlicerNext to supported slicers")
     supported_slicers: List[Type[metadata.BaseSlicer]] = metadata.SUPPORTED_SLICERS
-    logging.warning(f"Supported slicers before: {supported_slicers}")
-    supported_slicers.append(AnycubicSlicerNext)
-    logging.warning(f"Supported slicers after: {supported_slicers}")
-    metadata.SUPPORTED_SLICERS = supported_slicers
-    logging.warning(f"Supported slicers after metadata: {supported_slicers}")
+    # Metadata workers run this for every file, only add it once
+    if not any(slicer.__name__ == AnycubicSlicerNext.__name__ for slicer in supported_slicers):
+        logging.warning(f"Supported slicers before: {supported_slicers}")
+        supported_slicers.append(AnycubicSlicerNext)
+        logging.warning(f"Supported slicers after: {supported_slicers}")
+        metadata.SUPPORTED_SLICERS = supported_slicers
+        logging.warning(f"Supported slicers after metadata: {supported_slicers}")
 
     # process file to add referenced_tools metadata
 
-    return metadata.main(config)
+    if cache is None:
+        metadata.main(config)
+        index_gcode_file(file_path, metadata)
+        return
 
-logger = logging.getLogger("mmu_ace_patcher")
+    output = capture_stdout(metadata.main, config)
+    index_gcode_file(file_path, metadata)
+    write_stdout(output)
 
-if __name__ == "__main__":
+    try:
+        keys = [ cache.get_key(file_path, check_objects) ]
+        # Files uploaded again are found before they get processed, unless their processing is more than appending the MMU stamp
+        if content_key != keys[0] and not check_objects:
+            keys.append(content_key)
+        cache.store(keys, file_path, output, tools_used, total_toolchanges)
+    except Exception:
+        metadata.logger.info(traceback.format_exc())
+
+METADATA_WORKER_ARG = "--worker"
+METADATA_WORKER_NICE = 10
+# Each response is a single line holding the whole metadata output, thumbnails and object lists included
+METADATA_WORKER_LIMIT = 16 * 1024 * 1024
+
+def load_metadata_module():
     # Make it look like we are running in the file_manager directory
     directory = os.path.dirname(os.path.abspath(__file__))
     target_dir = directory + "/file_manager"
@@ -1612,8 +2554,10 @@ if __name__ == "__main__":
     sys.path.insert(0, target_dir)
 
     import metadata
+    return metadata
+
+def run_metadata(argv: List[str], metadata) -> None:
     logger = metadata.logger
-    metadata.logger.info("mmu_server: Running MMU enhanced version of metadata")
 
     # Parse start arguments
     parser = argparse.ArgumentParser(
@@ -1636,7 +2580,7 @@ if __name__ == "__main__":
     parser.add_argument(
         "-o", "--check-objects", dest='check_objects', action='store_true',
         help="process gcode file for exclude opbject functionality")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     config: Dict[str, Any] = {}
     if args.config is None:
         if args.filename is None:
@@ -1665,3 +2609,48 @@ if __name__ == "__main__":
     
     main(config, metadata)
 
+def run_metadata_worker(metadata) -> None:
+    """Runs metadata requests read from stdin, one JSON line each, until it is closed"""
+
+    # Responses get their own copy of stdout, anything else printed ends up in the logs
+    channel = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+
+    with contextlib.suppress(OSError):
+        os.nice(METADATA_WORKER_NICE)
+
+    for line in sys.stdin:
+        request = json.loads(line)
+
+        with tempfile.TemporaryFile() as output:
+            os.dup2(output.fileno(), 1)
+            try:
+                run_metadata(request["argv"], metadata)
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except Exception:
+                metadata.logger.info(traceback.format_exc())
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os.dup2(2, 1)
+
+            output.seek(0)
+            response = { "code": code, "output": output.read().decode(errors="replace") }
+
+        channel.write(json.dumps(response) + "\n")
+        channel.flush()
+
+logger = logging.getLogger("mmu_ace_patcher")
+
+if __name__ == "__main__":
+    metadata = load_metadata_module()
+    logger = metadata.logger
+
+    if sys.argv[1:] == [METADATA_WORKER_ARG]:
+        metadata.logger.info("mmu_server: Running MMU enhanced metadata worker")
+        run_metadata_worker(metadata)
+    else:
+        metadata.logger.info("mmu_server: Running MMU enhanced version of metadata")
+        run_metadata(sys.argv[1:], metadata)
@@ -0,0 +1,49 @@
+# Prepares the Moonraker environment, sourced from the app directory by moonraker.sh and app.sh
+# Each step records a hash of its inputs in .cache/ and is skipped on the next start if they did not change
+# Bytecode is compiled at build time by get-packages.sh, with hashes so it stays valid once installed
+
+CONFIG_PATH=/userdata/app/gk/printer_data/config
+COMPONENTS_PATH=moonraker/moonraker/components
+
+hash_files() {
+    stat -L -c '%n %s %Y' "$@" 2>&1 | md5sum | cut -d' ' -f1
+}
+is_cached() {
+    NAME=$1
+    shift
+    [ "$(cat .cache/$NAME 2> /dev/null)" = "$(hash_files "$@")" ]
+}
+set_cached() {
+    NAME=$1
+    shift
+    mkdir -p .cache
+    hash_files "$@" > .cache/$NAME
+}
+install_file() {
+    # Keep the destination untouched if identical, so its bytecode stays valid
+    cmp -s $1 $2 || cp -f $1 $2
+}
+
+# Activate Python venv
+SYSTEM_PYTHON=$(command -v python)
+if ! is_cached venv $SYSTEM_PYTHON pyvenv.cfg bin/activate bin/python; then
+    python -m venv --without-pip . && \
+        set_cached venv $SYSTEM_PYTHON pyvenv.cfg bin/activate bin/python
+fi
+. bin/activate
+
+# Copy Kobra component
+install_file kobra.py $COMPONENTS_PATH/kobra.py
+install_file mmu_ace.py $COMPONENTS_PATH/mmu_ace.py
+install_file /opt/rinkhals/scripts/rinkhals_env.py $COMPONENTS_PATH/rinkhals_env.py
+
+# Generate configuration
+# Inputs are the files read by the last generation, includes resolved, the generated file itself is not one
+[ -f $CONFIG_PATH/moonraker.custom.conf ] || cp moonraker.custom.conf $CONFIG_PATH/moonraker.custom.conf
+CONFIG_INPUTS=$(cat .cache/config.inputs 2> /dev/null)
+if [ ! -f $CONFIG_PATH/moonraker.generated.conf ] || [ -z "$CONFIG_INPUTS" ] || ! is_cached config $CONFIG_INPUTS; then
+    python /opt/rinkhals/scripts/process-cfg.py moonraker.conf > $CONFIG_PATH/moonraker.generated.conf && \
+        CONFIG_INPUTS="/opt/rinkhals/scripts/process-cfg.py $(python /opt/rinkhals/scripts/process-cfg.py --inputs moonraker.conf)" && \
+        set_cached config $CONFIG_INPUTS && \
+        echo $CONFIG_INPUTS > .cache/config.inputs
+fi
@@ -0,0 +1,104 @@
+"""Micro-benchmark of Kobra.patch_status
+
+Compares the previous status patching (linear state cache scan and rewriting
+every hook point) with the current single-pass pipeline.
+
+    python tests/bench_kobra_status.py
+"""
+
+import copy
+import timeit
+import types
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+
+PAYLOADS = [
+    { 'extruder': { 'temperature': 210.3, 'target': 210 }, 'heater_bed': { 'temperature': 60.1, 'target': 60 } },
+    { 'print_stats': { 'state': 'heating', 'print_duration': 12.5, 'filename': '/useremain/app/gk/gcodes/cube.gcode' } },
+    { 'virtual_sdcard': { 'progress': 0.42, 'current_layer': 12, 'file_path': '/useremain/app/gk/gcodes/cube.gcode' }, 'toolhead': { 'position': [ 1, 2, 3, 4 ] } },
+    { 'motion_report': { 'live_position': [ 1, 2, 3, 4 ], 'live_velocity': 10.0 } },
+]
+
+# Number of hooked methods a single payload traverses (process_status_update, send_status, set_result, request)
+HOOK_POINTS = 3
+
+
+def legacy_patch_status(instance, states_cache, status):
+    if 'print_stats' in status:
+        if 'state' in status['print_stats']:
+            state = status['print_stats']['state']
+            if state.lower() == 'heating':
+                state = 'printing'
+            if state.lower() == 'leveling':
+                state = 'printing'
+            if state.lower() == 'resonance':
+                state = 'printing'
+            if state.lower() == 'onpause':
+                state = 'paused'
+            if state not in states_cache:
+                states_cache.append(state)
+            state = [ s for s in states_cache if s == state ][0]
+            status['print_stats']['state'] = state
+            if 'idle_timeout' not in status:
+                status['idle_timeout'] = {}
+            status['idle_timeout']['state'] = state
+        if 'filename' in status['print_stats']:
+            status['print_stats']['filename'] = status['print_stats']['filename'].replace('/useremain/app/gk/gcodes/', '')
+    if 'virtual_sdcard' in status:
+        if 'total_layer' in status['virtual_sdcard']:
+            instance._total_layer = status['virtual_sdcard']['total_layer']
+        if 'current_layer' in status['virtual_sdcard']:
+            if 'print_stats' not in status:
+                status['print_stats'] = {}
+            if 'info' not in status['print_stats']:
+                status['print_stats']['info'] = {}
+            status['print_stats']['info']['current_layer'] = status['virtual_sdcard']['current_layer']
+            status['print_stats']['info']['total_layer'] = instance._total_layer
+        if 'file_path' in status['virtual_sdcard']:
+            status['virtual_sdcard']['file_path'] = status['virtual_sdcard']['file_path'].replace('/useremain/app/gk/gcodes/', '')
+    for patcher in instance.status_patchers:
+        status = patcher(status)
+    return status
+
+
+def build_kobra():
+    instance = object.__new__(kobra.Kobra)
+    instance.goklipper = types.SimpleNamespace(running=True)
+    instance.metrics = kobra.KobraMetrics()
+    instance._states_cache = {}
+    instance.status_patchers = [ lambda status: status ]
+    instance.object_patchers = {
+        'print_stats': [ instance._patch_print_stats ],
+        'virtual_sdcard': [ instance._patch_virtual_sdcard ]
+    }
+    return instance
+
+
+def main():
+    instance = build_kobra()
+    states_cache = [ 'standby', 'complete', 'cancelled', 'error', 'paused' ]
+    payloads = [ copy.deepcopy(p) for p in PAYLOADS ] * 250
+
+    def run_legacy():
+        for payload in payloads:
+            status = dict(payload)
+            for _ in range(HOOK_POINTS):
+                status = legacy_patch_status(instance, states_cache, status)
+
+    def run_pipeline():
+        for payload in payloads:
+            status = payload
+            for _ in range(HOOK_POINTS):
+                status = instance.patch_status(status)
+
+    for name, function in (('legacy', run_legacy), ('pipeline', run_pipeline)):
+        duration = min(timeit.repeat(function, number=10, repeat=5)) / 10
+        per_update = duration / len(payloads) * 1e6
+        print(f'{name:>10}: {per_update:6.2f} us per status update ({HOOK_POINTS} hook points)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark of the G-code metadata scan in mmu_ace.parse_gcode_file
+
+Compares the previous scan (two line by line text passes) with the current
+single pass over an mmap of the file, on a synthetic multi-color G-code file,
+and measures building the layer and tool change index.
+
+    python tests/bench_mmu_gcode_scan.py [size in MB, default 200]
+"""
+
+import importlib.util
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+HEADER = """; HEADER_BLOCK_START
+; generated by OrcaSlicer 2.1.1 on 2024-05-01 at 10:00:00
+; total layer number: 500
+; HEADER_BLOCK_END
+
+"""
+
+LEGACY_TOOL_DISCOVERY_REGEX = r"((^MMU_CHANGE_TOOL(_STANDALONE)? .*?TOOL=)|(^T))(?P<tool>\d{1,2})"
+
+# Roughly one tool change every 2000 moves
+MOVES_PER_TOOLCHANGE = 2000
+
+
+def legacy_parse_gcode_file(file_path):
+    slicer_regex = re.compile(mmu_ace.SLICER_REGEX, re.IGNORECASE)
+    slicer = None
+
+    tools_used = set()
+    total_toolchanges = 0
+
+    with open(file_path, 'r') as in_file:
+        for line in in_file:
+            if not slicer and line.startswith(";"):
+                match = slicer_regex.match(line)
+                if match:
+                    slicer = match.group(1) or match.group(2)
+    if slicer in mmu_ace.AUTHORZIED_SLICERS:
+        tools_regex = re.compile(LEGACY_TOOL_DISCOVERY_REGEX, re.IGNORECASE)
+
+        with open(file_path, 'r') as in_file:
+            for line in in_file:
+                match = tools_regex.match(line)
+                if match:
+                    tools_used.add(int(match.group("tool")))
+                    total_toolchanges += 1
+
+    return {
+        "slicer": slicer,
+        "tools_used": sorted(tools_used),
+        "total_toolchanges": total_toolchanges,
+    }
+
+
+def write_gcode(path, size):
+    random.seed(0)
+    moves = [ f"G1 X{random.uniform(0, 250):.3f} Y{random.uniform(0, 250):.3f} E{random.uniform(0, 2):.5f}\n" for _ in range(MOVES_PER_TOOLCHANGE) ]
+    block_moves = "".join(moves)
+
+    with open(path, 'w') as out_file:
+        out_file.write(HEADER)
+        written = len(HEADER)
+        tool = 0
+        while written < size:
+            block = f"; CHANGE_LAYER\nT{tool}\n{block_moves}"
+            out_file.write(block)
+            written += len(block)
+            tool = (tool + 1) % 8
+
+
+def measure(function, path):
+    start = time.perf_counter()
+    result = function(path)
+    return time.perf_counter() - start, result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.gcode")
+        write_gcode(path, size * 1024 * 1024)
+
+        results = []
+        for name, function in (('legacy', legacy_parse_gcode_file), ('mmap', mmu_ace.parse_gcode_file)):
+            duration, result = min(measure(function, path) for _ in range(3))
+            results.append(result)
+            print(f'{name:>10}: {duration:6.2f} s for {size} MB ({size / duration:7.1f} MB/s)')
+
+        assert results[0] == results[1], results
+
+        duration, _ = min(measure(mmu_ace.write_gcode_index, path) for _ in range(3))
+        print(f'{"index":>10}: {duration:6.2f} s for {size} MB ({size / duration:7.1f} MB/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import importlib.util
+import sys
+import types
+from enum import Enum
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/kobra.py"
+ENV_MODULE_PATH = Path(__file__).resolve().parents[1] / "files/3-rinkhals/opt/rinkhals/scripts/rinkhals_env.py"
+PACKAGE = "moonraker_for_test"
+
+
+class Sentinel(Enum):
+    MISSING = object()
+
+
+class WebRequest:
+    def __init__(self, endpoint: str, args: dict | None = None, action: str = "GET"):
+        self.endpoint = endpoint
+        self.args = args if args is not None else {}
+        self.action = action
+
+    def get_endpoint(self) -> str:
+        return self.endpoint
+
+    def get_action(self) -> str:
+        return self.action
+
+    def get_args(self) -> dict:
+        return self.args
+
+    def get_str(self, key: str, default=None):
+        return self.args.get(key, default)
+
+    def get_float(self, key: str, default=None):
+        value = self.args.get(key, default)
+        return float(value) if value is not None else None
+
+    def get_boolean(self, key: str, default=None):
+        return bool(self.args.get(key, default))
+
+
+class PowerDevice:
+    def __init__(self, config):
+        self.name = config.get_name()
+        self.state = None
+
+    def notify_power_changed(self):
+        pass
+
+
+def _module(name: str, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def _load(module_name: str, path: Path) -> types.ModuleType:
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    assert spec.loader is not None
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_kobra():
+    """Import kobra.py as a Moonraker component backed by minimal stand-ins"""
+
+    module_name = f"{PACKAGE}.components.kobra"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    package = _module(PACKAGE, __path__=[])
+    components = _module(f"{PACKAGE}.components", __path__=[])
+    sys.modules.setdefault(PACKAGE, package)
+    sys.modules.setdefault(f"{PACKAGE}.components", components)
+    sys.modules.setdefault(f"{PACKAGE}.utils", _module(f"{PACKAGE}.utils", Sentinel=Sentinel))
+    sys.modules.setdefault(f"{PACKAGE}.common", _module(f"{PACKAGE}.common", WebRequest=WebRequest))
+    sys.modules.setdefault(f"{PACKAGE}.components.power", _module(f"{PACKAGE}.components.power", PowerDevice=PowerDevice))
+
+    if importlib.util.find_spec("paho") is None:
+        client = _module("paho.mqtt.client", Client=object, MQTTv5=5)
+        sys.modules.setdefault("paho", _module("paho", __path__=[]))
+        sys.modules.setdefault("paho.mqtt", _module("paho.mqtt", __path__=[], client=client))
+        sys.modules.setdefault("paho.mqtt.client", client)
+
+    # Copied next to kobra.py by moonraker.sh
+    if f"{PACKAGE}.components.rinkhals_env" not in sys.modules:
+        _load(f"{PACKAGE}.components.rinkhals_env", ENV_MODULE_PATH)
+
+    return _load(module_name, MODULE_PATH)
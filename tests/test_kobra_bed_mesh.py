@@ -0,0 +1,203 @@
+import json
+import os
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+
+
+def _write_mesh(path, points, mtime_ns):
+    path.write_text(json.dumps({
+        'bed_mesh default': {
+            'points': points,
+            'min_x': '5', 'max_x': '215', 'min_y': '5', 'max_y': '215',
+            'x_count': '2', 'y_count': '2', 'mesh_x_pps': '2', 'mesh_y_pps': '2',
+            'tension': '0.2', 'algo': 'bicubic'
+        }
+    }))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _build_service(tmp_path, pushed=None):
+    path = tmp_path / 'printer_mutable.cfg'
+    files = kobra.CachedFileRegistry(check_interval=0)
+    files.register(str(path), json.loads)
+    service = kobra.BedMeshService(files, str(path), on_change=pushed.append if pushed is not None else None)
+    return path, files, service
+
+
+def test_bed_mesh_status_is_built_once(tmp_path, monkeypatch):
+    path, _, service = _build_service(tmp_path)
+    _write_mesh(path, '0.1, 0.2\n0.3, 0.4', 1_000_000_000)
+
+    first = service.get_status()
+    assert first['bed_mesh']['probed_matrix'] == [[0.1, 0.2], [0.3, 0.4]]
+    assert first['bed_mesh']['mesh_min'] == (5.0, 5.0)
+    assert first['bed_mesh default']['mesh_params']['algo'] == 'bicubic'
+    assert first['bed_mesh "default"'] == {}
+
+    monkeypatch.setattr(kobra.BedMeshService, '_build_status', staticmethod(lambda mesh: 1 / 0))
+    assert service.get_status() is first
+    assert service.get_mesh_map() is service.get_mesh_map()
+    assert json.loads(service.get_mesh_map()[len('mesh_map_output '):])['z_positions'] == [[0.1, 0.2], [0.3, 0.4]]
+
+
+def test_bed_mesh_pushes_new_calibrations(tmp_path):
+    pushed = []
+    path, files, service = _build_service(tmp_path, pushed)
+    _write_mesh(path, '0.1, 0.2\n0.3, 0.4', 1_000_000_000)
+    service.get_status()
+
+    _write_mesh(path, '0.5, 0.6\n0.7, 0.8', 2_000_000_000)
+    files.refresh(str(path))
+
+    assert len(pushed) == 1
+    assert pushed[0]['bed_mesh']['probed_matrix'] == [[0.5, 0.6], [0.7, 0.8]]
+    assert service.get_status() is pushed[0]
+
+
+def test_bed_mesh_without_mesh(tmp_path):
+    path, _, service = _build_service(tmp_path)
+
+    assert service.get_status() == { 'bed_mesh': {}, 'bed_mesh default': {}, 'bed_mesh "default"': {} }
+    assert service.get_mesh_map() is None
+
+    path.write_text(json.dumps({ 'bed_mesh default': { 'points': '0.1' } }))
+    assert service.get_status()['bed_mesh'] == {}
+
+
+class KlipperZMesh:
+    """Straight port of Klipper's ZMesh sampling loops, used as reference"""
+
+    def __init__(self, params):
+        self.params = params
+        self.x_mult = params['mesh_x_pps'] + 1
+        self.y_mult = params['mesh_y_pps'] + 1
+        self.mesh_x_count = (params['x_count'] - 1) * params['mesh_x_pps'] + params['x_count']
+        self.mesh_y_count = (params['y_count'] - 1) * params['mesh_y_pps'] + params['y_count']
+        self.mesh_x_dist = (params['max_x'] - params['min_x']) / (self.mesh_x_count - 1)
+        self.mesh_y_dist = (params['max_y'] - params['min_y']) / (self.mesh_y_count - 1)
+
+    def get_x_coordinate(self, index):
+        return self.params['min_x'] + self.mesh_x_dist * index
+
+    def get_y_coordinate(self, index):
+        return self.params['min_y'] + self.mesh_y_dist * index
+
+    def _init_matrix(self, z_matrix):
+        self.mesh_matrix = [[0. if ((i % self.x_mult) or (j % self.y_mult)) else z_matrix[j // self.y_mult][i // self.x_mult]
+                             for i in range(self.mesh_x_count)] for j in range(self.mesh_y_count)]
+
+    def sample_lagrange(self, z_matrix):
+        self._init_matrix(z_matrix)
+        xpts = [self.get_x_coordinate(i * self.x_mult) for i in range(self.params['x_count'])]
+        ypts = [self.get_y_coordinate(j * self.y_mult) for j in range(self.params['y_count'])]
+        for i in range(0, self.mesh_y_count, self.y_mult):
+            for j in range(self.mesh_x_count):
+                if j % self.x_mult:
+                    self.mesh_matrix[i][j] = self._calc_lagrange(xpts, self.get_x_coordinate(j), i, 0)
+        for i in range(self.mesh_x_count):
+            for j in range(self.mesh_y_count):
+                if j % self.y_mult:
+                    self.mesh_matrix[j][i] = self._calc_lagrange(ypts, self.get_y_coordinate(j), i, 1)
+        return self.mesh_matrix
+
+    def _calc_lagrange(self, lpts, c, vec, axis):
+        total = 0.
+        for i in range(len(lpts)):
+            n = d = 1.
+            for j in range(len(lpts)):
+                if j != i:
+                    n *= c - lpts[j]
+                    d *= lpts[i] - lpts[j]
+            z = self.mesh_matrix[vec][i * self.x_mult] if axis == 0 else self.mesh_matrix[i * self.y_mult][vec]
+            total += z * n / d
+        return total
+
+    def sample_bicubic(self, z_matrix):
+        self._init_matrix(z_matrix)
+        tension = self.params['tension']
+        for y in range(0, self.mesh_y_count, self.y_mult):
+            for x in range(self.mesh_x_count):
+                if x % self.x_mult:
+                    self.mesh_matrix[y][x] = self._spline(self._ctl_pts(self.mesh_matrix[y], x, self.x_mult), tension)
+        for x in range(self.mesh_x_count):
+            column = [row[x] for row in self.mesh_matrix]
+            for y in range(self.mesh_y_count):
+                if y % self.y_mult:
+                    self.mesh_matrix[y][x] = self._spline(self._ctl_pts(column, y, self.y_mult), tension)
+        return self.mesh_matrix
+
+    @staticmethod
+    def _ctl_pts(line, x, mult):
+        last_pt = len(line) - 1 - mult
+        if x < mult:
+            return line[0], line[0], line[mult], line[2 * mult], x / float(mult)
+        if x > last_pt:
+            return line[last_pt - mult], line[last_pt], line[last_pt + mult], line[last_pt + mult], (x - last_pt) / float(mult)
+        for i in range(mult, last_pt, mult):
+            if i < x < i + mult:
+                return line[i - mult], line[i], line[i + mult], line[i + 2 * mult], (x - i) / float(mult)
+
+    @staticmethod
+    def _spline(p, tension):
+        t = p[4]
+        t2 = t * t
+        t3 = t2 * t
+        m1 = tension * (p[2] - p[0])
+        m2 = tension * (p[3] - p[1])
+        return p[1] * (2 * t3 - 3 * t2 + 1) + p[2] * (-2 * t3 + 3 * t2) + m1 * (t3 - 2 * t2 + t) + m2 * (t3 - t2)
+
+
+def _assert_close(actual, expected):
+    assert len(actual) == len(expected)
+    for actual_row, expected_row in zip(actual, expected):
+        assert len(actual_row) == len(expected_row)
+        assert all(abs(a - e) < 1e-6 for a, e in zip(actual_row, expected_row))
+
+
+def _params(x_count, y_count, pps, algo, tension=0.2):
+    return {
+        'min_x': 5.0, 'max_x': 215.0, 'min_y': 10.0, 'max_y': 220.0,
+        'x_count': x_count, 'y_count': y_count, 'mesh_x_pps': pps, 'mesh_y_pps': pps + 1,
+        'tension': tension, 'algo': algo
+    }
+
+
+POINTS_5X4 = [
+    [0.11, -0.05, 0.02, 0.31, 0.12],
+    [-0.21, 0.04, 0.07, -0.08, 0.0],
+    [0.05, 0.14, -0.12, 0.22, -0.3],
+    [0.4, 0.0, 0.09, -0.01, 0.18],
+]
+
+
+def test_mesh_matrix_matches_klipper_bicubic():
+    params = _params(5, 4, 2, 'bicubic', tension=0.35)
+    _assert_close(kobra.build_mesh_matrix(POINTS_5X4, params), KlipperZMesh(params).sample_bicubic(POINTS_5X4))
+
+
+def test_mesh_matrix_matches_klipper_lagrange():
+    params = _params(5, 4, 3, 'lagrange')
+    _assert_close(kobra.build_mesh_matrix(POINTS_5X4, params), KlipperZMesh(params).sample_lagrange(POINTS_5X4))
+
+
+def test_mesh_matrix_falls_back_like_klipper():
+    points = [row[:3] for row in POINTS_5X4[:3]]
+
+    bicubic = _params(3, 3, 2, 'bicubic')
+    _assert_close(kobra.build_mesh_matrix(points, bicubic), KlipperZMesh(bicubic).sample_lagrange(points))
+
+    direct = dict(bicubic, mesh_x_pps=0, mesh_y_pps=0)
+    assert kobra.build_mesh_matrix(points, direct) == points
+
+
+def test_mesh_statistics():
+    stats = kobra.get_mesh_statistics([[0.1, -0.1], [0.3, 0.1]])
+
+    assert stats['min'] == -0.1
+    assert stats['max'] == 0.3
+    assert stats['range'] == 0.4
+    assert stats['mean'] == 0.1
+    assert stats['variance'] == 0.02
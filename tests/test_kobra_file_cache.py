@@ -0,0 +1,81 @@
+import json
+import os
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+CachedFileRegistry = kobra.CachedFileRegistry
+
+
+def _touch(path, content: str, mtime_ns: int):
+    path.write_text(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_registry_parses_once_and_reloads_on_change(tmp_path):
+    path = tmp_path / 'printer_mutable.cfg'
+    _touch(path, json.dumps({'bed_mesh default': {'x_count': 5}}), 1_000_000_000)
+
+    parsed = []
+
+    def parser(content):
+        parsed.append(content)
+        return json.loads(content)
+
+    notified = []
+    registry = CachedFileRegistry(check_interval=0)
+    registry.register(str(path), parser, notified.append)
+
+    assert registry.get(str(path)) == {'bed_mesh default': {'x_count': 5}}
+    assert registry.get(str(path)) == {'bed_mesh default': {'x_count': 5}}
+    assert len(parsed) == 1
+    assert notified == []
+
+    _touch(path, json.dumps({'bed_mesh default': {'x_count': 7}}), 2_000_000_000)
+
+    assert registry.get(str(path)) == {'bed_mesh default': {'x_count': 7}}
+    assert len(parsed) == 2
+    assert notified == [{'bed_mesh default': {'x_count': 7}}]
+
+
+def test_registry_throttles_mtime_checks(tmp_path):
+    path = tmp_path / 'remote_ctrl_mode'
+    _touch(path, 'lan\n', 1_000_000_000)
+
+    registry = CachedFileRegistry(check_interval=3600)
+    registry.register(str(path), lambda content: content.strip())
+
+    assert registry.get(str(path)) == 'lan'
+    _touch(path, 'cloud\n', 2_000_000_000)
+    assert registry.get(str(path)) == 'lan'
+
+    registry.refresh(str(path))
+    assert registry.get(str(path)) == 'cloud'
+
+
+def test_registry_handles_missing_and_invalid_files(tmp_path):
+    registry = CachedFileRegistry(check_interval=0)
+
+    assert registry.get(str(tmp_path / 'missing.cfg')) is None
+
+    path = tmp_path / 'invalid.cfg'
+    path.write_text('{ not json')
+    registry.register(str(path), json.loads)
+    assert registry.get(str(path)) is None
+
+
+def test_parse_printer_config_sections():
+    config = kobra.parse_printer_config(
+        '[leviQ3]\n'
+        'bed_temp: 65 # comment\n'
+        'extru_temp = 175\n'
+        '\n'
+        '[fan_generic box_fan]\n'
+        'pin: PA1\n'
+        'gcode:\n'
+        '    M118 nested\n'
+    )
+
+    assert config['leviQ3'] == {'bed_temp': '65', 'extru_temp': '175'}
+    assert config['fan_generic box_fan'] == {'pin': 'PA1', 'gcode': ''}
@@ -0,0 +1,73 @@
+import asyncio
+import shlex
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+GCodeRouter = kobra.GCodeRouter
+
+
+def _route(router, script):
+    forwarded = []
+
+    async def delegate(chunk):
+        forwarded.append(chunk)
+        return 'ok'
+
+    result = asyncio.run(router.route(script, delegate))
+    return result, forwarded
+
+
+def test_router_forwards_scripts_without_handlers_untouched():
+    router = GCodeRouter()
+    router.register('MMU_SELECT', lambda args, delegate: None)
+
+    script = 'G28\nG1 X10 Y10\nM104 S200'
+    result, forwarded = _route(router, script)
+
+    assert result == 'ok'
+    assert forwarded == [script]
+    assert forwarded[0] is script
+
+
+def test_router_dispatches_commands_in_the_middle_of_macros():
+    router = GCodeRouter()
+    calls = []
+
+    async def handle_select(args, delegate):
+        calls.append(args)
+
+    router.register('MMU_SELECT', handle_select)
+
+    result, forwarded = _route(router, 'G28\nG1 Z5\n  mmu_select TOOL=1 GATE=2\nG1 X10\nM400\nMMU_SELECT TOOL=0\n')
+
+    assert calls == [{'TOOL': '1', 'GATE': '2'}, {'TOOL': '0'}]
+    assert forwarded == ['G28\nG1 Z5', 'G1 X10\nM400']
+    assert result is None
+
+
+def test_router_delegate_forwards_the_intercepted_line():
+    router = GCodeRouter()
+
+    async def handle_print(args, delegate):
+        return await delegate()
+
+    router.register('SDCARD_PRINT_FILE', handle_print)
+    router.register('SDCARD_PRINT', lambda args, delegate: None)
+
+    result, forwarded = _route(router, 'SDCARD_PRINT_FILE FILENAME="my cube.gcode"\r\nSDCARD_PRINTER')
+
+    assert result == 'ok'
+    assert forwarded == ['SDCARD_PRINT_FILE FILENAME="my cube.gcode"', 'SDCARD_PRINTER']
+
+
+def test_router_parses_arguments_like_shlex():
+    line = ''' MAP="{0: {'name': 'PLA Red', 'color': \\"ff0000\\"}}" GROUPS='[0, 1]' FLAG TEXT=a\\ b EMPTY= NAME="a"'b' '''
+
+    expected = {}
+    for part in shlex.split(line):
+        key, _, value = part.partition('=')
+        expected[key] = value if '=' in part else None
+
+    assert GCodeRouter.parse_args(line) == expected
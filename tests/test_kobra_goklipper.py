@@ -0,0 +1,94 @@
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+GoKlipperWatcher = kobra.GoKlipperWatcher
+
+
+class StubTimer:
+    def __init__(self, callback):
+        self.callback = callback
+        self.running = False
+
+    def start(self, delay: float = 0.):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+
+class StubEventLoop:
+    aioloop = None
+
+    def register_timer(self, callback):
+        return StubTimer(callback)
+
+
+class StubServer:
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+
+    def get_event_loop(self):
+        return StubEventLoop()
+
+    def send_event(self, name: str, payload: dict):
+        self.events.append((name, payload))
+
+
+def _add_process(proc_root, pid: int, cmdline: bytes, start_time: str = '1000'):
+    process = proc_root / str(pid)
+    process.mkdir()
+    (process / 'cmdline').write_bytes(cmdline)
+    fields = ['S'] + ['0'] * 18 + [start_time] + ['0'] * 10
+    (process / 'stat').write_text(f'{pid} (name with spaces) ' + ' '.join(fields))
+
+
+def _build_watcher(proc_root, monkeypatch):
+    # Force the /proc polling fallback
+    monkeypatch.delattr(kobra.os, 'pidfd_open', raising=False)
+    return GoKlipperWatcher(StubServer(), proc_root=str(proc_root))
+
+
+def test_watcher_resolves_gklib_from_proc(tmp_path, monkeypatch):
+    _add_process(tmp_path, 12, b'/bin/sh\x00-c\x00sleep')
+    _add_process(tmp_path, 34, b'./gklib\x00-a\x00/tmp/unix_uds1')
+    (tmp_path / 'self').mkdir()
+
+    watcher = _build_watcher(tmp_path, monkeypatch)
+    watcher.start()
+
+    assert watcher.running
+    assert watcher.pid == 34
+    assert watcher._poll_timer.running
+    assert watcher.server.events == [('kobra:goklipper_state_changed', {'running': True, 'pid': 34})]
+
+
+def test_watcher_detects_exit_and_pid_reuse(tmp_path, monkeypatch):
+    _add_process(tmp_path, 34, b'gklib', start_time='1000')
+
+    watcher = _build_watcher(tmp_path, monkeypatch)
+    watcher.start()
+    watcher._poll(0)
+    assert watcher.running
+
+    # Same PID, different process
+    (tmp_path / '34' / 'stat').write_text('34 (other) S ' + ' '.join(['0'] * 18 + ['2000']))
+    watcher._poll(0)
+
+    assert not watcher.running
+    assert watcher._search_timer.running
+    assert watcher.server.events[-1] == ('kobra:goklipper_state_changed', {'running': False, 'pid': None})
+
+
+def test_watcher_searches_until_gklib_starts(tmp_path, monkeypatch):
+    watcher = _build_watcher(tmp_path, monkeypatch)
+    watcher.start()
+
+    assert not watcher.running
+    assert watcher._search_timer.running
+
+    _add_process(tmp_path, 56, b'gklib')
+    watcher._search(0)
+
+    assert watcher.pid == 56
+    assert not watcher._search_timer.running
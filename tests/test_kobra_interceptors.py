@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from kobra_harness import WebRequest, load_kobra
+
+
+kobra = load_kobra()
+KlippyInterceptors = kobra.KlippyInterceptors
+
+
+class KlippyConnection:
+    def __init__(self):
+        self.requests = []
+
+    async def request(self, web_request):
+        self.requests.append((web_request.get_endpoint(), dict(web_request.get_args())))
+        if web_request.get_args().get('fail'):
+            raise RuntimeError('Klippy error')
+        return { 'endpoint': web_request.get_endpoint() }
+
+    async def _request_standard(self, web_request, timeout=None):
+        return { 'endpoint': web_request.get_endpoint(), 'timeout': timeout }
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    monkeypatch.setattr(KlippyConnection, 'request', KlippyConnection.request)
+    monkeypatch.setattr(KlippyConnection, '_request_standard', KlippyConnection._request_standard)
+    return KlippyConnection()
+
+
+def _recorder(calls, name):
+    async def intercept(web_request, call_next):
+        calls.append(name)
+        return await call_next(web_request)
+    return intercept
+
+
+def _request(connection, endpoint, **args):
+    return asyncio.run(KlippyConnection.request(connection, WebRequest(endpoint, args)))
+
+
+def test_interceptors_run_by_order_for_their_endpoint(connection):
+    interceptors = KlippyInterceptors()
+    calls = []
+    interceptors.register(KlippyConnection, 'request', None, _recorder(calls, 'all'), order=90)
+    interceptors.register(KlippyConnection, 'request', 'gcode/script', _recorder(calls, 'gcode'), order=40)
+    interceptors.register(KlippyConnection, 'request', 'objects/query', _recorder(calls, 'query'), order=10)
+
+    assert _request(connection, 'gcode/script', script='G28') == { 'endpoint': 'gcode/script' }
+    assert calls == [ 'gcode', 'all' ]
+
+    calls.clear()
+    _request(connection, 'objects/query')
+    assert calls == [ 'query', 'all' ]
+
+    calls.clear()
+    _request(connection, 'info')
+    assert calls == [ 'all' ]
+    assert len(connection.requests) == 3
+
+
+def test_interceptors_can_short_circuit_and_rewrite(connection):
+    interceptors = KlippyInterceptors()
+
+    async def intercept(web_request, call_next):
+        if web_request.get_str('script') == 'M117':
+            return 'handled'
+        web_request.args = { 'script': web_request.get_str('script').upper() }
+        return await call_next(web_request)
+
+    interceptors.register(KlippyConnection, 'request', 'gcode/script', intercept)
+
+    assert _request(connection, 'gcode/script', script='M117') == 'handled'
+    _request(connection, 'gcode/script', script='g28')
+    assert connection.requests == [ ('gcode/script', { 'script': 'G28' }) ]
+
+
+def test_changed_endpoint_continues_on_its_chain(connection):
+    interceptors = KlippyInterceptors()
+    calls = []
+
+    async def help(web_request, call_next):
+        calls.append('help')
+        web_request.endpoint = 'gcode/help'
+        return await call_next(web_request)
+
+    interceptors.register(KlippyConnection, 'request', 'gcode/help', _recorder(calls, 'outer help'), order=10)
+    interceptors.register(KlippyConnection, 'request', 'gcode/script', help, order=30)
+    interceptors.register(KlippyConnection, 'request', 'gcode/help', _recorder(calls, 'inner help'), order=50)
+    interceptors.register(KlippyConnection, 'request', 'gcode/script', _recorder(calls, 'gcode'), order=60)
+
+    assert _request(connection, 'gcode/script', script='help') == { 'endpoint': 'gcode/help' }
+    assert calls == [ 'help', 'inner help' ]
+
+
+def test_interceptors_count_calls_and_errors(connection):
+    interceptors = KlippyInterceptors()
+    interceptors.register(KlippyConnection, 'request', None, _recorder([], 'all'), name='all')
+
+    _request(connection, 'info')
+    with pytest.raises(RuntimeError):
+        _request(connection, 'info', fail=True)
+
+    stats = interceptors.get_stats()
+    assert [ (s['name'], s['calls'], s['errors']) for s in stats ] == [ ('all', 2, 1) ]
+    assert stats[0]['duration'] >= 0
+
+    metrics = interceptors.render()
+    assert 'kobra_interceptor_calls_total{method="request",interceptor="all"} 2' in metrics
+    assert 'kobra_interceptor_errors_total{method="request",interceptor="all"} 1' in metrics
+
+
+def test_keyword_arguments_are_forwarded(connection):
+    interceptors = KlippyInterceptors()
+    calls = []
+    interceptors.register(KlippyConnection, '_request_standard', 'info', _recorder(calls, 'info'))
+    interceptors.register(KlippyConnection, '_request_standard', 'objects/list', _recorder(calls, 'list'))
+
+    async def request(endpoint):
+        return await KlippyConnection._request_standard(connection, WebRequest(endpoint, {}), timeout=20.0)
+
+    assert asyncio.run(request('info')) == { 'endpoint': 'info', 'timeout': 20.0 }
+    assert asyncio.run(request('server/info')) == { 'endpoint': 'server/info', 'timeout': 20.0 }
+    assert calls == [ 'info' ]
@@ -0,0 +1,81 @@
+import types
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+KobraMetrics = kobra.KobraMetrics
+
+
+def test_metrics_render_cumulative_histograms():
+    metrics = KobraMetrics()
+    metrics.observe('kobra_klippy_request_duration_seconds', 0.002, 'objects/query')
+    metrics.observe('kobra_klippy_request_duration_seconds', 0.02, 'objects/query')
+    metrics.observe('kobra_klippy_request_duration_seconds', 30, 'gcode/"script"')
+
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE kobra_klippy_request_duration_seconds histogram' in lines
+    assert 'kobra_klippy_request_duration_seconds_bucket{endpoint="objects/query",le="0.001"} 0' in lines
+    assert 'kobra_klippy_request_duration_seconds_bucket{endpoint="objects/query",le="0.0025"} 1' in lines
+    assert 'kobra_klippy_request_duration_seconds_bucket{endpoint="objects/query",le="0.025"} 2' in lines
+    assert 'kobra_klippy_request_duration_seconds_bucket{endpoint="objects/query",le="+Inf"} 2' in lines
+    assert 'kobra_klippy_request_duration_seconds_count{endpoint="objects/query"} 2' in lines
+    assert 'kobra_klippy_request_duration_seconds_bucket{endpoint="gcode/\\"script\\"",le="10"} 0' in lines
+    assert 'kobra_klippy_request_duration_seconds_bucket{endpoint="gcode/\\"script\\"",le="+Inf"} 1' in lines
+
+
+def test_metrics_count_status_updates(monkeypatch):
+    clock = [ 100.0 ]
+    monkeypatch.setattr(kobra.time, 'monotonic', lambda: clock[0])
+
+    metrics = KobraMetrics()
+    for _ in range(10):
+        metrics.count_status_update()
+    clock[0] += 2.0
+    metrics.count_status_update()
+
+    lines = metrics.render().splitlines()
+    assert 'kobra_status_updates_total 11' in lines
+    assert 'kobra_status_updates_per_second 5.500' in lines
+
+
+def _instance(status_metrics):
+    instance = object.__new__(kobra.Kobra)
+    instance.goklipper = types.SimpleNamespace(running=True)
+    instance.metrics = KobraMetrics()
+    instance.status_metrics = status_metrics
+    instance.status_patchers = []
+    instance.object_patchers = {}
+    return instance
+
+
+def test_patch_status_records_patcher_timings():
+    instance = _instance(status_metrics=True)
+
+    def mmu_patcher(status):
+        status['mmu'] = { 'gate': 0, 'tool': 1 }
+        return status
+
+    instance.register_status_patcher(mmu_patcher)
+    instance.patch_status({ 'extruder': { 'temperature': 210, 'target': 210 } })
+
+    patch = instance.metrics.histograms['kobra_status_patch_duration_seconds'][None]
+    patcher = instance.metrics.histograms['kobra_status_patcher_duration_seconds']['test_patch_status_records_patcher_timings.<locals>.mmu_patcher']
+    fields = instance.metrics.histograms['kobra_status_payload_fields'][None]
+
+    assert patch.count == 1
+    assert patcher.count == 1
+    assert fields.count == 1 and fields.sum == 4
+
+
+def test_patch_status_skips_timings_by_default():
+    instance = _instance(status_metrics=False)
+    instance.register_status_patcher(lambda status: { **status, 'mmu': {} })
+
+    status = instance.patch_status({ 'extruder': { 'temperature': 210 } })
+
+    assert status['mmu'] == {}
+    assert instance.metrics.status_patch_duration.count == 0
+    assert instance.metrics.status_payload_fields.count == 0
+    assert instance.metrics.histograms['kobra_status_patcher_duration_seconds'] == {}
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import types
+
+import pytest
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+KobraMqttSession = kobra.KobraMqttSession
+
+
+class StubBroker:
+    """Stands in for the gkapi broker, replies to print requests from a network thread"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.published: list[tuple[str, dict]] = []
+        self.subscriptions: list[str] = []
+        self.connections = 0
+        self.reason_code = 0
+
+    def client(self):
+        return StubClient(self)
+
+
+class StubClient:
+    def __init__(self, broker: StubBroker):
+        self.broker = broker
+
+    def username_pw_set(self, username, password):
+        self.credentials = (username, password)
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        pass
+
+    def connect_async(self, host, port):
+        self.address = (host, port)
+
+    def loop_start(self):
+        self.broker.connections += 1
+        threading.Thread(target=self.on_connect, args=(self, None, {}, self.broker.reason_code, None)).start()
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.on_disconnect(self, None, 0, None)
+
+    def subscribe(self, topic):
+        self.broker.subscriptions.append(topic)
+
+    def publish(self, topic, payload, qos):
+        request = json.loads(payload)
+        self.broker.published.append((topic, request))
+        reply = self.broker.replies(request)
+        if reply is not None:
+            message = types.SimpleNamespace(payload=json.dumps(reply).encode())
+            threading.Thread(target=self.on_message, args=(self, None, message)).start()
+
+
+def _run(broker: StubBroker, coroutine_factory):
+    async def run():
+        session = KobraMqttSession(asyncio.get_running_loop(), '20025', 'device', 'user', 'password', client_factory=broker.client)
+        try:
+            return session, await coroutine_factory(session)
+        finally:
+            session.stop()
+    return asyncio.run(run())
+
+
+def _print_request(msgid: str):
+    return {'type': 'print', 'action': 'start', 'msgid': msgid, 'data': {'filename': f'{msgid}.gcode'}}
+
+
+def test_session_correlates_reports_with_requests():
+    broker = StubBroker(lambda request: {'msgid': request['msgid'], 'state': 'printing', 'file': request['data']['filename']})
+
+    async def print_twice(session):
+        return await asyncio.gather(
+            session.request_print(_print_request('a'), timeout=5),
+            session.request_print(_print_request('b'), timeout=5)
+        )
+
+    session, reports = _run(broker, print_twice)
+
+    assert [report['file'] for report in reports] == ['a.gcode', 'b.gcode']
+    assert broker.connections == 1
+    assert broker.subscriptions == ['anycubic/anycubicCloud/v1/printer/public/20025/device/print/report']
+    assert broker.published[0][0] == 'anycubic/anycubicCloud/v1/slicer/printer/20025/device/print'
+
+
+def test_session_matches_reports_without_msgid_in_order():
+    broker = StubBroker(lambda request: {'state': 'failed', 'code': 10107})
+
+    async def print_once(session):
+        report = await session.request_print(_print_request('a'), timeout=5)
+        return report, session.get_health()
+
+    _, (report, health) = _run(broker, print_once)
+
+    assert report == {'state': 'failed', 'code': 10107}
+    assert health['connected']
+    assert health['connect_count'] == 1
+    assert health['pending_requests'] == 0
+
+
+def test_session_times_out_without_report():
+    broker = StubBroker(lambda request: None)
+
+    async def print_once(session):
+        with pytest.raises(asyncio.TimeoutError):
+            await session.request_print(_print_request('a'), timeout=0.1)
+        return session.get_health()
+
+    _, health = _run(broker, print_once)
+
+    assert health['pending_requests'] == 0
+
+
+def test_session_matches_reports_with_their_own_msgid():
+    broker = StubBroker(lambda request: {'msgid': 'gkapi-1', 'state': 'printing'})
+
+    async def print_once(session):
+        report = await session.request_print(_print_request('a'), timeout=5)
+        return report, session.get_health()
+
+    _, (report, health) = _run(broker, print_once)
+
+    assert report == {'msgid': 'gkapi-1', 'state': 'printing'}
+    assert health['pending_requests'] == 0
+
+
+def test_session_timed_out_requests_do_not_take_later_reports():
+    broker = StubBroker(lambda request: None if request['msgid'] == 'a' else {'msgid': 'gkapi-2', 'state': 'printing'})
+
+    async def print_twice(session):
+        with pytest.raises(asyncio.TimeoutError):
+            await session.request_print(_print_request('a'), timeout=0.1)
+        return await session.request_print(_print_request('b'), timeout=5)
+
+    _, report = _run(broker, print_twice)
+
+    assert report == {'msgid': 'gkapi-2', 'state': 'printing'}
+
+
+def test_session_stays_disconnected_when_refused():
+    broker = StubBroker(lambda request: {'msgid': request['msgid'], 'state': 'printing'})
+    broker.reason_code = 5
+
+    async def print_once(session):
+        with pytest.raises(asyncio.TimeoutError):
+            await session.request_print(_print_request('a'), timeout=0.1)
+        return session.get_health()
+
+    _, health = _run(broker, print_once)
+
+    assert not health['connected']
+    assert health['connect_count'] == 0
+    assert broker.subscriptions == []
+    assert broker.published == []
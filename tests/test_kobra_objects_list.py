@@ -0,0 +1,118 @@
+import asyncio
+import sys
+import types
+
+from kobra_harness import PACKAGE, WebRequest, load_kobra
+
+
+kobra = load_kobra()
+
+CONFIG = kobra.parse_printer_config(
+    '[mcu]\n'
+    'serial: /dev/ttyS1\n'
+    '[mcu nozzle_mcu]\n'
+    '[extruder]\n'
+    '[heater_bed]\n'
+    '[fan_generic box_fan]\n'
+    '[gcode_macro CANCEL_PRINT]\n'
+    '[temperature_sensor chamber]\n'
+    '[leviQ3]\n'
+    '[stepper_x]\n'
+)
+
+
+class StubFiles:
+    def __init__(self, config):
+        self.config = config
+        self.subscribers = []
+
+    def get(self, path):
+        return self.config
+
+    def subscribe(self, path, callback):
+        self.subscribers.append(callback)
+
+
+class StubServer:
+    def __init__(self):
+        self.handlers = {}
+
+    def register_event_handler(self, event, callback):
+        self.handlers.setdefault(event, []).append(callback)
+
+
+class KlippyConnection:
+    def __init__(self):
+        self.help_requests = 0
+
+    async def request(self, web_request):
+        assert web_request.get_endpoint() == 'gcode/help'
+        self.help_requests += 1
+        await asyncio.sleep(0)
+        return { 'G28': 'Home', 'CANCEL_PRINT': 'Cancel', 'MMU_SELECT': 'Select' }
+
+
+def _build_kobra(monkeypatch, config=CONFIG):
+    monkeypatch.setitem(sys.modules, f'{PACKAGE}.components.klippy_connection', types.SimpleNamespace(KlippyConnection=KlippyConnection))
+    monkeypatch.setattr(KlippyConnection, 'request', KlippyConnection.request)
+
+    instance = object.__new__(kobra.Kobra)
+    instance.goklipper = types.SimpleNamespace(running=True)
+    instance.server = StubServer()
+    instance.files = StubFiles(config)
+    instance.interceptors = kobra.KlippyInterceptors()
+    instance.patch_objects_list()
+    return instance
+
+
+def test_objects_list_is_derived_from_printer_config(monkeypatch):
+    instance = _build_kobra(monkeypatch)
+
+    objects = instance._build_objects_list([ 'G28' ])
+
+    assert objects[:len(kobra.Kobra.OBJECTS_LIST_BASE)] == kobra.Kobra.OBJECTS_LIST_BASE
+    assert objects[len(kobra.Kobra.OBJECTS_LIST_BASE):] == [
+        'mcu', 'mcu nozzle_mcu', 'extruder', 'heater_bed', 'fan_generic box_fan', 'gcode_macro CANCEL_PRINT', 'gcode_macro G28'
+    ]
+
+
+def test_objects_list_falls_back_without_config(monkeypatch):
+    instance = _build_kobra(monkeypatch, config=None)
+
+    objects = instance._build_objects_list([])
+
+    assert objects[len(kobra.Kobra.OBJECTS_LIST_BASE):] == kobra.Kobra.OBJECTS_LIST_FALLBACK
+
+
+def test_objects_list_fallback_includes_ks1_fans(monkeypatch):
+    instance = _build_kobra(monkeypatch, config=None)
+    instance.KOBRA_MODEL_CODE = 'KS1'
+
+    objects = instance._build_objects_list([])
+
+    assert objects[len(kobra.Kobra.OBJECTS_LIST_BASE):] == kobra.Kobra.OBJECTS_LIST_FALLBACK + [ 'fan_generic air_filter_fan', 'fan_generic box_fan' ]
+
+
+def test_objects_list_is_cached_until_reconnect(monkeypatch):
+    instance = _build_kobra(monkeypatch)
+    connection = KlippyConnection()
+
+    async def list_objects(count):
+        return await asyncio.gather(*[ KlippyConnection.request(connection, WebRequest('objects/list')) for _ in range(count) ])
+
+    results = asyncio.run(list_objects(5))
+    assert connection.help_requests == 1
+    assert all(r == results[0] for r in results)
+    assert 'gcode_macro MMU_SELECT' in results[0]['objects']
+
+    asyncio.run(list_objects(1))
+    assert connection.help_requests == 1
+
+    for handler in instance.server.handlers['server:klippy_disconnect']:
+        handler()
+    asyncio.run(list_objects(1))
+    assert connection.help_requests == 2
+
+    instance.files.subscribers[0](CONFIG)
+    asyncio.run(list_objects(1))
+    assert connection.help_requests == 3
@@ -0,0 +1,157 @@
+import asyncio
+import sys
+import time
+import types
+
+import pytest
+
+from kobra_harness import PACKAGE, WebRequest, load_kobra
+
+
+kobra = load_kobra()
+SingleFlight = kobra.SingleFlight
+
+
+class KlippyConnection:
+    def __init__(self):
+        self.queries = []
+        self.fail = False
+
+    async def request(self, web_request):
+        self.queries.append(web_request.get_args())
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError('Klippy Disconnected')
+        return { 'eventtime': 1.0, 'status': { name: { 'value': len(self.queries) } for name in web_request.get_args()['objects'] } }
+
+
+def _build_kobra(monkeypatch, ttl=0.1):
+    monkeypatch.setitem(sys.modules, f'{PACKAGE}.components.klippy_connection', types.SimpleNamespace(KlippyConnection=KlippyConnection))
+    monkeypatch.setattr(KlippyConnection, 'request', KlippyConnection.request)
+
+    instance = object.__new__(kobra.Kobra)
+    instance.queries = SingleFlight(ttl=ttl)
+    instance.interceptors = kobra.KlippyInterceptors()
+    instance.patch_objects_query()
+    return instance
+
+
+def _query(connection, count, objects=None):
+    objects = objects or { 'toolhead': None, 'extruder': [ 'temperature' ] }
+    async def run():
+        return await asyncio.gather(*[ KlippyConnection.request(connection, WebRequest('objects/query', { 'objects': dict(objects) })) for _ in range(count) ])
+    return asyncio.run(run())
+
+
+def test_identical_queries_share_one_request(monkeypatch):
+    instance = _build_kobra(monkeypatch)
+    connection = KlippyConnection()
+
+    results = _query(connection, 5)
+
+    assert len(connection.queries) == 1
+    assert all(r == results[0] for r in results)
+    assert results[0]['status'] is not results[1]['status']
+    assert results[0]['status']['toolhead'] is not results[1]['status']['toolhead']
+    assert instance.queries.hits == 4
+    assert instance.queries.misses == 1
+
+
+def test_callers_changing_results_do_not_affect_each_other(monkeypatch):
+    _build_kobra(monkeypatch)
+    connection = KlippyConnection()
+
+    first, = _query(connection, 1)
+    first['status']['toolhead']['value'] = 'changed'
+    first['status']['extruder'] = None
+    second, = _query(connection, 1)
+
+    assert len(connection.queries) == 1
+    assert second['status'] == { 'toolhead': { 'value': 1 }, 'extruder': { 'value': 1 } }
+
+
+def test_different_queries_are_not_coalesced(monkeypatch):
+    _build_kobra(monkeypatch)
+    connection = KlippyConnection()
+
+    _query(connection, 2, { 'toolhead': None })
+    _query(connection, 2, { 'extruder': None })
+
+    assert len(connection.queries) == 2
+
+
+def test_results_expire_after_ttl(monkeypatch):
+    _build_kobra(monkeypatch, ttl=0.05)
+    connection = KlippyConnection()
+
+    _query(connection, 1)
+    _query(connection, 1)
+    assert len(connection.queries) == 1
+
+    time.sleep(0.06)
+    _query(connection, 1)
+    assert len(connection.queries) == 2
+
+
+def test_failures_are_not_cached(monkeypatch):
+    _build_kobra(monkeypatch)
+    connection = KlippyConnection()
+    connection.fail = True
+
+    with pytest.raises(RuntimeError):
+        _query(connection, 3)
+    assert len(connection.queries) == 1
+
+    connection.fail = False
+    results = _query(connection, 1)
+    assert len(connection.queries) == 2
+    assert results[0]['status']['toolhead'] == { 'value': 2 }
+
+
+class KlippyAPI:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def _send_klippy_request(self, method, params, default=None, transport=None):
+        return await KlippyConnection.request(self.connection, WebRequest(method, params))
+
+    def send_status(self, status, eventtime):
+        pass
+
+
+class KlippyRequest:
+    def set_result(self, result):
+        pass
+
+
+def test_objects_query_is_patched_once_through_klippy_api(monkeypatch):
+    monkeypatch.setitem(sys.modules, f'{PACKAGE}.components.klippy_apis', types.SimpleNamespace(KlippyAPI=KlippyAPI))
+    monkeypatch.setattr(KlippyAPI, '_send_klippy_request', KlippyAPI._send_klippy_request)
+    monkeypatch.setattr(KlippyAPI, 'send_status', KlippyAPI.send_status)
+    monkeypatch.setattr(KlippyRequest, 'set_result', KlippyRequest.set_result)
+    monkeypatch.setattr(KlippyConnection, '_process_status_update', lambda me, eventtime, status: None, raising=False)
+
+    instance = _build_kobra(monkeypatch)
+    sys.modules[f'{PACKAGE}.components.klippy_connection'].KlippyRequest = KlippyRequest
+    klippy_connection = types.SimpleNamespace(_process_status_update=None, unregister_method=lambda name: None, register_remote_method=lambda *args, **kwargs: None)
+    instance.server = types.SimpleNamespace(lookup_component=lambda name: klippy_connection)
+    instance.goklipper = types.SimpleNamespace(running=True)
+    instance.metrics = kobra.KobraMetrics()
+    instance.tracer = kobra.KobraTracer(sample_rate=0.0, buffer_size=1)
+    instance._states_cache = {}
+
+    calls = []
+    instance.status_patchers = [ lambda status: calls.append('status') or status ]
+    instance.patch_status_updates()
+    instance.object_patchers['toolhead'] = [ lambda status, toolhead: calls.append('toolhead') ]
+
+    connection = KlippyConnection()
+    api = KlippyAPI(connection)
+
+    async def run():
+        return await asyncio.gather(*[ api._send_klippy_request('objects/query', { 'objects': { 'toolhead': None } }) for _ in range(3) ])
+    results = asyncio.run(run())
+
+    assert len(connection.queries) == 1
+    assert calls == [ 'toolhead', 'status' ]
+    assert all(type(result['status']) is kobra.PatchedStatus for result in results)
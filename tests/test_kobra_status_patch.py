@@ -0,0 +1,71 @@
+import types
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+
+
+def _build_kobra():
+    instance = object.__new__(kobra.Kobra)
+    instance.goklipper = types.SimpleNamespace(running=True)
+    instance.metrics = kobra.KobraMetrics()
+    instance._states_cache = {}
+    instance.status_patchers = []
+    instance.object_patchers = {
+        'print_stats': [ instance._patch_print_stats ],
+        'virtual_sdcard': [ instance._patch_virtual_sdcard ]
+    }
+    return instance
+
+
+def test_patch_status_converts_states_and_strips_paths():
+    instance = _build_kobra()
+
+    status = instance.patch_status({
+        'print_stats': { 'state': 'Heating', 'filename': '/useremain/app/gk/gcodes/cube.gcode' },
+        'virtual_sdcard': { 'total_layer': 42, 'current_layer': 3, 'file_path': '/useremain/app/gk/gcodes/cube.gcode' }
+    })
+
+    assert status['print_stats']['state'] == 'printing'
+    assert status['print_stats']['filename'] == 'cube.gcode'
+    assert status['print_stats']['info'] == { 'current_layer': 3, 'total_layer': 42 }
+    assert status['idle_timeout'] == { 'state': 'printing' }
+    assert status['virtual_sdcard']['file_path'] == 'cube.gcode'
+
+
+def test_patch_status_reuses_state_strings():
+    instance = _build_kobra()
+
+    first = instance.patch_status({ 'print_stats': { 'state': ''.join(['onp', 'ause']) } })
+    second = instance.patch_status({ 'print_stats': { 'state': ''.join(['on', 'pause']) } })
+
+    assert first['print_stats']['state'] == 'paused'
+    assert first['print_stats']['state'] is second['print_stats']['state']
+
+
+def test_patch_status_skips_already_patched_payloads():
+    instance = _build_kobra()
+    calls = []
+
+    def patcher(status):
+        calls.append(status)
+        return status
+
+    instance.register_status_patcher(patcher)
+
+    status = instance.patch_status({ 'print_stats': { 'state': 'printing' } })
+    assert instance.patch_status(status) is status
+    assert len(calls) == 1
+
+
+def test_patch_status_only_dispatches_present_objects():
+    instance = _build_kobra()
+    seen = []
+
+    instance.register_object_patcher('extruder', lambda status, extruder: seen.append(extruder['temperature']))
+
+    instance.patch_status({ 'heater_bed': { 'temperature': 60 } })
+    instance.patch_status({ 'extruder': { 'temperature': 210 } })
+
+    assert seen == [ 210 ]
@@ -0,0 +1,88 @@
+import asyncio
+import sys
+import types
+
+from kobra_harness import PACKAGE, WebRequest, load_kobra
+
+
+kobra = load_kobra()
+KobraTracer = kobra.KobraTracer
+
+
+def test_tracer_keeps_only_recent_entries():
+    tracer = KobraTracer(buffer_size=2)
+
+    for index in range(3):
+        tracer.record(f'endpoint/{index}', index, 0.001)
+
+    entries = tracer.get_entries()
+    assert [entry['endpoint'] for entry in entries] == ['endpoint/1', 'endpoint/2']
+    assert entries[-1]['duration'] == 1.0
+
+
+def test_tracer_sampling_bounds():
+    assert not KobraTracer(sample_rate=0.0).is_sampled()
+    assert KobraTracer(sample_rate=1.0).is_sampled()
+
+
+def test_tracer_formats_payloads_lazily():
+    tracer = KobraTracer()
+    result = {'status': {}}
+
+    tracer.record('objects/query', 0, 0.002, {'objects': {}}, result, ValueError('boom'))
+    result['status']['print_stats'] = {'state': 'printing'}
+
+    entry = tracer.get_entries()[0]
+    assert entry['result'] == {'status': {'print_stats': {'state': 'printing'}}}
+    assert entry['error'] == 'boom'
+
+    tracer.clear()
+    assert tracer.get_entries() == []
+
+
+def _trace(instance, action, args):
+    return asyncio.run(instance._handle_trace_request(WebRequest('server/kobra/trace', args, action)))
+
+
+def test_trace_settings_only_change_with_post():
+    instance = object.__new__(kobra.Kobra)
+    instance.tracer = KobraTracer(sample_rate=0.0)
+    instance.tracer.record('objects/query', 0, 0.001)
+
+    result = _trace(instance, 'GET', { 'sample_rate': 1.0, 'clear': True })
+    assert result['sample_rate'] == 0.0
+    assert len(instance.tracer.entries) == 1
+
+    result = _trace(instance, 'POST', { 'sample_rate': 1.0, 'clear': True })
+    assert result['sample_rate'] == 1.0
+    assert len(result['entries']) == 1
+    assert len(instance.tracer.entries) == 0
+
+
+def test_sampled_requests_keep_their_arguments(monkeypatch):
+    KlippyAPI = type('KlippyAPI', (), { '_send_klippy_request': None, 'send_status': None })
+    KlippyConnection = type('KlippyConnection', (), { '_process_status_update': None })
+    KlippyRequest = type('KlippyRequest', (), { 'set_result': None })
+    monkeypatch.setitem(sys.modules, f'{PACKAGE}.components.klippy_apis', types.SimpleNamespace(KlippyAPI=KlippyAPI))
+    monkeypatch.setitem(sys.modules, f'{PACKAGE}.components.klippy_connection', types.SimpleNamespace(KlippyConnection=KlippyConnection, KlippyRequest=KlippyRequest))
+
+    instance = object.__new__(kobra.Kobra)
+    klippy_connection = types.SimpleNamespace(_process_status_update=None, unregister_method=lambda name: None, register_remote_method=lambda *args, **kwargs: None)
+    instance.server = types.SimpleNamespace(lookup_component=lambda name: klippy_connection)
+    instance.metrics = kobra.KobraMetrics()
+    instance.tracer = KobraTracer(sample_rate=1.0)
+
+    interceptors = []
+    instance.register_request_interceptor = lambda endpoint, callback, **kwargs: interceptors.append(callback)
+    instance.patch_status_updates()
+
+    async def call_next(web_request):
+        # Like the bed mesh interceptor, drop objects GoKlipper does not know about
+        del web_request.get_args()['objects']['bed_mesh']
+        return { 'eventtime': 1.0 }
+
+    web_request = WebRequest('objects/query', { 'objects': { 'bed_mesh': None, 'toolhead': None } })
+    asyncio.run(interceptors[0](web_request, call_next))
+
+    assert web_request.get_args() == { 'objects': { 'toolhead': None } }
+    assert instance.tracer.get_entries()[0]['args'] == { 'objects': { 'bed_mesh': None, 'toolhead': None } }
@@ -0,0 +1,201 @@
+import asyncio
+import json
+
+import pytest
+
+from kobra_harness import load_kobra
+
+
+kobra = load_kobra()
+GoKlipperClient = kobra.GoKlipperClient
+
+
+async def _serve(path, handler):
+    """Minimal GoKlipper stand-in, handler(message) returns the response or None to stay silent"""
+    received = []
+
+    async def on_connection(reader, writer):
+        async def respond(message):
+            response = await handler(message)
+            if response is not None:
+                writer.write(json.dumps(response).encode() + b'\x03')
+                await writer.drain()
+
+        tasks = []
+        try:
+            while True:
+                data = await reader.readuntil(b'\x03')
+                message = json.loads(data[:-1])
+                received.append(message)
+                tasks.append(asyncio.ensure_future(respond(message)))
+        except asyncio.IncompleteReadError:
+            pass
+        for task in tasks:
+            task.cancel()
+
+    server = await asyncio.start_unix_server(on_connection, path=path)
+    return server, received
+
+
+def test_client_multiplexes_concurrent_calls(tmp_path):
+    path = str(tmp_path / 'uds')
+
+    async def handler(message):
+        # Answer the first request last
+        await asyncio.sleep(0.05 if message['params']['S'] == 0 else 0)
+        return { 'id': message['id'], 'result': { 'S': message['params']['S'] } }
+
+    async def run():
+        server, received = await _serve(path, handler)
+        client = GoKlipperClient(path)
+        try:
+            results = await asyncio.gather(*[ client.call('led/set_led', { 'S': i }) for i in range(3) ])
+            return results, received
+        finally:
+            await client.close()
+            server.close()
+
+    results, received = asyncio.run(run())
+
+    assert results == [ { 'S': 0 }, { 'S': 1 }, { 'S': 2 } ]
+    assert [ m['method'] for m in received ] == [ 'led/set_led' ] * 3
+    assert len({ m['id'] for m in received }) == 3
+
+
+def test_client_reports_errors_and_timeouts(tmp_path):
+    path = str(tmp_path / 'uds')
+
+    async def handler(message):
+        if message['method'] == 'fail':
+            return { 'id': message['id'], 'error': { 'message': 'Unknown method' } }
+        return None
+
+    async def run():
+        server, _ = await _serve(path, handler)
+        client = GoKlipperClient(path, timeout=0.05)
+        try:
+            with pytest.raises(kobra.GoKlipperError):
+                await client.call('fail')
+            with pytest.raises(asyncio.TimeoutError):
+                await client.call('silent')
+            return client._pending
+        finally:
+            await client.close()
+            server.close()
+
+    assert asyncio.run(run()) == {}
+
+
+def test_client_reconnects_after_connection_loss(tmp_path):
+    path = str(tmp_path / 'uds')
+
+    async def handler(message):
+        return { 'id': message['id'], 'result': 'ok' }
+
+    async def run():
+        server, _ = await _serve(path, handler)
+        client = GoKlipperClient(path)
+        try:
+            assert await client.call('ping') == 'ok'
+
+            # Simulate a GoKlipper restart
+            client._writer.transport.abort()
+            await asyncio.sleep(0.01)
+            assert not client.connected
+
+            assert await client.call('ping') == 'ok'
+        finally:
+            await client.close()
+            server.close()
+
+    asyncio.run(run())
+
+
+def test_client_notifies_without_waiting_for_a_response(tmp_path):
+    path = str(tmp_path / 'uds')
+
+    async def handler(message):
+        return None
+
+    async def run():
+        server, received = await _serve(path, handler)
+        client = GoKlipperClient(path, timeout=5)
+        try:
+            await asyncio.wait_for(client.notify('led/set_led', { 'S': 1 }), 0.5)
+            await asyncio.sleep(0.01)
+            return received, client._pending
+        finally:
+            await client.close()
+            server.close()
+
+    received, pending = asyncio.run(run())
+
+    assert [ (m['method'], m['params']) for m in received ] == [ ('led/set_led', { 'S': 1 }) ]
+    assert pending == {}
+
+
+class StubConfig:
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+
+    def get_name(self):
+        return self.name
+
+    def get(self, key, default=None):
+        return self.options.get(key, default)
+
+
+class StubClient:
+    def __init__(self):
+        self.calls = []
+
+    async def notify(self, method, params=None):
+        self.calls.append((method, params))
+
+
+def test_power_device_toggles_lights_through_client():
+    client = StubClient()
+    device = kobra.GoKlipperPowerDevice(StubConfig('power head_light', { 'method': 'led/set_led', 'param': 'S', 'default_state': 'on' }), client)
+
+    asyncio.run(device.set_power('off'))
+    assert device.state == 'off'
+    asyncio.run(device.set_power('on'))
+    assert device.state == 'on'
+
+    assert client.calls == [ ('led/set_led', { 'S': 0 }), ('led/set_led', { 'S': 1 }) ]
+
+
+def test_power_device_does_not_wait_for_silent_goklipper(tmp_path):
+    path = str(tmp_path / 'uds')
+
+    async def handler(message):
+        return None
+
+    async def run():
+        server, received = await _serve(path, handler)
+        client = GoKlipperClient(path, timeout=5)
+        device = kobra.GoKlipperPowerDevice(StubConfig('power chamber_light', { 'method': 'led/set_led', 'default_state': 'on' }), client)
+        try:
+            await asyncio.wait_for(device.set_power('off'), 0.5)
+            await asyncio.sleep(0.01)
+            return device.state, received
+        finally:
+            await client.close()
+            server.close()
+
+    state, received = asyncio.run(run())
+
+    assert state == 'off'
+    assert [ m['params'] for m in received ] == [ { 'S': 0 } ]
+
+
+def test_power_device_falls_back_to_uds_without_v4l2(tmp_path):
+    client = StubClient()
+    options = { 'method': 'Led/SetCameraLed', 'param': 'enable', 'v4l2_device': str(tmp_path / 'video10'), 'default_state': 'on' }
+    device = kobra.GoKlipperPowerDevice(StubConfig('power camera_light', options), client)
+
+    asyncio.run(device.set_power('off'))
+
+    assert device.state == 'off'
+    assert client.calls == [ ('Led/SetCameraLed', { 'enable': 0 }) ]
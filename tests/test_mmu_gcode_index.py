@@ -0,0 +1,128 @@
+import importlib.util
+import os
+import sys
+import types
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+RELATIVE_GCODE = """; generated by OrcaSlicer 2.1.1 on 2024-05-01 at 10:00:00
+M83
+T0
+G1 X0 E5
+;LAYER_CHANGE
+G1 X10 E2.5
+G1 X20 E-1
+G1 X20 E1
+T1
+G1 X30 E4
+;LAYER_CHANGE
+G1 X40 E3
+T0
+G1 X50 E2
+"""
+
+ABSOLUTE_GCODE = """; generated by PrusaSlicer 2.7.0 on 2024-05-01 at 10:00:00
+M82
+T0
+G92 E0
+G1 X0 E5
+; CHANGE_LAYER
+G1 X10 E7
+G92 E0
+T2
+G1 X10 E3
+"""
+
+
+def _write(tmp_path, content: str) -> str:
+    path = tmp_path / "print.gcode"
+    path.write_bytes(content.encode())
+    return str(path)
+
+
+def test_relative_extrusion_is_indexed(tmp_path):
+    path = _write(tmp_path, RELATIVE_GCODE)
+    mmu_ace.write_gcode_index(path)
+
+    index = mmu_ace.load_gcode_index(path)
+
+    assert [ layer[1] for layer in index.layers ] == [5, 11.5]
+    assert [ toolchange[1:] for toolchange in index.toolchanges ] == [[0, 0], [1, 7.5], [0, 14.5]]
+    assert index.extruded == 16.5
+    assert index.tools == { 0: 9.5, 1: 7 }
+
+    layer_offset = index.get_layer_offset(2)
+    assert RELATIVE_GCODE.encode()[layer_offset:].startswith(b";LAYER_CHANGE")
+    assert index.get_layer(0) == 0
+    assert index.get_layer(layer_offset) == 2
+
+
+def test_progress_at_a_position(tmp_path):
+    path = _write(tmp_path, RELATIVE_GCODE)
+    mmu_ace.write_gcode_index(path)
+    index = mmu_ace.load_gcode_index(path)
+
+    progress = index.get_progress(index.get_layer_offset(2))
+
+    assert progress == {
+        "layer": 2,
+        "layer_count": 2,
+        "tool": 1,
+        "next_toolchange": { "position": index.toolchanges[2][0], "tool": 0, "extrusion": 3 },
+        "tools_remaining": { 0: 2, 1: 3 }
+    }
+
+
+def test_absolute_extrusion_follows_resets(tmp_path):
+    path = _write(tmp_path, ABSOLUTE_GCODE)
+    mmu_ace.write_gcode_index(path)
+
+    index = mmu_ace.load_gcode_index(path)
+
+    assert index.extruded == 10
+    assert index.tools == { 0: 7, 2: 3 }
+    assert len(index.layers) == 1
+
+
+def test_index_is_hidden_and_invalidated_by_changes(tmp_path):
+    path = _write(tmp_path, RELATIVE_GCODE)
+    mmu_ace.write_gcode_index(path)
+
+    assert os.path.basename(mmu_ace.get_gcode_index_path(path)).startswith(".")
+    assert mmu_ace.load_gcode_index(path) is not None
+
+    with open(path, 'a') as file:
+        file.write("G1 X0 E1\n")
+
+    assert mmu_ace.load_gcode_index(path) is None
+
+
+def test_index_follows_file_moves_and_deletes(tmp_path):
+    path = _write(tmp_path, RELATIVE_GCODE)
+    mmu_ace.write_gcode_index(path)
+
+    patcher = object.__new__(mmu_ace.MmuAcePatcher)
+    file_manager = types.SimpleNamespace(get_directory=lambda root: str(tmp_path))
+    patcher.server = types.SimpleNamespace(lookup_component=lambda name: file_manager)
+
+    os.replace(path, tmp_path / "moved.gcode")
+    patcher._on_filelist_changed({
+        "action": "move_file",
+        "item": { "root": "gcodes", "path": "moved.gcode" },
+        "source_item": { "root": "gcodes", "path": "print.gcode" }
+    })
+    assert mmu_ace.load_gcode_index(str(tmp_path / "moved.gcode")) is not None
+
+    os.remove(tmp_path / "moved.gcode")
+    patcher._on_filelist_changed({ "action": "delete_file", "item": { "root": "gcodes", "path": "moved.gcode" } })
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,92 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+ORCA_GCODE = """; HEADER_BLOCK_START
+; generated by OrcaSlicer 2.1.1 on 2024-05-01 at 10:00:00
+; total layer number: 2
+; HEADER_BLOCK_END
+
+; thumbnail begin 32x32 1234
+; iVBORw0KGgo
+; thumbnail end
+G28
+T0
+G1 X10 Y10 E1
+; T3 in a comment is not a tool change
+MMU_CHANGE_TOOL TOOL=2 STANDALONE=1
+T1\r
+G1 X20 Y20 E1
+T0
+"""
+
+
+def _write(tmp_path, content: str) -> str:
+    path = tmp_path / "print.gcode"
+    path.write_bytes(content.encode())
+    return str(path)
+
+
+def test_tools_are_found_after_the_header(tmp_path):
+    result = mmu_ace.parse_gcode_file(_write(tmp_path, ORCA_GCODE))
+
+    assert result == { "slicer": "OrcaSlicer", "tools_used": [0, 1, 2], "total_toolchanges": 4 }
+
+
+def test_bambu_header_is_recognized(tmp_path):
+    gcode = "; HEADER_BLOCK_START\n; BambuStudio 01.09.00.70\n; HEADER_BLOCK_END\nT2\nT5\n"
+
+    result = mmu_ace.parse_gcode_file(_write(tmp_path, gcode))
+
+    assert result == { "slicer": "BambuStudio", "tools_used": [2, 5], "total_toolchanges": 2 }
+
+
+def test_unknown_slicer_reports_no_tools(tmp_path):
+    gcode = ";FLAVOR:Marlin\n;Generated with Cura_SteamEngine 5.4.0\nG28\nT0\nT1\n"
+
+    result = mmu_ace.parse_gcode_file(_write(tmp_path, gcode))
+
+    assert result == { "slicer": None, "tools_used": [], "total_toolchanges": 0 }
+
+
+def test_empty_file(tmp_path):
+    result = mmu_ace.parse_gcode_file(_write(tmp_path, ""))
+
+    assert result == { "slicer": None, "tools_used": [], "total_toolchanges": 0 }
+
+
+def test_stamp_is_appended_and_detected(tmp_path):
+    path = _write(tmp_path, ORCA_GCODE.rstrip("\n"))
+    assert not mmu_ace.gcode_processed_already(path)
+
+    mmu_ace.process_file(path, [0, 1, 2], 4)
+
+    content = Path(path).read_bytes().decode()
+    assert content.startswith(ORCA_GCODE.rstrip("\n") + "\n")
+    assert content.endswith("; referenced_tools = 0,1,2\n; processed by MmuAcePatcher\n")
+    assert mmu_ace.gcode_processed_already(path)
+
+
+def test_previously_stamped_header_is_detected(tmp_path):
+    path = _write(tmp_path, "; processed by MmuAcePatcher\n" + ORCA_GCODE + "G1 X0\n" * 1000)
+
+    assert mmu_ace.gcode_processed_already(path)
+
+
+def test_slicer_is_found_after_a_command_prologue(tmp_path):
+    gcode = "M73 P0 R42\nT1\n; HEADER_BLOCK_START\n; BambuStudio 01.09.00.70\n; HEADER_BLOCK_END\nT2\n; T3 in a comment\nT1\n"
+
+    result = mmu_ace.parse_gcode_file(_write(tmp_path, gcode))
+
+    assert result == { "slicer": "BambuStudio", "tools_used": [1, 2], "total_toolchanges": 3 }
@@ -0,0 +1,123 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+MmuAceController = mmu_ace.MmuAceController
+MmuAce = mmu_ace.MmuAce
+MmuAcePatcher = mmu_ace.MmuAcePatcher
+
+
+class StubServer:
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+
+    def send_event(self, name: str, payload: dict):
+        self.events.append((name, payload))
+
+
+def _build_controller(num_units: int = 3) -> MmuAceController:
+    controller = object.__new__(MmuAceController)
+    controller.server = StubServer()
+    controller.ace = MmuAce()
+    controller._set_ace_status({
+        "filament_hubs": [
+            {
+                "id": unit,
+                "slots": [ { "index": unit * 4 + slot, "status": "ready", "type": "PLA", "color": [unit, slot, 0] } for slot in range(4) ]
+            }
+            for unit in range(num_units)
+        ]
+    })
+    return controller
+
+
+def test_gates_resolve_by_index_and_position_across_units():
+    controller = _build_controller()
+
+    unit, gate = controller._resolve_gate(9)
+    assert (unit.id, gate.index) == (2, 9)
+
+    unit, gate = controller._find_gate_by_position(5)
+    assert (unit.id, gate.index) == (1, 5)
+
+    assert controller._resolve_gate(12) == (None, None)
+    assert controller._find_unit(1) is controller.ace.units[1]
+
+
+def test_tool_lookups_follow_ttg_map_updates():
+    controller = _build_controller()
+    assert controller._find_tool_by_gate(7) == 7
+
+    controller.update_ttg_map([7, 1, 2, 3, 4, 5, 6, 0, 8, 9, 10, 11])
+
+    assert controller._find_tool_by_gate(7) == 0
+    assert controller._find_tool_by_gate(0) == 7
+
+
+def test_endless_spool_groups_list_gates():
+    controller = _build_controller(num_units=1)
+    controller._set_ace_status({ "endless_spool_groups": [0, 1, 0, 1] })
+
+    assert controller._find_endless_spool_gates(0) == [0, 2]
+    assert controller._find_endless_spool_gates(3) == [1, 3]
+    assert controller._find_endless_spool_gates(6) == [6]
+
+
+def test_machine_status_lists_every_unit():
+    controller = _build_controller()
+
+    machine = controller.get_status_snapshot()["mmu_machine"]
+
+    assert machine["num_units"] == 3
+    assert [machine[f"unit_{i}"]["first_gate"] for i in range(3)] == [0, 4, 8]
+    assert [machine[f"unit_{i}"]["name"] for i in range(3)] == ["ACE 1", "ACE 2", "ACE 3"]
+    assert controller.get_status_snapshot()["mmu"]["num_gates"] == 12
+
+
+def test_print_data_maps_tools_to_gates():
+    controller = _build_controller(num_units=2)
+    patcher = object.__new__(MmuAcePatcher)
+    patcher.ace_controller = controller
+    patcher.ace = controller.ace
+
+    print_data = patcher.patch_print_data({})
+
+    mapping = print_data["ams_settings"]["ams_box_mapping"]
+    assert [entry["ams_index"] for entry in mapping] == list(range(8))
+    assert mapping[5]["ams_color"] == [1, 1, 0, 255]
+
+
+def test_lookups_follow_hub_changes_before_the_status_update():
+    controller = _build_controller(num_units=1)
+    hubs = [ { "id": 0, "slots": [ { "index": slot, "status": "ready", "type": "PLA" } for slot in range(4) ] } ]
+    controller._filament_hubs = hubs
+    assert controller._resolve_gate(2)[1].index == 2
+
+    changed = [ { "id": 0, "slots": [ { "index": 7 if slot == 2 else slot, "status": "ready", "type": "PLA" } for slot in range(4) ] } ]
+    assert controller._update_ace_hubs(changed)
+
+    assert controller._find_gate_by_index(7)[1] is controller.ace.units[0].gates[2]
+    assert controller._find_tool_by_gate(7) == 2
+
+
+def test_machine_status_keeps_unit_fields():
+    controller = _build_controller(num_units=1)
+
+    machine = controller.get_machine_status()
+
+    assert machine.unit_0.name == "ACE 1"
+    assert machine.unit_1 is None
+    assert machine.extra_units == []
+    assert controller.get_status().to_dict()["mmu_machine"] == controller.get_status_snapshot()["mmu_machine"]
+    assert controller.get_status_snapshot()["mmu_machine"]["unit_1"] is None
@@ -0,0 +1,337 @@
+import asyncio
+import importlib.util
+import json
+import shutil
+import sys
+import time
+import types
+from pathlib import Path
+
+import pytest
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+# Stands in for Moonraker's file_manager/metadata.py
+METADATA_MODULE = """
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger("metadata")
+
+class BaseSlicer:
+    pass
+
+class PrusaSlicer(BaseSlicer):
+    pass
+
+SUPPORTED_SLICERS = [PrusaSlicer]
+calls = 0
+
+def main(config):
+    global calls
+    calls += 1
+
+    path = os.path.join(config["gcode_dir"], config["filename"])
+    if config.get("check_objects"):
+        # Exclude object processing rewrites the file in place
+        with open(path) as file:
+            content = file.read()
+        with open(path, "w") as file:
+            file.write("EXCLUDE_OBJECT_DEFINE NAME=part\\n" + content)
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(os.path.join(os.path.dirname(path), ".thumbs"), exist_ok=True)
+    with open(os.path.join(os.path.dirname(path), ".thumbs", f"{base}-32x32.png"), "wb") as thumbnail:
+        thumbnail.write(b"png")
+
+    metadata = {
+        "pid": os.getpid(),
+        "calls": calls,
+        "slicers": len(SUPPORTED_SLICERS),
+        "size": os.path.getsize(path),
+        "thumbnails": [ { "width": 32, "height": 32, "relative_path": f".thumbs/{base}-32x32.png" } ]
+    }
+    os.write(sys.stdout.fileno(), json.dumps({ "file": config["filename"], "metadata": metadata }).encode())
+"""
+
+
+GCODE = "; generated by OrcaSlicer 2.1.1 on 2024-05-01\nT0\nG1 X1 E1\nT{tool}\n"
+
+
+@pytest.fixture
+def components(tmp_path, monkeypatch):
+    monkeypatch.setenv(mmu_ace.MMU_ACE_CACHE_ENV, str(tmp_path / "cache"))
+    components = tmp_path / "components"
+    (components / "file_manager").mkdir(parents=True)
+    shutil.copy(MODULE_PATH, components / "mmu_ace.py")
+    (components / "file_manager" / "metadata.py").write_text(METADATA_MODULE)
+
+    gcodes = tmp_path / "gcodes"
+    gcodes.mkdir()
+    for name, tool in (("a.gcode", 1), ("b.gcode", 2)):
+        (gcodes / name).write_text(GCODE.format(tool=tool))
+
+    return components, gcodes
+
+
+def _build_pool(components, size=1, print_delay=0.0):
+    command = [ sys.executable, str(components / "mmu_ace.py"), mmu_ace.METADATA_WORKER_ARG ]
+    return mmu_ace.MetadataWorkerPool(command, size, print_delay)
+
+
+class MetadataError(Exception):
+    pass
+
+
+class StubStorage:
+    """Stands in for Moonraker's MetadataStorage"""
+
+    def __init__(self, gcodes, check_objects=False, timeout=10.):
+        self.gc_path = str(gcodes)
+        self.enable_object_proc = check_objects
+        self.processors = {}
+        self.default_metadata_parser_timeout = timeout
+        self.metadata = {}
+        self.mddb = {}
+        self.server = types.SimpleNamespace(error=MetadataError)
+        self.fallbacks = []
+
+    async def _run_extract_metadata(self, filename, ufp_path):
+        self.fallbacks.append(filename)
+
+
+async def _extract(pool, gcodes, filename, check_objects=False):
+    storage = StubStorage(gcodes, check_objects)
+    fallback = lambda: storage._run_extract_metadata(filename, None)
+    try:
+        await mmu_ace.extract_metadata(pool, storage, filename, None, fallback)
+    except MetadataError:
+        return False, None
+    assert storage.fallbacks == []
+    return True, { "file": filename, "metadata": storage.metadata[filename] }
+
+
+def test_worker_is_reused_across_files(components):
+    components, gcodes = components
+
+    async def extract():
+        pool = _build_pool(components)
+        try:
+            first = await _extract(pool, gcodes, "a.gcode")
+            missing = await _extract(pool, gcodes, "missing.gcode")
+            second = await _extract(pool, gcodes, "b.gcode")
+        finally:
+            await pool.close()
+        return first, missing, second
+
+    (success, first), (missing, _), (_, second) = asyncio.run(extract())
+
+    assert success and not missing
+    assert first["file"] == "a.gcode"
+    assert second["metadata"]["pid"] == first["metadata"]["pid"]
+    assert second["metadata"]["calls"] == 2
+    assert second["metadata"]["slicers"] == 2
+    assert (gcodes / "b.gcode").read_text().endswith(mmu_ace.MMU_ACE_FINGERPRINT + "\n")
+
+
+def test_files_are_serialized_while_printing(components):
+    components, gcodes = components
+
+    async def extract():
+        pool = _build_pool(components, size=2, print_delay=0.2)
+        try:
+            await _extract(pool, gcodes, "a.gcode")
+            pool.printing = True
+            start = time.monotonic()
+            await asyncio.gather(_extract(pool, gcodes, "a.gcode"), _extract(pool, gcodes, "b.gcode"))
+            return time.monotonic() - start
+        finally:
+            await pool.close()
+
+    assert asyncio.run(extract()) >= 0.4
+
+
+def _fall_back(pool):
+    storage = StubStorage("/gcodes")
+
+    async def extract():
+        try:
+            await mmu_ace.extract_metadata(pool, storage, "a.gcode", None, lambda: storage._run_extract_metadata("a.gcode", None))
+            return pool.workers[0].process
+        finally:
+            await pool.close()
+
+    return storage, asyncio.run(extract())
+
+
+def test_failed_worker_falls_back_to_the_script():
+    storage, _ = _fall_back(mmu_ace.MetadataWorkerPool([ sys.executable, "-c", "pass" ], 1, 0.0))
+
+    assert storage.fallbacks == [ "a.gcode" ]
+
+
+def test_oversized_response_falls_back_to_the_script(monkeypatch):
+    monkeypatch.setattr(mmu_ace, "METADATA_WORKER_LIMIT", 1024)
+    worker = "import sys; sys.stdin.readline(); print('x' * 4096, flush=True); sys.stdin.readline()"
+
+    storage, process = _fall_back(mmu_ace.MetadataWorkerPool([ sys.executable, "-c", worker ], 1, 0.0))
+
+    assert storage.fallbacks == [ "a.gcode" ]
+    assert process is None
+
+
+def test_ufp_files_and_processors_are_left_to_moonraker():
+    storage = StubStorage("/gcodes")
+    pool = mmu_ace.MetadataWorkerPool([], 0, 0.0)
+    fallback = lambda: storage._run_extract_metadata("a.gcode", None)
+
+    asyncio.run(mmu_ace.extract_metadata(pool, storage, "a.gcode", "/tmp/a.ufp", fallback))
+    storage.processors = { "preprocessor": { "name": "preprocessor", "command": "true", "timeout": 5 } }
+    asyncio.run(mmu_ace.extract_metadata(pool, storage, "a.gcode", None, fallback))
+
+    assert storage.fallbacks == [ "a.gcode", "a.gcode" ]
+
+
+def test_timeout_includes_the_wait_for_a_worker():
+    worker = "import sys, time\nfor line in sys.stdin:\n    time.sleep(0.5)\n    print('{\"code\": 0, \"output\": \"\"}', flush=True)"
+
+    async def run():
+        pool = mmu_ace.MetadataWorkerPool([ sys.executable, "-c", worker ], 1, 0.0)
+        try:
+            busy = asyncio.ensure_future(pool.run([], 10.))
+            await asyncio.sleep(0.05)
+            start = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run([], 0.2)
+            elapsed = time.monotonic() - start
+            return await busy, elapsed
+        finally:
+            await pool.close()
+
+    result, elapsed = asyncio.run(run())
+
+    assert result == (0, b"")
+    assert elapsed < 0.4
+
+
+def test_only_the_metadata_storage_is_patched(components):
+    components, gcodes = components
+    storage = StubStorage(gcodes)
+    file_manager = types.SimpleNamespace(get_metadata_storage=lambda: storage)
+    server = types.SimpleNamespace(lookup_component=lambda name: { "file_manager": file_manager }[name], register_event_handler=lambda event, callback: None)
+
+    patcher = object.__new__(mmu_ace.MmuAcePatcher)
+    patcher.server = server
+    patcher.metadata_pool = _build_pool(components)
+    patcher.setup_metadata_worker()
+
+    async def extract():
+        try:
+            await storage._run_extract_metadata("a.gcode", None)
+            await storage._run_extract_metadata("b.gcode", "/tmp/b.ufp")
+        finally:
+            await patcher.metadata_pool.close()
+
+    asyncio.run(extract())
+
+    assert storage.metadata["a.gcode"]["calls"] == 1
+    assert storage.mddb["a.gcode"] is storage.metadata["a.gcode"]
+    assert storage.fallbacks == [ "b.gcode" ]
+
+
+def test_duplicate_uploads_and_rescans_use_the_cache(components):
+    components, gcodes = components
+    (gcodes / "copy.gcode").write_text(GCODE.format(tool=1))
+
+    async def extract():
+        pool = _build_pool(components)
+        try:
+            _, first = await _extract(pool, gcodes, "a.gcode")
+            _, rescan = await _extract(pool, gcodes, "a.gcode")
+            _, copy = await _extract(pool, gcodes, "copy.gcode")
+        finally:
+            await pool.close()
+        return first, rescan, copy
+
+    first, rescan, copy = asyncio.run(extract())
+
+    assert rescan["metadata"]["calls"] == 1
+    assert copy["metadata"]["calls"] == 1
+    assert copy["file"] == "copy.gcode"
+
+    # The copy gets the same MMU processing and its own thumbnails
+    assert (gcodes / "copy.gcode").read_text() == (gcodes / "a.gcode").read_text()
+    assert copy["metadata"]["size"] == (gcodes / "copy.gcode").stat().st_size
+    assert copy["metadata"]["thumbnails"][0]["relative_path"] == ".thumbs/copy-32x32.png"
+    assert (gcodes / ".thumbs" / "copy-32x32.png").read_bytes() == b"png"
+    assert mmu_ace.load_gcode_index(str(gcodes / "copy.gcode")) is not None
+
+
+def test_index_is_built_from_the_processed_file(components):
+    components, gcodes = components
+
+    async def extract():
+        pool = _build_pool(components)
+        try:
+            await _extract(pool, gcodes, "a.gcode", check_objects=True)
+        finally:
+            await pool.close()
+
+    asyncio.run(extract())
+
+    path = gcodes / "a.gcode"
+    index = mmu_ace.load_gcode_index(str(path))
+    data = path.read_bytes()
+    assert data.startswith(b"EXCLUDE_OBJECT_DEFINE")
+    assert [ data[offset:offset + 2] for offset, _, _ in index.toolchanges ] == [ b"T0", b"T1" ]
+
+    entries = list((gcodes.parent / "cache").glob("*/entry.json"))
+    assert len(entries) == 1
+    assert json.loads(entries[0].read_text())["index"]["toolchanges"] == [ list(toolchange) for toolchange in index.toolchanges ]
+
+
+def test_cache_can_be_disabled(components, monkeypatch):
+    components, gcodes = components
+    monkeypatch.setenv(mmu_ace.MMU_ACE_CACHE_ENV, "")
+
+    async def extract():
+        pool = _build_pool(components)
+        try:
+            await _extract(pool, gcodes, "a.gcode")
+            return await _extract(pool, gcodes, "a.gcode")
+        finally:
+            await pool.close()
+
+    _, rescan = asyncio.run(extract())
+
+    assert rescan["metadata"]["calls"] == 2
+    assert not (gcodes.parent / "cache").exists()
+
+
+def test_fast_key_samples_head_and_tail(tmp_path):
+    path = tmp_path / "large.gcode"
+    sample_size = mmu_ace.MMU_ACE_CACHE_SAMPLE_SIZE
+    path.write_bytes(b"a" * sample_size + b"b" * sample_size + b"c" * sample_size)
+
+    partial = mmu_ace.MetadataCache(str(tmp_path), fast_hash=True)
+    full = mmu_ace.MetadataCache(str(tmp_path))
+    keys = (partial.get_key(str(path)), full.get_key(str(path)), partial.get_key(str(path), check_objects=True))
+
+    with open(path, "r+b") as file:
+        file.seek(sample_size + 10)
+        file.write(b"x")
+
+    assert partial.get_key(str(path)) == keys[0]
+    assert full.get_key(str(path)) != keys[1]
+    assert len(set(keys)) == 3
@@ -0,0 +1,113 @@
+import copy
+import importlib.util
+import sys
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+MmuAceController = mmu_ace.MmuAceController
+MmuAce = mmu_ace.MmuAce
+
+FILAMENT_HUB = {
+    "enabled": True,
+    "action": "Idle",
+    "current_filament": { "id": 0, "index": 0, "tool": 0, "type": "PLA", "status": "ready" },
+    "filament_hubs": [
+        {
+            "id": 0,
+            "status": "ready",
+            "temp": 25,
+            "dryer_status": { "status": "stop" },
+            "slots": [
+                { "index": 0, "status": "ready", "type": "PLA", "color": [255, 0, 0] },
+                { "index": 1, "status": "ready", "type": "PETG", "color": [0, 255, 0] },
+                { "index": 2, "status": "empty", "type": "ABS" },
+            ]
+        },
+    ]
+}
+
+
+class StubServer:
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+
+    def send_event(self, name: str, payload: dict):
+        self.events.append((name, payload))
+
+
+def _build_controller() -> MmuAceController:
+    controller = object.__new__(MmuAceController)
+    controller.server = StubServer()
+    controller.ace = MmuAce()
+    controller._set_ace_status(copy.deepcopy(FILAMENT_HUB))
+    return controller
+
+
+def test_identical_payload_emits_nothing():
+    controller = _build_controller()
+    gates = list(controller.ace.units[0].gates)
+
+    controller._set_ace_status(copy.deepcopy(FILAMENT_HUB))
+
+    assert len(controller.server.events) == 1
+    assert controller.ace.units[0].gates == gates
+
+
+def test_telemetry_only_changes_update_in_place_without_event():
+    controller = _build_controller()
+    unit = controller.ace.units[0]
+    gates = list(unit.gates)
+
+    filament_hub = copy.deepcopy(FILAMENT_HUB)
+    filament_hub["filament_hubs"][0]["temp"] = 45
+    filament_hub["filament_hubs"][0]["dryer_status"] = { "status": "drying", "remain_time": 120 }
+    controller._set_ace_status(filament_hub)
+
+    assert len(controller.server.events) == 1
+    assert controller.ace.units[0] is unit
+    assert unit.temp == 45
+    assert unit.dryer == { "status": "drying", "remain_time": 120 }
+    assert unit.gates == gates
+
+
+def test_changed_slot_is_the_only_one_rebuilt():
+    controller = _build_controller()
+    controller.update_ttg_map([1, 0, 2])
+    gates = list(controller.ace.units[0].gates)
+
+    filament_hub = copy.deepcopy(FILAMENT_HUB)
+    filament_hub["filament_hubs"][0]["slots"][2] = { "index": 2, "status": "ready", "type": "TPU", "color": [0, 0, 255] }
+    controller._set_ace_status(filament_hub)
+
+    unit = controller.ace.units[0]
+    assert unit.gates[0] is gates[0]
+    assert unit.gates[1] is gates[1]
+    assert unit.gates[2] is not gates[2]
+    assert controller.ace.ttg_map == [1, 0, 2]
+    assert controller.ace.tools[2].material == "TPU"
+
+    name, payload = controller.server.events[-1]
+    assert payload["mmu"]["gate_material"] == ["PLA", "PETG", "TPU"]
+    assert payload["mmu"]["gate_color"][2] == "0000FFFF"
+
+
+def test_layout_change_rebuilds_the_model():
+    controller = _build_controller()
+
+    filament_hub = copy.deepcopy(FILAMENT_HUB)
+    filament_hub["filament_hubs"].append({ "id": 1, "slots": [ { "index": 3, "status": "ready", "type": "PLA" } ] })
+    controller._set_ace_status(filament_hub)
+
+    assert [unit.id for unit in controller.ace.units] == [0, 1]
+    assert controller.ace.ttg_map == [0, 1, 2, 3]
+    assert controller.server.events[-1][1]["mmu"]["num_gates"] == 4
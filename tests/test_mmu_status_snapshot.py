@@ -0,0 +1,85 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+MmuAceController = mmu_ace.MmuAceController
+MmuAce = mmu_ace.MmuAce
+MmuAcePatcher = mmu_ace.MmuAcePatcher
+
+FILAMENT_HUB = {
+    "enabled": True,
+    "print_state": "printing",
+    "current_filament": { "id": 0, "index": 1, "tool": 1, "type": "PLA", "name": "Red PLA", "status": "ready" },
+    "filament_hubs": [
+        {
+            "id": 0,
+            "status": "ready",
+            "temp": 25,
+            "dryer_status": { "status": "stop" },
+            "slots": [
+                { "index": 0, "status": "ready", "type": "PLA", "color": [255, 0, 0] },
+                { "index": 1, "status": "empty", "type": "PETG", "color": [0, 255, 0], "rfid": 2 },
+            ]
+        },
+        {
+            "id": 1,
+            "status": "ready",
+            "slots": [
+                { "index": 2, "status": "buffer", "type": "ABS" },
+            ]
+        },
+    ]
+}
+
+
+class StubServer:
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+
+    def send_event(self, name: str, payload: dict):
+        self.events.append((name, payload))
+
+
+def _build_controller() -> MmuAceController:
+    controller = object.__new__(MmuAceController)
+    controller.server = StubServer()
+    controller.ace = MmuAce()
+    controller._set_ace_status(FILAMENT_HUB)
+    return controller
+
+
+def test_snapshot_matches_dataclass_status():
+    controller = _build_controller()
+
+    assert controller.get_status_snapshot() == controller.get_status().to_dict()
+    assert controller.server.events[-1] == ("mmu_ace:status_update", { "seq": 1, **controller.get_status_snapshot() })
+
+
+def test_snapshot_is_reused_until_state_changes():
+    controller = _build_controller()
+    patcher = object.__new__(MmuAcePatcher)
+    patcher.ace_controller = controller
+
+    first = patcher.patch_status({ "extruder": {} })
+    second = patcher.patch_status({ "extruder": {} })
+    assert first["mmu"] is second["mmu"]
+    assert first["mmu_machine"] is second["mmu_machine"]
+
+    controller.update_ttg_map([1, 0, 2])
+
+    third = patcher.patch_status({})
+    assert third["mmu"] is not first["mmu"]
+    assert third["mmu"]["ttg_map"] == [1, 0, 2]
+    assert first["mmu"]["ttg_map"] == [0, 1, 2]
+    assert third["mmu_machine"]["unit_0"] is first["mmu_machine"]["unit_0"]
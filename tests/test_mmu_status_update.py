@@ -0,0 +1,141 @@
+import asyncio
+import importlib.util
+import sys
+from pathlib import Path
+
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "files/4-apps/home/rinkhals/apps/40-moonraker/mmu_ace.py"
+
+spec = importlib.util.spec_from_file_location("mmu_ace_module", MODULE_PATH)
+mmu_ace = importlib.util.module_from_spec(spec)
+mmu_ace.TOOL_GATE_UNKNOWN = -1
+sys.modules[spec.name] = mmu_ace
+assert spec.loader is not None
+spec.loader.exec_module(mmu_ace)
+
+
+MmuAceController = mmu_ace.MmuAceController
+MmuAce = mmu_ace.MmuAce
+MmuAcePatcher = mmu_ace.MmuAcePatcher
+
+
+class StubPrinter:
+    def __init__(self):
+        self.requests: list[tuple[str, dict]] = []
+
+    async def send_request(self, method: str, params: dict):
+        self.requests.append((method, params))
+        await asyncio.sleep(0)
+        return "ok"
+
+
+class StubServer:
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+
+    def send_event(self, name: str, payload: dict):
+        self.events.append((name, payload))
+
+
+def _build_controller(window: float = 0.0) -> MmuAceController:
+    controller = object.__new__(MmuAceController)
+    controller.printer = StubPrinter()
+    controller.server = StubServer()
+    controller.status_update_window = window
+    controller.ace = MmuAce()
+    controller._set_ace_status({
+        "filament_hubs": [ { "id": 0, "slots": [ { "index": i, "status": "ready", "type": "PLA" } for i in range(4) ] } ]
+    })
+    controller.server.events.clear()
+    return controller
+
+
+def test_updates_within_a_tick_are_coalesced():
+    controller = _build_controller()
+
+    async def update():
+        controller.update_ttg_map([1, 0, 2, 3])
+        controller.update_ttg_map([2, 0, 1, 3])
+        controller.update_ttg_map([3, 0, 1, 2])
+        assert controller.server.events == []
+        await asyncio.sleep(0)
+
+    asyncio.run(update())
+
+    assert len(controller.server.events) == 1
+    assert controller.server.events[0][1]["mmu"]["ttg_map"] == [3, 0, 1, 2]
+
+
+def test_updates_within_the_window_are_coalesced():
+    controller = _build_controller(window=0.05)
+
+    async def update():
+        controller.update_ttg_map([1, 0, 2, 3])
+        await asyncio.sleep(0.01)
+        controller.update_ttg_map([2, 0, 1, 3])
+        await asyncio.sleep(0.01)
+        assert controller.server.events == []
+        await asyncio.sleep(0.06)
+
+    asyncio.run(update())
+
+    assert len(controller.server.events) == 1
+
+
+def test_tool_change_is_sent_immediately():
+    controller = _build_controller(window=10)
+
+    async def update():
+        controller.update_ttg_map([1, 0, 2, 3])
+        await controller.select_tool(tool=1, gate=0, unit=0)
+        return list(controller.server.events)
+
+    events = asyncio.run(update())
+
+    assert len(events) == 1
+    assert events[0][1]["mmu"]["tool"] == 1
+    assert events[0][1]["mmu"]["ttg_map"] == [1, 0, 2, 3]
+
+
+def test_gate_map_sends_a_single_update():
+    controller = _build_controller()
+    patcher = object.__new__(MmuAcePatcher)
+    patcher.ace_controller = controller
+
+    gate_map = {
+        i: { "status": 1, "name": f"Spool {i}", "material": "PETG", "color": "FF0000", "temp": 240, "spool_id": i, "speed_override": 100 }
+        for i in range(4)
+    }
+    asyncio.run(patcher._on_gcode_mmu_gate_map({ "MAP": repr(gate_map) }, None))
+
+    assert len(controller.printer.requests) == 4
+    assert len(controller.server.events) == 1
+    assert controller.server.events[0][1]["mmu"]["gate_material"] == ["PETG"] * 4
+
+
+def test_updates_only_carry_changed_fields():
+    controller = _build_controller()
+    controller.update_ttg_map([1, 0, 2, 3])
+    controller.update_ttg_map([1, 0, 2, 3])
+    controller.update_ttg_map([0, 1, 2, 3])
+
+    assert len(controller.server.events) == 2
+
+    name, payload = controller.server.events[0]
+    assert payload["mmu"] == { "ttg_map": [1, 0, 2, 3] }
+    assert "mmu_machine" not in payload
+    assert controller.server.events[1][1]["seq"] == payload["seq"] + 1
+
+
+def test_resync_returns_the_snapshot_of_the_last_update():
+    controller = _build_controller(window=10)
+
+    async def update():
+        controller.update_ttg_map([1, 0, 2, 3])
+        return controller.get_published_status()
+
+    seq, status = asyncio.run(update())
+
+    assert seq == controller.server.events[-1][1]["seq"]
+    assert status == controller.get_status_snapshot()
+    assert status["mmu"]["ttg_map"] == [1, 0, 2, 3]